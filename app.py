@@ -1,4 +1,5 @@
 from backend import create_app
+from backend.database import init_db
 import os
 from dotenv import load_dotenv
 
@@ -7,6 +8,21 @@ load_dotenv()
 app = create_app() # ファクトリ関数を呼び出してアプリケーションインスタンスを取得
 
 if __name__ == '__main__':
+    # SERVER_MODE=production の場合は Gunicorn（設定は gunicorn.conf.py と環境変数）で起動する
+    # それ以外は従来どおり Flask の開発サーバー
+    if os.environ.get('SERVER_MODE') == 'production':
+        os.execvp('gunicorn', ['gunicorn', '-c', 'gunicorn.conf.py', 'app:app']) # スキーマの更新は gunicorn.conf.py の on_starting
+
+    # 起動前にスキーマを最新にする（uvicorn の複数ワーカーや開発サーバーの再起動ごとではなく、ここで1度だけ）
+    init_db()
+    # SERVER_MODE=async の場合は uvicorn（ASGI）で非同期モードのアプリ (asgi.py) を起動する
+    if os.environ.get('SERVER_MODE') == 'async':
+        os.execvp('uvicorn', [
+            'uvicorn', 'asgi:app', '--host', '0.0.0.0', '--port', os.environ.get('PORT', '5000'),
+            '--workers', os.environ.get('WEB_CONCURRENCY', '1'),
+            *([] if os.environ.get('UVICORN_ACCESSLOG', 'True') == 'True' else ['--no-access-log']),
+        ])
+
     # app.run(debug=True)
     debug_mode = os.environ.get('FLASK_ENV') == 'True'
     app.run(debug=debug_mode, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)))
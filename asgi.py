@@ -0,0 +1,7 @@
+from backend.asgi import create_asgi_app
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 非同期モード: uvicorn asgi:app で起動する（詳細は backend/asgi.py）
+app = create_asgi_app()
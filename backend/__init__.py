@@ -2,23 +2,38 @@
 # そのリクエスト専用の g が用意される。リクエスト処理中は、その g を通じて情報を共有できる。
 # リクエスト処理が終了すると、g も破棄される。
 from flask import Flask, g
-from .database import SessionLocal, init_db as original_init_db # init_dbをリネームして衝突を避ける
+from .database import SessionLocal, ReadSessionLocal, init_db as original_init_db # init_dbをリネームして衝突を避ける
 from .routes import register_routes
 from backend.config import configure_app
+from .faults import init_fault_injection
+from .serialization import FastJSONProvider
+from .startup import StartupProfile
+from .replicas import read_your_writes
+from .bulk import FORMATS, DEFAULT_BATCH_SIZE, detect_format, iter_records, import_items, export_items, open_image_source
+import click
+import os
 
 
 
 def create_app(config_object=None): # 設定オブジェクトを受け取れるようにするとより柔軟
+    profile = StartupProfile() # 各段階の時間を記録する（flask profile-startup で表示する）
     # Flaskは、__name__ から得られるモジュール名を手がかりに、そのモジュールがファイルシステム上のどこに存在するか
     # つまり、そのモジュールのパスを特定しようとします
     # ルートパスを基準に、templates フォルダや static フォルダを探します。
+    # static フォルダ (backend/static) は Flask 標準の static ルートではなく static_files.py で配信する
+    # （標準のルートは '/<path:filename>' になり、Vue Router 用の catch_all より先に全パスを奪ってしまうため）
     app = Flask(
         __name__.split('.')[0],
-        static_url_path='/'  
+        static_folder=None
     )
+    app.extensions['startup_profile'] = profile
+    profile.mark('flask')
 
     configure_app(app) # 自前で作ったconfigure関数(config.pyも自前で作った)
 
+    # jsonify などで使う JSON プロバイダを差し替える（orjson があれば使う）
+    app.json = FastJSONProvider(app)
+
     # 設定をロードする場合（例）
     # if config_object:
     #     app.config.from_object(config_object)
@@ -34,11 +49,19 @@ def create_app(config_object=None): # 設定オブジェクトを受け取れる
             g.db_session = SessionLocal()
         return g.db_session
 
+    def get_read_db():
+        """リクエストスコープでの読み込み専用セッション取得（参照系のエンドポイント用）"""
+        if 'read_db_session' not in g:
+            # 読み込みはレプリカに送る。直前に書き込みをしたクライアントはプライマリから読む (replicas.py)
+            g.read_db_session = ReadSessionLocal(info={'primary': read_your_writes.prefer_primary()})
+        return g.read_db_session
+
     def close_db(error):
         """リクエスト終了時のセッションクリーンアップ"""
-        db_session = g.pop('db_session', None)
-        if db_session is not None: # ここでNoneチェックを追加！
-            db_session.close()
+        for key in ('db_session', 'read_db_session'):
+            db_session = g.pop(key, None)
+            if db_session is not None: # ここでNoneチェックを追加！
+                db_session.close()
         # db_session.close()
 
     # アプリケーションコンテキストが終了する際にDBセッションをクローズする
@@ -54,7 +77,216 @@ def create_app(config_object=None): # 設定オブジェクトを受け取れる
         original_init_db() # database.pyのinit_dbを呼び出す
         print("Initialized the database.") # ユーザーへのフィードバック
 
+    # 保存期間を過ぎた問い合わせメッセージを月ごとの圧縮 NDJSON に移して削除するコマンド（cron などで定期的に実行する）
+    @app.cli.command('archive-messages')
+    @click.option('--older-than', 'days', type=int, help='この日数より前のメッセージを移す（省略時は MESSAGE_RETENTION_DAYS）')
+    @click.option('--before', type=click.DateTime(formats=['%Y-%m-%d']), help='この日付 (UTC) より前のメッセージを移す')
+    @click.option('--batch-size', type=int, help='1トランザクションで移す件数（省略時は MESSAGE_ARCHIVE_BATCH_SIZE）')
+    @click.option('--vacuum/--no-vacuum', default=True, help='移した後に空いたページを解放する')
+    def archive_messages_command(days, before, batch_size, vacuum):
+        from datetime import datetime, timedelta, timezone
+        from .database import engine
+        from .retention import ArchiveError, archive_messages, incremental_vacuum, database_size
+
+        if before is None:
+            days = app.config['MESSAGE_RETENTION_DAYS'] if days is None else days
+            before = datetime.now(timezone.utc) - timedelta(days=days)
+        directory = app.config['MESSAGE_ARCHIVE_DIR']
+        db = SessionLocal()
+        try:
+            result = archive_messages(db, directory, before, batch_size or app.config['MESSAGE_ARCHIVE_BATCH_SIZE'],
+                                      app.config['MESSAGE_ARCHIVE_COMPRESSION'])
+        except ArchiveError as e:
+            raise click.ClickException(str(e))
+        finally:
+            db.close()
+
+        for name, count in sorted(result.partitions.items()):
+            print(f"  {name}: +{count}")
+        print(f"Archived {result.archived} message(s) created before {before:%Y-%m-%d %H:%M} UTC "
+              f"into {directory} ({result.bytes_written} bytes).")
+        if vacuum and result.archived:
+            freed = incremental_vacuum(engine)
+            size = database_size(engine)
+            if size is not None:
+                print(f"Freed {freed} page(s); the database is now {size[0]} bytes.")
+
+    # アーカイブしたメッセージを検索して NDJSON で標準出力に書き出すコマンド
+    @app.cli.command('query-message-archive')
+    @click.option('--since', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S']), help='この日時 (UTC) 以降')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S']), help='この日時 (UTC) より前')
+    @click.option('--username', help='ユーザー名の完全一致')
+    @click.option('--email', help='メールアドレスの完全一致')
+    @click.option('--contains', help='本文に含まれる文字列')
+    @click.option('--limit', type=int, help='出力する最大件数')
+    def query_message_archive_command(since, until, username, email, contains, limit):
+        import itertools
+        import json
+        from .retention import ArchiveError, iter_archived_messages
+
+        records = iter_archived_messages(app.config['MESSAGE_ARCHIVE_DIR'], since, until, username, email, contains)
+        try:
+            for record in itertools.islice(records, limit):
+                click.echo(json.dumps(record, ensure_ascii=False))
+        except ArchiveError as e:
+            raise click.ClickException(str(e))
+
+    # SQLite の空きページを少しずつ解放してファイルを小さくするコマンド（初回は auto_vacuum=INCREMENTAL に切り替える）
+    @app.cli.command('vacuum-db')
+    @click.option('--max-pages', type=int, help='解放する最大ページ数（省略時はすべて）')
+    def vacuum_db_command(max_pages):
+        from .database import engine
+        from .retention import ensure_incremental_vacuum, incremental_vacuum, database_size
+
+        before = database_size(engine)
+        if before is None:
+            raise click.ClickException("vacuum-db only supports SQLite databases.")
+        if ensure_incremental_vacuum(engine):
+            print("Enabled incremental vacuum (auto_vacuum=INCREMENTAL).")
+        freed = incremental_vacuum(engine, max_pages=max_pages)
+        after = database_size(engine)
+        print(f"Freed {freed} page(s): {before[0]} -> {after[0]} bytes ({after[1]} bytes still free).")
+
+
+    # 静的ファイルの .gz / .br を事前に作成するコマンド（ビルド時に実行する）
+    @app.cli.command('precompress-static')
+    def precompress_static_command():
+        from .static_files import static_files, precompress
+        count = precompress(static_files.directory)
+        print(f"Wrote {count} precompressed file(s).")
+
+    # 既存のアップロードファイルをコンテンツアドレス方式（ハッシュ名）に移行するコマンド
+    @app.cli.command('migrate-uploads')
+    def migrate_uploads_command():
+        from .config import blob_store
+        from .images import image_pipeline, URL_PLACEHOLDER
+        from .models import Item
+
+        db = SessionLocal()
+        try:
+            migrated = blob_store.backfill(db)
+            # 移行したアイテムの縮小版をハッシュ名で作り直す
+            if app.config['IMAGE_PIPELINE'] != 'off':
+                for item in db.query(Item).filter(Item.id.in_(migrated), Item.image_url.is_not(None)):
+                    url_template = item.image_url[:-len(item.image_filename)] + URL_PLACEHOLDER
+                    image_pipeline.process(app, item.id, item.image_filename, url_template, background=False)
+        finally:
+            db.close()
+        print(f"Migrated {len(migrated)} item image(s).")
+
+    # NDJSON / CSV からアイテムを一括登録するコマンド（画像はディレクトリか ZIP から読み込む）
+    @app.cli.command('import-items')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='省略時は拡張子から判断する')
+    @click.option('--images', type=click.Path(exists=True), help='画像のディレクトリまたは ZIP ファイル')
+    @click.option('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, show_default=True)
+    @click.option('--base-url', default='http://localhost:5000', show_default=True, help='image_url の組み立てに使う URL')
+    @click.option('--variants/--no-variants', default=True, help='画像の縮小版を生成する')
+    def import_items_command(path, fmt, images, batch_size, base_url, variants):
+        from .config import photos, blob_store
+        from .images import image_pipeline, URL_PLACEHOLDER
+        from .cache import response_cache
+
+        with app.test_request_context(base_url=base_url):
+            url_template = photos.url(URL_PLACEHOLDER)
+
+        image_source = open_image_source(images) if images else None
+        db = SessionLocal()
+        try:
+            with open(path, 'rb') as f:
+                result = import_items(db, iter_records(f, detect_format(path, explicit=fmt)), blob_store,
+                                      image_source, url_template, batch_size)
+        finally:
+            db.close()
+            if image_source is not None:
+                image_source.close()
+            response_cache.invalidate()
+
+        for error in result.to_dict()['errors']:
+            print(f"line {error['line']}: {error['error']}")
+        if result.failed > len(result.errors):
+            print(f"... and {result.failed - len(result.errors)} more error(s)")
+        print(f"Imported {result.inserted} item(s), {result.failed} failed.")
+
+        if variants and app.config['IMAGE_PIPELINE'] != 'off':
+            for item_id, filename in result.images:
+                image_pipeline.process(app, item_id, filename, url_template, background=False)
+
+    # 全アイテムを NDJSON / CSV に書き出すコマンド（PATH に - を指定すると標準出力）
+    @app.cli.command('export-items')
+    @click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='省略時は拡張子から判断する')
+    def export_items_command(path, fmt):
+        fmt = fmt or ('ndjson' if path == '-' else detect_format(path))
+        db = ReadSessionLocal()
+        try:
+            with click.open_file(path, 'wb') as f:
+                for chunk in export_items(db, fmt):
+                    f.write(chunk)
+        finally:
+            db.close()
+
+    # ファセットの集計テーブルを items から作り直すコマンド（SQL で直接データを投入した後などに実行する）
+    @app.cli.command('rebuild-facets')
+    def rebuild_facets_command():
+        from .facets import rebuild_facet_counts
+        from .cache import response_cache
+
+        db = SessionLocal()
+        try:
+            rebuild_facet_counts(db)
+        finally:
+            db.close()
+        response_cache.invalidate()
+        print("Rebuilt the facet counts.")
+
+    # DATABASE_REPLICA_URLS の SQLite ファイルにプライマリの内容をコピーするコマンド（ローカルでのレプリカの代用）
+    @app.cli.command('sync-replicas')
+    def sync_replicas_command():
+        from .replicas import sync_sqlite_replicas
+        try:
+            copied = sync_sqlite_replicas()
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        print(f"Synchronized {copied} replica(s).")
+
+    # 起動から最初のリクエストまでの時間（import / create_app の各段階 / 最初のリクエスト）を表示するコマンド
+    # --budget-ms を超えた場合は終了コード 1 で終わるので、CI で起動時間の悪化を検出できる
+    @app.cli.command('profile-startup')
+    @click.option('--path', default='/api/items?limit=20', show_default=True, help='最初に送るリクエスト')
+    @click.option('--lazy/--eager', default=None, help='LAZY_INIT を指定して計測する（省略時は両方）')
+    @click.option('--repeat', type=int, default=5, show_default=True)
+    @click.option('--top', type=int, default=15, show_default=True, help='import の内訳を表示する件数')
+    @click.option('--budget-ms', type=float, help='最初のリクエストまでの時間（中央値）の上限')
+    def profile_startup_command(path, lazy, repeat, top, budget_ms):
+        from .startup import profile_startup
+
+        root = os.path.dirname(app.root_path)
+        results = {}
+        for mode_lazy in ([lazy] if lazy is not None else [False, True]):
+            mode = 'lazy' if mode_lazy else 'eager'
+            r = results[mode] = profile_startup(root, path, mode_lazy, repeat)
+            print(f"[{mode}] GET {path} -> {r['status']}  modules={r['modules']}")
+            print(f"  import {r['import_ms']:.0f} ms + create_app {r['create_app_ms']:.0f} ms"
+                  f" + first request {r['first_request_ms']:.0f} ms = {r['total_ms']:.0f} ms")
+            print("  create_app: " + ', '.join(f"{name} {ms:.1f}" for name, ms in r['steps']))
+            print("  import (self time, ms):")
+            for name, ms in r['imports'].most_common(top):
+                print(f"    {name:<28} {ms:7.1f}")
+
+        if budget_ms is not None:
+            over = {mode: r['total_ms'] for mode, r in results.items() if r['total_ms'] > budget_ms}
+            if over:
+                raise click.ClickException(
+                    ', '.join(f"{mode} {ms:.0f} ms" for mode, ms in over.items()) + f" exceeds the budget of {budget_ms:.0f} ms"
+                )
+            print(f"Within the budget of {budget_ms:.0f} ms.")
+
+    register_routes(app, get_db, get_read_db)
+    profile.mark('routes')
 
-    register_routes(app, get_db)
+    # FAULT_INJECTION が設定されている場合のみ遅延・エラーを注入する
+    init_fault_injection(app)
+    profile.mark('fault_injection')
 
     return app
\ No newline at end of file
@@ -0,0 +1,219 @@
+import asyncio
+import inspect
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+from werkzeug.exceptions import HTTPException
+from . import database
+from .async_routes import register_async_routes, close_async_db
+from .faults import APPLIED_ENVIRON_KEY, fault_response
+from .metrics import metrics
+
+# 非同期モード: Flask アプリを ASGI サーバー（uvicorn など）で動かす
+#
+#   uvicorn asgi:app --host 0.0.0.0 --port 5000      （または SERVER_MODE=async python app.py）
+#
+# 非同期版があるビュー (async_routes.py) はイベントループ上で直接実行し、DB の応答を待つ間も他のリクエストを処理する。
+# それ以外の同期ビュー（管理者のアップロードなど）は、リクエスト本文をイベントループ上で受信し終えてから
+# スレッドプール (ASYNC_THREADS) で実行する。遅いクライアントが本文を送っている間はスレッドを使わない。
+#
+# 同期モード（Gunicorn などの WSGI サーバー）は従来どおり使える。その場合は非同期版のビューは登録されない。
+
+# これより大きいリクエスト本文はメモリではなく一時ファイルに受信する
+SPOOL_MAX_SIZE = 1024 * 1024
+
+
+def create_asgi_app():
+    """非同期モードのアプリケーション（ASGI）を作成する"""
+    from . import create_app
+
+    app = create_app()
+    register_async_routes(app)
+    if metrics.enabled:
+        for engine in {database.async_engine, database.async_read_engine, *database.async_replicas.values()}:
+            metrics.instrument_engine(engine.sync_engine)
+    return AsyncApp(app, app.config['ASYNC_THREADS'])
+
+
+class AsyncApp:
+    """Flask アプリを包む ASGI アプリケーション"""
+
+    def __init__(self, app, threads):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='wsgi')
+        # アップロードと一括インポートのどちらの上限も超える本文は受信せずに 413 を返す
+        self.max_body_size = max(app.config['MAX_CONTENT_LENGTH'] or 0, app.config['BULK_IMPORT_MAX_CONTENT_LENGTH'])
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return  # WebSocket などには対応しない
+
+        body = await self._receive_body(scope, receive, send)
+        if body is None:
+            return
+        with body:
+            environ = build_environ(scope, body)
+            view = self._async_view(environ)
+            if view is None:
+                await self._call_wsgi(environ, send)
+            else:
+                await self._call_async_view(view, environ, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=True)
+                await database.dispose_async_engines()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _receive_body(self, scope, receive, send):
+        body = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body_size:
+                body.close()
+                await _send_simple(send, 413, b'{"error":"Request body is too large."}')
+                return None
+            body.write(chunk)
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        return body
+
+    def _async_view(self, environ):
+        """非同期版のビューがあるエンドポイントならそのビュー関数を返す"""
+        try:
+            endpoint, _ = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None  # 404 / 405 などは同期側 (Flask) の処理に任せる
+        view = self.app.view_functions.get(endpoint)
+        return view if inspect.iscoroutinefunction(view) else None
+
+    async def _call_async_view(self, view, environ, send):
+        app = self.app
+        handle = metrics.begin(environ)
+        endpoint, status = 'unmatched', 500
+        try:
+            with app.request_context(environ) as ctx:
+                endpoint = ctx.request.endpoint
+                try:
+                    try:
+                        rv = await self._inject_fault(environ)
+                        if rv is None:
+                            rv = app.preprocess_request()
+                        if rv is None:
+                            rv = await view(**ctx.request.view_args)
+                    except Exception as e:
+                        rv = app.handle_user_exception(e)
+                    response = app.finalize_request(rv)
+                except Exception as e:
+                    response = app.handle_exception(e)
+                finally:
+                    await close_async_db()
+
+                status = response.status_code
+                await send({'type': 'http.response.start', 'status': status,
+                            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                        for k, v in response.headers.items()]})
+                for chunk in response.iter_encoded():
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            metrics.end(handle, endpoint, environ['REQUEST_METHOD'], str(status))
+
+    async def _inject_fault(self, environ):
+        # faults.py の before_request フックは time.sleep で待つため、イベントループを止めないようにここで注入する
+        injector = self.app.extensions.get('fault_injection')
+        if injector is None:
+            return None
+        environ[APPLIED_ENVIRON_KEY] = True
+        delay, error_status = injector.pick(environ['PATH_INFO'], environ['REQUEST_METHOD'])
+        if delay:
+            await asyncio.sleep(delay)
+        return fault_response(error_status) if error_status else None
+
+    async def _call_wsgi(self, environ, send):
+        """同期ビューをスレッドプールで実行し、レスポンスをイベントループから送る"""
+        loop = asyncio.get_running_loop()
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                if exc_info and started:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                started[:] = [{
+                    'type': 'http.response.start',
+                    'status': int(status.split(' ', 1)[0]),
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+                }]
+
+            result = self.app(environ, start_response)
+            try:
+                for chunk in result:
+                    if started and chunk:
+                        send_from_thread(started.pop())  # 最初の本文と一緒にヘッダーを送る
+                    if chunk:
+                        send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                if started:
+                    send_from_thread(started.pop())
+                send_from_thread({'type': 'http.response.body', 'body': b''})
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        await loop.run_in_executor(self.executor, run)
+
+
+def build_environ(scope, body):
+    """ASGI の scope から WSGI の environ を作る"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+    for name, value in scope['headers']:
+        name = name.decode('latin-1').upper().replace('-', '_')
+        key = name if name in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{name}'
+        value = value.decode('latin-1')
+        if key in environ:
+            environ[key] += ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        else:
+            environ[key] = value
+    return environ
+
+
+async def _send_simple(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
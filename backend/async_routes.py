@@ -0,0 +1,206 @@
+from flask import g, jsonify, request, current_app
+from sqlalchemy import desc, select
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
+from . import database, facets
+from .cache import response_cache
+from .message_queue import message_writer
+from .models import Item, Message
+from .replicas import read_your_writes
+from .pagination import PaginationError, parse_limit, parse_fields, parse_format, fetch_item_page, fetch_items_by_id
+from .routes import (
+    is_batch_request, parse_batch_args, lookup_cached_items, item_batch_response,
+    is_paginated_request, item_page_response, item_response, parse_browse_args, wants_facets, browse_response,
+    parse_message_request, enqueue_message,
+)
+from .search import search_items as search_catalog
+from .serialization import ITEM_SERIALIZER, raw_json_response
+
+# 非同期モード (asgi.py) で使う、参照系とメッセージ投稿の非同期版ビュー
+#
+# URL とエンドポイント名は routes.py の同期版と同じで、register_async_routes() がビュー関数だけを差し替える。
+# クエリの組み立ては同期版の関数 (fetch_item_page など) をそのまま AsyncSession.run_sync() で実行し、
+# DB の応答を待つ間はイベントループが他のリクエストを処理する。
+
+
+def get_async_db():
+    """リクエストスコープでの非同期セッション取得（asgi.py がリクエスト終了時に閉じる）"""
+    if 'async_db_session' not in g:
+        g.async_db_session = database.AsyncSessionLocal()
+    return g.async_db_session
+
+
+def get_async_read_db():
+    """リクエストスコープでの読み込み専用の非同期セッション取得（参照系のエンドポイント用）
+
+    同期版と同じく replica_pool のレプリカから読み、書き込み直後はプライマリから読む。
+    """
+    if 'async_read_db_session' not in g:
+        g.async_read_db_session = database.async_read_session(primary=read_your_writes.prefer_primary())
+    return g.async_read_db_session
+
+
+async def close_async_db():
+    for key in ('async_db_session', 'async_read_db_session'):
+        session = g.pop(key, None)
+        if session is not None:
+            await session.close()
+
+
+@response_cache.cached
+async def get_items():
+    try:
+        db = get_async_read_db()
+
+        if is_batch_request():
+            ids, fields = parse_batch_args()
+            prefix, cached = lookup_cached_items(ids, fields)
+            misses = [i for i in ids if i not in cached]
+            rows = await db.run_sync(fetch_items_by_id, misses, fields) if misses else {}
+            return item_batch_response(ids, fields, prefix, cached, rows)
+
+        if is_paginated_request():
+            limit = parse_limit(request.args.get('limit'))
+            fields = parse_fields(request.args.get('fields'))
+            output_format = parse_format(request.args.get('format'))
+            rows, next_cursor = await db.run_sync(fetch_item_page, limit, request.args.get('cursor'), fields)
+            return item_page_response(rows, next_cursor, fields, output_format)
+
+        rows = (await db.execute(select(*ITEM_SERIALIZER.columns).order_by(desc(Item.updated_at)))).all()
+        return raw_json_response(ITEM_SERIALIZER.encode(rows))
+
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error retrieving items: {e}", exc_info=True)
+        return jsonify({'error': 'A database error occurred. Please try again later.'}), 500
+
+    except Exception as e:
+        current_app.logger.error(f"An unexpected error occurred while retrieving items: {e}", exc_info=True)
+        return jsonify({"error": "An unexpected server error occurred."}), 500
+
+
+@response_cache.cached
+async def search_items():
+    try:
+        query = request.args.get('q', '').strip()
+
+        if not query:
+            return jsonify({'error': 'Query parameter "q" is required.'}), 400
+
+        limit = parse_limit(request.args.get('limit')) if 'limit' in request.args else None
+
+        db = get_async_read_db()
+        rows = await db.run_sync(search_catalog, query, limit, columns=ITEM_SERIALIZER.columns)
+        return raw_json_response(ITEM_SERIALIZER.encode(rows))
+
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error during search: {e}", exc_info=True)
+        return jsonify({'error': 'A database error occurred during search.'}), 500
+
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error during search: {e}", exc_info=True)
+        return jsonify({"error": "An unexpected server error occurred during search."}), 500
+
+
+@response_cache.cached
+async def browse_items():
+    try:
+        args = parse_browse_args()
+        serializer = ITEM_SERIALIZER.subset(parse_fields(request.args.get('fields')))
+
+        db = get_async_read_db()
+        rows, next_cursor = await db.run_sync(
+            lambda session: facets.browse_items(session, serializer.columns, **args)
+        )
+        facet_result = None
+        if wants_facets():
+            facet_result = await db.run_sync(
+                facets.facet_counts, args['categories'], args['min_price'], args['max_price']
+            )
+        return browse_response(rows, next_cursor, serializer, facet_result)
+
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error during browse: {e}", exc_info=True)
+        return jsonify({'error': 'A database error occurred. Please try again later.'}), 500
+
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error during browse: {e}", exc_info=True)
+        return jsonify({"error": "An unexpected server error occurred."}), 500
+
+
+@response_cache.cached
+async def get_item(item_id: int):
+    try:
+        db = get_async_read_db()
+        item = await db.get(Item, item_id)
+        if item is None:
+            return jsonify({"error": "Item not found"}), 404
+        return item_response(item)
+
+    except SQLAlchemyError as e:
+        current_app.logger.error(f"Database error retrieving the item: {e}", exc_info=True)
+        return jsonify({'error': 'A database error occurred. Please try again later.'}), 500
+
+    except Exception as e:
+        current_app.logger.error(f"An unexpected error occurred while retrieving the item: {e}", exc_info=True)
+        return jsonify({"error": "An unexpected server error occurred."}), 500
+
+
+async def save_message():
+    validated_data, client_id, error = parse_message_request()
+    if error:
+        return error
+
+    if message_writer.enabled:
+        return enqueue_message(validated_data, client_id)
+
+    db = get_async_db()
+    try:
+        new_message = Message(
+            username=validated_data.username,
+            email=validated_data.email,
+            message=validated_data.message,
+            client_id=client_id,
+        )
+        db.add(new_message)
+        await db.commit()
+        await db.refresh(new_message)
+        return jsonify(new_message.to_dict()), 201
+
+    except IntegrityError: # 同じ client_id のメッセージが既に登録されている（再送）
+        await db.rollback()
+        return jsonify({'error': 'A message with this client_id already exists.'}), 409
+
+    except SQLAlchemyError as e:
+        await db.rollback()
+        current_app.logger.error(f"Database error saving message: {e}", exc_info=True)
+        return jsonify({'error': 'A database error occurred.'}), 500
+
+    except Exception as e:
+        await db.rollback()
+        current_app.logger.error(f"Unexpected error saving message: {e}", exc_info=True)
+        return jsonify({'error': 'An unexpected error occurred.'}), 500
+
+
+# 差し替えるエンドポイント名 -> 非同期版のビュー
+ASYNC_VIEWS = {
+    'get_items': get_items,
+    'search_items': search_items,
+    'browse_items': browse_items,
+    'get_item': get_item,
+    'save_message': save_message,
+}
+
+
+def register_async_routes(app):
+    """routes.py で登録したビューのうち、ASYNC_VIEWS のものを非同期版に差し替える"""
+    database.init_async_engines()
+    for endpoint, view in ASYNC_VIEWS.items():
+        app.view_functions[endpoint] = view
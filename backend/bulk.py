@@ -0,0 +1,306 @@
+import codecs
+import csv
+import io
+import json
+import os
+import zipfile
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import FileStorage
+from werkzeug.utils import safe_join
+from .models import Item
+from .serialization import RowSerializer
+from .storage import BLOB_NAME_RE, BlobMissingError
+from .images import URL_PLACEHOLDER
+from .facets import record_changes
+
+# アイテムの一括インポート / エクスポート
+#
+# インポートは NDJSON（1行1オブジェクト）か CSV（1行目がヘッダー）を1行ずつ読み、
+# batch_size 行ごとに ItemCreate で検証してから1トランザクションでまとめて INSERT する。
+# 行ごとのエラーは行番号付きで返し、エラーの行があっても他の行は取り込む。
+#
+# 画像は "image" 列にファイル名を書き、ローカルのディレクトリか ZIP アーカイブから読み込む。
+# 画像の指定が無い場合でも、エクスポートしたファイルのように保存済みのハッシュ名のファイルを指していればそれを使う。
+
+FORMATS = ('ndjson', 'csv')
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 100  # レスポンスに含めるエラーの最大件数（件数自体はすべて数える）
+
+# エクスポートする列。"image" 列はそのままインポートに使える
+EXPORT_SERIALIZER = RowSerializer([
+    ('id', Item.id, None),
+    ('name', Item.name, None),
+    ('description', Item.description, None),
+    ('category', Item.category, None),
+    ('price', Item.price, None),
+    ('image', Item.image_filename, None),
+    ('image_url', Item.image_url, None),
+    ('created_at', Item.created_at, None),
+    ('updated_at', Item.updated_at, None),
+])
+
+
+class BulkError(ValueError):
+    """ファイル形式や画像の指定が不正な場合のエラー"""
+
+
+def detect_format(filename=None, mimetype=None, explicit=None):
+    """format の指定 / ファイルの拡張子 / Content-Type から形式を決める"""
+    if explicit:
+        if explicit not in FORMATS:
+            raise BulkError(f'"format" must be one of: {", ".join(FORMATS)}')
+        return explicit
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.ndjson', '.jsonl') or mimetype in ('application/x-ndjson', 'application/jsonl'):
+        return 'ndjson'
+    if ext == '.csv' or mimetype == 'text/csv':
+        return 'csv'
+    raise BulkError('Cannot detect the file format; use a .ndjson / .csv file or specify "format".')
+
+
+def iter_records(stream, fmt):
+    """バイナリストリームを1行ずつ読み、(行番号, 辞書 or エラーメッセージ) を返す"""
+    if fmt == 'ndjson':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(record, dict):
+                yield line_no, 'Each line must be a JSON object.'
+                continue
+            yield line_no, record
+        return
+
+    # CSV: 1行目がヘッダー。空欄は未指定 (None) として扱う
+    text = codecs.getreader('utf-8-sig')(stream)
+    reader = csv.DictReader(text)
+    for record in reader:
+        yield reader.line_num, {key: (value if value != '' else None) for key, value in record.items() if key}
+
+
+class DirectoryImages:
+    """ローカルディレクトリ内の画像（ディレクトリの外は参照できない）"""
+
+    def __init__(self, path):
+        if not os.path.isdir(path):
+            raise BulkError(f'{path} is not a directory.')
+        self.path = path
+
+    def open(self, name):
+        path = safe_join(self.path, name)
+        if path is None or not os.path.isfile(path):
+            raise LookupError(f'{name} was not found in {self.path}')
+        return open(path, 'rb')
+
+    def close(self):
+        pass
+
+
+class ZipImages:
+    """ZIP アーカイブ内の画像（パスが一致しなければファイル名だけで探す）"""
+
+    def __init__(self, file):
+        try:
+            self.zip = zipfile.ZipFile(file)
+        except zipfile.BadZipFile as e:
+            raise BulkError(f'Invalid zip archive: {e}')
+        self.names = {}
+        for info in self.zip.infolist():
+            if not info.is_dir():
+                self.names.setdefault(info.filename, info)
+                self.names.setdefault(os.path.basename(info.filename), info)
+
+    def open(self, name):
+        info = self.names.get(name)
+        if info is None:
+            raise LookupError(f'{name} was not found in the archive')
+        return self.zip.open(info)
+
+    def close(self):
+        self.zip.close()
+
+
+def open_image_source(path):
+    """ディレクトリか ZIP ファイルのパスから画像の読み込み元を作る"""
+    if os.path.isdir(path):
+        return DirectoryImages(path)
+    if zipfile.is_zipfile(path):
+        return ZipImages(path)
+    raise BulkError(f'{path} is neither a directory nor a zip archive.')
+
+
+class ImportResult:
+
+    def __init__(self, max_errors=MAX_REPORTED_ERRORS):
+        self.processed = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.max_errors = max_errors
+        self.images = []  # 縮小版の生成が必要な (item_id, filename)
+
+    def add_error(self, line, error):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'error': error})
+
+    def to_dict(self):
+        return {
+            'processed': self.processed,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': sorted(self.errors, key=lambda e: e['line']),
+            'errors_truncated': self.failed > len(self.errors),
+        }
+
+
+def import_items(db, records, blob_store, images=None, url_template=None,
+                 batch_size=DEFAULT_BATCH_SIZE, max_errors=MAX_REPORTED_ERRORS):
+    """iter_records() の結果を batch_size 行ずつ検証・登録し、ImportResult を返す
+
+    url_template は photos.url(URL_PLACEHOLDER)。画像の参照カウントはアイテムと同じトランザクションで増やす。
+    """
+    from .schemas import ItemCreate, ValidationError
+
+    result = ImportResult(max_errors)
+    stored = {}   # image 列の値 -> 保存したファイル名（同じ画像を何度もハッシュしない）
+    writers = {}  # ファイル名 -> 画像の BlobWriter（acquire で確定する）
+
+    try:
+        batch = []
+        for line, record in records:
+            result.processed += 1
+            if isinstance(record, str):
+                result.add_error(line, record)
+                continue
+            try:
+                data = ItemCreate(**record)
+            except ValidationError as e:
+                result.add_error(line, e.errors(include_url=False, include_context=False))
+                continue
+            batch.append((line, data, record.get('image')))
+            if len(batch) >= batch_size:
+                _insert_batch(db, batch, blob_store, images, url_template, stored, writers, result)
+                batch = []
+        if batch:
+            _insert_batch(db, batch, blob_store, images, url_template, stored, writers, result)
+    finally:
+        for writer in writers.values():
+            writer.abort()  # どの行でも確定しなかった画像の一時ファイルを削除（確定済みなら何もしない）
+    return result
+
+
+def _store_image(blob_store, images, name, stored, writers):
+    if name in stored:
+        return stored[name]
+    if images is not None:
+        with images.open(name) as f:
+            writer = blob_store.save(FileStorage(stream=f, filename=os.path.basename(name)))
+        filename = writer.filename
+        if filename in writers:
+            writer.abort()  # 別の名前で同じ内容の画像を受け取り済み
+        else:
+            writers[filename] = writer
+    elif BLOB_NAME_RE.match(name) and os.path.exists(os.path.join(blob_store.destination, name)):
+        filename = name  # 保存済みのファイル（エクスポートしたデータの再インポートなど）
+    else:
+        raise LookupError(f'{name} was not found (no image directory or archive was given)')
+    stored[name] = filename
+    return filename
+
+
+def _insert_batch(db, batch, blob_store, images, url_template, stored, writers, result):
+    rows = []
+    for line, data, image in batch:
+        # image_url / image_filename は入力からは受け付けず、保存した画像から設定する
+        row = data.model_dump(exclude={'image_url', 'image_filename'})
+        if image:
+            try:
+                filename = _store_image(blob_store, images, image, stored, writers)
+            except Exception as e:
+                result.add_error(line, f'Image {image!r}: {e}')
+                continue
+            row['image_filename'] = filename
+            row['image_url'] = url_template.replace(URL_PLACEHOLDER, filename) if url_template else None
+        rows.append((line, row))
+    if not rows:
+        return
+
+    try:
+        ids = db.scalars(
+            insert(Item).returning(Item.id, sort_by_parameter_order=True), [row for _, row in rows]
+        ).all()
+        for filename, count in Counter(row['image_filename'] for _, row in rows if row.get('image_filename')).items():
+            blob_store.acquire(db, filename, count, writer=writers.get(filename))
+        record_changes(db, added=[(row['category'], row['price']) for _, row in rows])
+        db.commit()
+    except (SQLAlchemyError, BlobMissingError):
+        db.rollback()
+        # まとめての INSERT に失敗した場合は1行ずつ入れ直して、失敗した行だけをエラーにする
+        ids = []
+        for line, row in rows:
+            try:
+                ids.append(db.scalar(insert(Item).values(**row).returning(Item.id)))
+                if row.get('image_filename'):
+                    blob_store.acquire(db, row['image_filename'], writer=writers.get(row['image_filename']))
+                record_changes(db, added=[(row['category'], row['price'])])
+                db.commit()
+            except BlobMissingError as e:
+                db.rollback()
+                ids.append(None)
+                result.add_error(line, f'Image {row["image_filename"]!r}: {e}')
+            except SQLAlchemyError as e:
+                db.rollback()
+                ids.append(None)
+                result.add_error(line, f'Database error: {e.orig if getattr(e, "orig", None) else e}')
+        # どのアイテムからも参照されなかった画像は削除する
+        committed = {row.get('image_filename') for (_, row), item_id in zip(rows, ids) if item_id is not None}
+        for filename in {row['image_filename'] for _, row in rows if row.get('image_filename')} - committed:
+            if blob_store.collect(filename):
+                writers.pop(filename, None)
+                for name in [name for name, value in stored.items() if value == filename]:
+                    del stored[name]
+
+    for (_, row), item_id in zip(rows, ids):
+        if item_id is None:
+            continue
+        result.inserted += 1
+        if row.get('image_filename'):
+            result.images.append((item_id, row['image_filename']))
+
+
+def export_items(db, fmt, batch_size=DEFAULT_BATCH_SIZE):
+    """全アイテムを id 順にエクスポートする（bytes のチャンクを返すジェネレータ）
+
+    yield_per でサーバーサイドカーソルから batch_size 行ずつ取り出すため、件数が増えてもメモリ使用量は一定。
+    """
+    stmt = select(*EXPORT_SERIALIZER.columns).order_by(Item.id).execution_options(yield_per=batch_size)
+    result = db.execute(stmt)
+    try:
+        if fmt == 'ndjson':
+            for partition in result.partitions():
+                yield EXPORT_SERIALIZER.encode_ndjson(partition)
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(EXPORT_SERIALIZER.names)
+        for partition in result.partitions():
+            writer.writerows(
+                [value.isoformat() if isinstance(value, datetime) else value for value in row]
+                for row in partition
+            )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    finally:
+        result.close()
@@ -0,0 +1,322 @@
+import hashlib
+import inspect
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from functools import wraps
+from flask import current_app, request, make_response, g
+from .compression import strip_encoding_suffix
+
+
+class MemoryCacheBackend:
+    """プロセス内のキャッシュ（LRU・合計バイト数で上限）
+
+    バージョンカウンタもプロセス内にあるため、複数ワーカーで動かす場合は
+    他のワーカーでの更新が反映されない。その場合は SQLiteCacheBackend を使う。
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (etag, body)
+        self._size = 0
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get_version(self):
+        return self._version
+
+    def bump_version(self):
+        with self._lock:
+            self._version += 1
+            # 古いバージョンのエントリは二度と参照されないので、まとめて捨てる
+            self._entries.clear()
+            self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def get_many(self, keys):
+        """{key: (etag, body)}（見つかったものだけ）"""
+        entries = {}
+        for key in keys:
+            entry = self.get(key)
+            if entry is not None:
+                entries[key] = entry
+        return entries
+
+    def set_many(self, entries):
+        for key, etag, body in entries:
+            self.set(key, etag, body)
+
+    def set(self, key, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = (etag, body)
+            self._size += len(body)
+            # 上限を超えたら最も長く使われていないものから削除
+            while self._size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+
+class SQLiteCacheBackend:
+    """SQLite ファイルを共有キャッシュとして使うバックエンド
+
+    同じファイルを参照する全ワーカーでバージョンカウンタとエントリを共有するため、
+    どのワーカーで管理者が更新しても全ワーカーのキャッシュが無効になる。
+
+    LRU 用の accessed_at は、前回の更新から touch_interval 秒以上経ったエントリだけ更新する。
+    ヒットのたびに UPDATE すると、読み込みだけのリクエストが毎回 SQLite の書き込みロックを取り、
+    全ワーカーのリクエストがそこで直列になるため（追い出しの順序は touch_interval 秒の粒度で十分）。
+    """
+
+    def __init__(self, path, max_bytes, touch_interval=60):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._local = threading.local()
+        # 初期化用の接続は使い捨てにする（preload で fork 前に作られた接続をワーカーに持ち越さないため）
+        with closing(sqlite3.connect(self.path, timeout=5, isolation_level=None)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                " key TEXT PRIMARY KEY, etag TEXT NOT NULL, body BLOB NOT NULL,"
+                " size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_accessed_at ON cache_entries (accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO cache_meta (name, value) VALUES ('version', 0)")
+
+    def _connect(self):
+        # スレッドごとに接続を使い回す（fork 後のプロセスでは作り直す）
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get_version(self):
+        row = self._connect().execute("SELECT value FROM cache_meta WHERE name = 'version'").fetchone()
+        return row[0] if row else 0
+
+    def bump_version(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("UPDATE cache_meta SET value = value + 1 WHERE name = 'version'")
+            conn.execute("DELETE FROM cache_entries")
+
+    def get(self, key):
+        conn = self._connect()
+        row = conn.execute("SELECT etag, body, accessed_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self._touch(conn, [key] if row[2] < time.time() - self.touch_interval else [])
+        return row[0], bytes(row[1])
+
+    def get_many(self, keys):
+        """{key: (etag, body)}（見つかったものだけ。1回の SELECT で取得する）"""
+        if not keys:
+            return {}
+        conn = self._connect()
+        placeholders = ','.join('?' * len(keys))
+        rows = conn.execute(
+            f"SELECT key, etag, body, accessed_at FROM cache_entries WHERE key IN ({placeholders})", list(keys)
+        ).fetchall()
+        stale = time.time() - self.touch_interval
+        self._touch(conn, [key for key, _, _, accessed_at in rows if accessed_at < stale])
+        return {key: (etag, bytes(body)) for key, etag, body, _ in rows}
+
+    def _touch(self, conn, keys):
+        if not keys:
+            return
+        placeholders = ','.join('?' * len(keys))
+        try:
+            conn.execute(f"UPDATE cache_entries SET accessed_at = ? WHERE key IN ({placeholders})",
+                         [time.time(), *keys])
+        except sqlite3.OperationalError:
+            pass  # 他のワーカーが書き込み中（database is locked）なら次のヒットで更新する
+
+    def set(self, key, etag, body):
+        self.set_many([(key, etag, body)])
+
+    def set_many(self, entries):
+        entries = [(key, etag, body) for key, etag, body in entries if len(body) <= self.max_bytes]
+        if not entries:
+            return
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, etag, body, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                [(key, etag, body, len(body), now) for key, etag, body in entries],
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+            # 上限を超えた分だけ、最終アクセスが古いものから削除
+            while total > self.max_bytes:
+                oldest = conn.execute(
+                    "SELECT key, size FROM cache_entries ORDER BY accessed_at LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                conn.execute("DELETE FROM cache_entries WHERE key = ?", (oldest[0],))
+                total -= oldest[1]
+
+
+class ResponseCache:
+    """カタログ参照系エンドポイントのレスポンスキャッシュ
+
+    シリアライズ済みの JSON バイト列をキャッシュし、キーにはカタログ全体のバージョン番号を含める。
+    管理者の作成・更新・削除で invalidate() を呼ぶとバージョンが上がり、古いエントリは使われなくなる。
+    ETag を付与し、If-None-Match が一致すれば 304 を返して本文の転送を省く。
+    """
+
+    def init_app(self, app):
+        backend_name = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+        max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024)
+
+        if backend_name == 'memory':
+            backend = MemoryCacheBackend(max_bytes)
+        elif backend_name == 'sqlite':
+            backend = SQLiteCacheBackend(app.config['RESPONSE_CACHE_PATH'], max_bytes,
+                                         app.config.get('RESPONSE_CACHE_TOUCH_INTERVAL', 60))
+        elif backend_name == 'none':
+            backend = None
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {backend_name}")
+
+        app.extensions['response_cache'] = backend
+
+    @property
+    def backend(self):
+        return current_app.extensions.get('response_cache')
+
+    def invalidate(self):
+        """カタログが更新されたときに呼ぶ（バージョンを上げて全エントリを無効化）"""
+        backend = self.backend
+        if backend is not None:
+            backend.bump_version()
+
+    def get_many(self, namespace, ids):
+        """id ごとにキャッシュした本文を取得する（/api/items?ids= でアイテムを1件ずつ使い回す）
+
+        戻り値は (キーの接頭辞, {id: body})。キャッシュが無効なら (None, {})。
+        set_many() には同じ接頭辞を渡す（読み込んだ後にバージョンが上がった場合に、古い内容を新しいバージョンで保存しないため）。
+        """
+        backend = self.backend
+        if backend is None:
+            return None, {}
+        prefix = f"{backend.get_version()}:{namespace}:"
+        entries = backend.get_many([f"{prefix}{i}" for i in ids])
+        return prefix, {i: entries[f"{prefix}{i}"][1] for i in ids if f"{prefix}{i}" in entries}
+
+    def set_many(self, prefix, bodies):
+        """{id: body} を get_many() が返した接頭辞で保存する"""
+        backend = self.backend
+        if backend is None or prefix is None or not bodies or _read_from_lagging_replica():
+            return
+        backend.set_many([(f"{prefix}{i}", '', body) for i, body in bodies.items()])
+
+    def cached(self, view):
+        """ビュー関数をキャッシュするデコレータ（200 の JSON レスポンスのみ保存する）
+
+        非同期ビュー (async def) にも使える。その場合もキャッシュの読み書き自体は同期的に行う。
+        """
+        if inspect.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                backend = self.backend
+                if backend is None:
+                    return await view(*args, **kwargs)
+                key, response = self._lookup(backend)
+                if response is not None:
+                    return response
+                return self._store(backend, key, await view(*args, **kwargs))
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            backend = self.backend
+            if backend is None:
+                return view(*args, **kwargs)
+            key, response = self._lookup(backend)
+            if response is not None:
+                return response
+            return self._store(backend, key, view(*args, **kwargs))
+
+        return wrapper
+
+    def _lookup(self, backend):
+        key = f"{backend.get_version()}:{request.full_path}"
+        entry = backend.get(key)
+        if entry is None:
+            return key, None
+        etag, body = entry
+        return key, self._respond(etag, body)
+
+    def _store(self, backend, key, rv):
+        response = make_response(rv)
+        if response.status_code != 200 or response.mimetype != 'application/json':
+            return response
+
+        body = response.get_data()
+        # ビューが ETag を付けていればそれを使う（アイテムのバージョン番号から作った ETag など）
+        etag = response.get_etag()[0] or hashlib.blake2b(body, digest_size=16).hexdigest()
+        if not _read_from_lagging_replica():
+            backend.set(key, etag, body)
+        return self._respond(etag, body, response)
+
+    def _respond(self, etag, body, response=None):
+        held = _held_etag(etag)
+        if held is not None:
+            # クライアントが同じ内容を持っているので本文は送らない（ETag はクライアントが持っている形式のもの）
+            response = current_app.response_class(status=304)
+            response.set_etag(held)
+        else:
+            if response is None:
+                response = current_app.response_class(body, status=200, mimetype='application/json')
+            response.set_etag(etag)
+        # 毎回サーバーに再検証させる（内容が変わっていなければ 304 になる）
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+
+def _held_etag(etag):
+    """If-None-Match のうち etag と一致するもの（一致しなければ None）
+
+    圧縮したレスポンスの ETag には形式の接尾辞が付いている (compression.py) ので、除いてから比較する（弱い比較）。
+    """
+    if_none_match = request.if_none_match
+    if if_none_match.star_tag:
+        return etag
+    for tag in if_none_match.as_set(include_weak=True):
+        if strip_encoding_suffix(tag) == etag:
+            return tag
+    return None
+
+
+def _read_from_lagging_replica():
+    """このリクエストの読み込みが、反映の遅れている可能性のあるレプリカに送られたか
+
+    その内容を保存すると、invalidate() の後の新しいバージョンのキーに古い内容が残ってしまう。
+    """
+    from .database import reads_may_lag
+    return any(reads_may_lag(g.get(name)) for name in ('read_db_session', 'async_read_db_session'))
+
+
+response_cache = ResponseCache()
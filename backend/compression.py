@@ -0,0 +1,180 @@
+import gzip
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    from compression import zstd  # Python 3.14 以降の標準ライブラリ
+except ImportError:
+    zstd = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# API レスポンス (JSON / NDJSON / CSV など) の圧縮
+#
+# Accept-Encoding で zstd / br / gzip からクライアントの q 値が最も高いもの（同じなら RESPONSE_COMPRESSION_ENCODINGS の順）を選び、
+# after_request で本文を圧縮する。RESPONSE_COMPRESSION_MIN_SIZE 未満の本文、画像・動画など圧縮済みの形式、
+# send_file のファイル（静的ファイルは static_files.py の事前圧縮を使う）、ストリーミングのレスポンスは圧縮しない。
+# ETag の付いたレスポンス（response_cache から返す本文やアイテムの詳細）は、本文のハッシュと形式ごとに圧縮結果を保存しておき、
+# 同じ本文を毎回圧縮し直さない（ETag をキーにすると、削除後に同じ ETag で作られた別の内容に古い本文を返しうる）。
+# 圧縮した場合は強い ETag に形式の接尾辞を付ける ("<ETag>-gzip" など。形式ごとにバイト列が違うので、同じ強い ETag は使えない)。
+# If-None-Match (cache.py) と If-Match (concurrency.py) は strip_encoding_suffix() で接尾辞を除いてから元の ETag と比較する。
+
+# 圧縮する Content-Type（これ以外は既に圧縮されているか、小さくならないものとして扱う）
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'application/jsonl', 'application/javascript',
+    'application/xml', 'image/svg+xml', 'text/html', 'text/css', 'text/csv', 'text/plain', 'text/xml',
+}
+
+
+# 圧縮したレスポンスの ETag の接尾辞
+_ENCODING_SUFFIX_RE = re.compile(r'-(gzip|br|zstd)$')
+
+
+def encoded_etag(etag, encoding):
+    return f"{etag}-{encoding}"
+
+
+def strip_encoding_suffix(etag):
+    """encoded_etag() で付けた形式の接尾辞を除いた ETag"""
+    return _ENCODING_SUFFIX_RE.sub('', etag)
+
+
+def _gzip(data, level):
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _brotli(data, level):
+    return brotli.compress(data, quality=level)
+
+
+def _zstd(data, level):
+    if zstd is not None:
+        return zstd.compress(data, level=level)
+    # ZstdCompressor はスレッドセーフではないので呼び出しごとに作る
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def available_encodings():
+    """このプロセスで使える圧縮形式 {名前: 圧縮関数}"""
+    encoders = {'gzip': _gzip}
+    if brotli is not None:
+        encoders['br'] = _brotli
+    if zstd is not None or zstandard is not None:
+        encoders['zstd'] = _zstd
+    return encoders
+
+
+class CompressedBodies:
+    """(本文のハッシュ, 形式) ごとの圧縮結果の LRU（合計サイズの上限付き）"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._entries.get(key)
+            if body is not None:
+                self._entries.move_to_end(key)
+            return body
+
+    def set(self, key, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = body
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, oldest = self._entries.popitem(last=False)
+                self._size -= len(oldest)
+
+
+class ResponseCompression:
+    def __init__(self):
+        self.encoders = {}
+        self.preference = ()
+        self.levels = {}
+        self.min_size = 0
+        self.memo = None
+
+    def init_app(self, app):
+        app.extensions['response_compression'] = self
+        if not app.config['RESPONSE_COMPRESSION']:
+            return
+
+        encoders = available_encodings()
+        self.preference = tuple(
+            name for name in app.config['RESPONSE_COMPRESSION_ENCODINGS'] if name in encoders
+        )
+        self.encoders = {name: encoders[name] for name in self.preference}
+        self.levels = {
+            'gzip': app.config['RESPONSE_COMPRESSION_GZIP_LEVEL'],
+            'br': app.config['RESPONSE_COMPRESSION_BR_LEVEL'],
+            'zstd': app.config['RESPONSE_COMPRESSION_ZSTD_LEVEL'],
+        }
+        self.min_size = app.config['RESPONSE_COMPRESSION_MIN_SIZE']
+        max_bytes = app.config['RESPONSE_COMPRESSION_CACHE_MAX_BYTES']
+        self.memo = CompressedBodies(max_bytes) if max_bytes else None
+        app.after_request(self.compress_response)
+
+    def negotiate(self):
+        """Accept-Encoding から使う形式を選ぶ（圧縮しない場合は None）"""
+        return request.accept_encodings.best_match(self.preference)
+
+    def compress_response(self, response):
+        if (
+            response.direct_passthrough
+            or response.is_streamed
+            or response.status_code < 200 or response.status_code in (204, 206)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+        size = response.content_length
+        if (size if size is not None else len(response.get_data())) < self.min_size:
+            return response
+
+        # Accept-Encoding によって内容が変わるので、共有キャッシュには形式ごとに保存させる
+        response.vary.add('Accept-Encoding')
+        encoding = self.negotiate()
+        if encoding is None:
+            return response
+
+        etag, weak = response.get_etag()
+        data = response.get_data()
+        # ETag の付いた本文は繰り返し返されるものとして圧縮結果を保存する（ハッシュは圧縮よりずっと速い）
+        key = (hashlib.blake2b(data, digest_size=16).digest(), encoding) if etag and self.memo is not None else None
+        body = self.memo.get(key) if key else None
+        if body is None:
+            body = self.encoders[encoding](data, self.levels[encoding])
+            if len(body) >= len(data):
+                return response  # 小さくならない
+            if key:
+                self.memo.set(key, body)
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        if etag and not weak:
+            response.set_etag(encoded_etag(etag, encoding))
+        return response
+
+
+response_compression = ResponseCompression()
@@ -0,0 +1,205 @@
+import hashlib
+import re
+from flask import request
+from sqlalchemy import case, delete, select, update
+from sqlalchemy.orm.exc import StaleDataError
+from .compression import strip_encoding_suffix
+from .models import Item
+
+# アイテムの更新・削除の楽観的排他制御 (If-Match)
+#
+# GET /api/item/<id> は ETag "<id>.<version>" を返す（id は再利用されない。SQLite では items を AUTOINCREMENT にしている）。
+# 縮小版 (image_variants) は version を上げずに後から保存されるので、その場合は "<id>.<version>.<縮小版のハッシュ>" にする
+# （本文が変われば ETag も変わる）。クライアントは更新・削除のときに If-Match にその値を付け、
+# 読み込んでから他の管理者に更新されていれば 412 になる（黙って上書きしない）。If-Match がなければ従来どおり無条件に更新する。
+# 更新は UPDATE ... RETURNING で変更後の行を受け取り、commit 後に再読み込みしない。PostgreSQL では
+# UPDATE ... FROM (変更前の行) ... RETURNING の1文で、ファセット・画像の付け替えに必要な変更前の値も同時に受け取る。
+# 削除は DELETE ... RETURNING の1文。RETURNING に対応していない DB では ORM で読み込んで更新する
+# （version_id_col が WHERE version = ... を付けるので、その間に他の更新が入れば StaleDataError になる）。
+
+
+class PreconditionFailed(Exception):
+    """If-Match のバージョンが現在の行と一致しない（current_etag は現在の ETag、行がなければ None）"""
+
+    def __init__(self, current_etag=None):
+        super().__init__("The item has been modified by another request.")
+        self.current_etag = current_etag
+
+
+class ItemNotFound(Exception):
+    pass
+
+
+def item_etag(item_id, version, variants=None):
+    """GET /api/item/<id> の ETag（引用符は set_etag が付ける）"""
+    if not variants:
+        return f"{item_id}.{version}"
+    names = '\n'.join(sorted(v['filename'] for v in variants))
+    return f"{item_id}.{version}.{hashlib.blake2b(names.encode(), digest_size=4).hexdigest()}"
+
+
+def parse_if_match(item_id):
+    """If-Match で指定されたバージョンのリスト。ヘッダーがないか * の場合は None（条件なし）
+
+    If-Match は強い比較なので弱い ETag (W/"...") は一致しない。圧縮したレスポンスの ETag ("<id>.<version>-gzip" など、
+    compression.py) は形式の接尾辞を除いて比較する（比較するのはバージョンで、圧縮によるバイト列の違いは関係ない）。
+    縮小版のハッシュは比較しない（縮小版の保存は更新ではないので、その前に読み込んだ ETag でも更新できる）。
+    このアイテムの ETag として解釈できない値（他のアイテムのものなど）は、どのバージョンにも一致しない。
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    pattern = re.compile(rf'{item_id}\.(\d+)(?:\.[0-9a-f]+)?')
+    return [
+        int(match.group(1)) for tag in if_match.as_set() if (match := pattern.fullmatch(strip_encoding_suffix(tag)))
+    ]
+
+
+def _dialect(db):
+    return db.get_bind().dialect
+
+
+def _precondition_failed(db, item_id):
+    """更新・削除の対象がなかったときに、アイテムが存在しないのかバージョンが違うのかを判別する"""
+    row = db.execute(select(Item.version, Item.image_variants).where(Item.id == item_id)).first()
+    if row is None:
+        raise ItemNotFound()
+    raise PreconditionFailed(item_etag(item_id, *row))
+
+
+def update_item_row(db, item_id, values, image=None, versions=None):
+    """アイテムを更新し、(変更後の Item, 変更前の (category, price, image_filename, image_variants)) を返す
+
+    image は新しい画像の (filename, url)。同じ画像なら縮小版 (image_variants) はそのまま残す。
+    versions は parse_if_match() の結果。一致しなければ PreconditionFailed、アイテムがなければ ItemNotFound。
+    commit は呼び出し側で行う。
+    """
+    dialect = _dialect(db)
+    if dialect.name == 'postgresql':
+        return _update_item_from(db, item_id, values, image, versions)
+    if dialect.update_returning:
+        return _update_item_returning(db, item_id, values, image, versions)
+    return _update_item_orm(db, item_id, values, image, versions)
+
+
+def _update_item_from(db, item_id, values, image, versions):
+    """UPDATE ... FROM (変更前の行) ... RETURNING の1文で、変更後の行と変更前の値を受け取る（PostgreSQL）"""
+    old = (
+        select(Item.id, Item.version, Item.category, Item.price, Item.image_filename, Item.image_variants)
+        .where(Item.id == item_id)
+        .subquery('old')
+    )
+    values = dict(values, version=Item.version + 1)
+    if image is not None:
+        filename, url = image
+        values.update(
+            image_filename=filename,
+            image_url=url,
+            # 新しい画像の縮小版は後から生成される
+            image_variants=case((Item.image_filename == filename, Item.image_variants), else_=None),
+        )
+    # version の一致を条件にすることで、変更前の行を読んでから更新するまでの間に他の更新が入った場合は何も更新しない
+    stmt = (
+        update(Item)
+        .where(Item.id == old.c.id, Item.version == old.c.version)
+        .values(**values)
+        .returning(
+            Item,
+            old.c.category.label('old_category'),
+            old.c.price.label('old_price'),
+            old.c.image_filename.label('old_image_filename'),
+            old.c.image_variants.label('old_image_variants'),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if versions is not None:
+        stmt = stmt.where(Item.version.in_(versions))
+
+    row = db.execute(stmt).first()
+    if row is None:
+        _precondition_failed(db, item_id)
+    return row[0], tuple(row[1:])
+
+
+def _update_item_returning(db, item_id, values, image, versions):
+    """変更前の値を主キーで読み、UPDATE ... WHERE version = <読んだ値> RETURNING で更新する
+
+    SQLite の RETURNING は更新対象のテーブルの列しか返せないため、変更前の値は別に読む（同じトランザクションの2文）。
+    """
+    old = db.execute(
+        select(Item.version, Item.category, Item.price, Item.image_filename, Item.image_variants)
+        .where(Item.id == item_id)
+    ).first()
+    if old is None:
+        raise ItemNotFound()
+    if versions is not None and old.version not in versions:
+        raise PreconditionFailed(item_etag(item_id, old.version, old.image_variants))
+
+    values = dict(values, version=old.version + 1)
+    if image is not None:
+        filename, url = image
+        if filename != old.image_filename:
+            values.update(image_filename=filename, image_url=url, image_variants=None) # 新しい画像の縮小版は後から生成される
+    row = db.execute(
+        update(Item)
+        .where(Item.id == item_id, Item.version == old.version)
+        .values(**values)
+        .returning(Item)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is None:
+        _precondition_failed(db, item_id)
+    return row[0], tuple(old[1:])
+
+
+def _update_item_orm(db, item_id, values, image, versions):
+    item = db.get(Item, item_id)
+    if item is None:
+        raise ItemNotFound()
+    if versions is not None and item.version not in versions:
+        raise PreconditionFailed(item_etag(item_id, item.version, item.image_variants))
+
+    old = (item.category, item.price, item.image_filename, item.image_variants)
+    for key, value in values.items():
+        setattr(item, key, value)
+    if image is not None:
+        filename, url = image
+        if filename != item.image_filename:
+            item.image_filename, item.image_url, item.image_variants = filename, url, None
+    try:
+        db.flush()
+    except StaleDataError:
+        db.rollback()
+        _precondition_failed(db, item_id)
+    return item, old
+
+
+def delete_item_row(db, item_id, versions=None):
+    """アイテムを削除し、(category, price, image_filename, image_variants) を返す（commit は呼び出し側で行う）"""
+    if not _dialect(db).delete_returning:
+        item = db.get(Item, item_id)
+        if item is None:
+            raise ItemNotFound()
+        if versions is not None and item.version not in versions:
+            raise PreconditionFailed(item_etag(item_id, item.version, item.image_variants))
+        db.delete(item)
+        try:
+            db.flush()
+        except StaleDataError:
+            db.rollback()
+            _precondition_failed(db, item_id)
+        return item.category, item.price, item.image_filename, item.image_variants
+
+    stmt = (
+        delete(Item)
+        .where(Item.id == item_id)
+        .returning(Item.category, Item.price, Item.image_filename, Item.image_variants)
+        .execution_options(synchronize_session=False)
+    )
+    if versions is not None:
+        stmt = stmt.where(Item.version.in_(versions))
+
+    row = db.execute(stmt).first()
+    if row is None:
+        _precondition_failed(db, item_id)
+    return tuple(row)
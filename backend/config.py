@@ -1,20 +1,143 @@
 from flask_uploads import UploadSet, configure_uploads, IMAGES
 from pathlib import Path
+import os
+import json
+from .cache import response_cache
+from .images import image_pipeline
+from .storage import BlobStore
+from .static_files import static_files
+from .message_queue import message_writer
+from .metrics import metrics
+from .database import engine, replica_pool
+from .replicas import read_your_writes
+from .startup import warmup
+from .compression import response_compression
 
 # 'photos'：この名前(UploadSetの第一引数)がUPLOADED_PHOTOS_DESTのPHOTOS部分(大文字)と対応
 # IMAGES：jpg, jpeg, png, gif などの画像ファイルのみ許可
 photos = UploadSet('photos', IMAGES)
 
+# photos の保存先に、内容のハッシュ値をファイル名として保存する（重複排除・参照カウント付き）
+blob_store = BlobStore(photos)
+
 def configure_app(app):
+    mark = app.extensions['startup_profile'].mark # 各段階の時間を記録する（startup.py）
 
 
     # 保存先
-    app.config['UPLOADED_PHOTOS_DEST'] = str(Path.cwd() / 'frontend' / 'src' / 'assets' / 'uploads')
+    app.config['UPLOADED_PHOTOS_DEST'] = os.environ.get(
+        'UPLOADED_PHOTOS_DEST', str(Path.cwd() / 'frontend' / 'src' / 'assets' / 'uploads')
+    )
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024    # ファイルサイズ上限
+    # アイテム登録の画像をメモリに溜める上限。これを超えると保存先の一時ファイルに書き出す（uploads.py）
+    app.config['UPLOAD_SPOOL_MAX_MEMORY'] = int(os.environ.get('UPLOAD_SPOOL_MAX_MEMORY', 256 * 1024))
 
     # 以下の設定は開発用であり、本番環境では、UPLOADS_DEFAULT_URL を設定し、Web サーバーを使用してファイルを提供することを推奨します。
     app.config['UPLOADS_AUTOSERVE'] = True
 
     # UploadSetをアプリに登録
     configure_uploads(app, photos)
+    blob_store.init_app(app)
+    mark('uploads')
+
+    # アップロード画像の縮小版 (WebP/AVIF) 生成
+    # process: プロセスプールで非同期 / inline: リクエスト内で同期 / off: 生成しない
+    app.config['IMAGE_PIPELINE'] = os.environ.get('IMAGE_PIPELINE', 'process')
+    app.config['IMAGE_PIPELINE_WORKERS'] = int(os.environ.get('IMAGE_PIPELINE_WORKERS', 2))
+    app.config['IMAGE_PIPELINE_MAX_PENDING'] = int(os.environ.get('IMAGE_PIPELINE_MAX_PENDING', 32))
+    image_pipeline.init_app(app)
+    mark('image_pipeline')
+
+    # 参照系APIのレスポンスキャッシュ
+    # memory: プロセス内（ワーカー1つの場合）/ sqlite: 複数ワーカーで共有 / none: 無効
+    # memory の無効化 (invalidate) は他のワーカーに届かないので、ワーカーが複数なら既定を sqlite にし、memory は指定させない
+    # （ワーカー数は WEB_CONCURRENCY。gunicorn.conf.py は実際のワーカー数をここに設定する）
+    workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    app.config['RESPONSE_CACHE_BACKEND'] = os.environ.get('RESPONSE_CACHE_BACKEND', 'sqlite' if workers > 1 else 'memory')
+    if app.config['RESPONSE_CACHE_BACKEND'] == 'memory' and workers > 1:
+        raise ValueError(
+            f"RESPONSE_CACHE_BACKEND=memory cannot be used with {workers} workers "
+            "(invalidation would not reach the other workers); use sqlite or none."
+        )
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    app.config['RESPONSE_CACHE_PATH'] = os.environ.get(
+        'RESPONSE_CACHE_PATH', str(Path.cwd() / 'backend' / 'response_cache.db')
+    )
+    # sqlite バックエンドで LRU 用の最終アクセス時刻を更新する間隔（秒）。ヒットのたびには書き込まない
+    app.config['RESPONSE_CACHE_TOUCH_INTERVAL'] = float(os.environ.get('RESPONSE_CACHE_TOUCH_INTERVAL', 60))
+    response_cache.init_app(app)
+    mark('response_cache')
+
+    # Vue のビルド成果物 (backend/static) の配信。起動時にファイル一覧を読み込んでおく
+    # Nginx などの背後では STATIC_USE_X_SENDFILE=True でファイル送信をWebサーバーに任せる
+    app.config['USE_X_SENDFILE'] = os.environ.get('STATIC_USE_X_SENDFILE') == 'True'
+    static_files.init_app(app, os.path.join(app.root_path, 'static'))
+    mark('static_files')
+
+    # 問い合わせメッセージの書き込み方式
+    # sync: リクエスト内で INSERT（従来どおり 201）/ async: キューに入れて 202 を返し、バックグラウンドでまとめて INSERT
+    app.config['MESSAGE_WRITE_MODE'] = os.environ.get('MESSAGE_WRITE_MODE', 'sync')
+    app.config['MESSAGE_QUEUE_SIZE'] = int(os.environ.get('MESSAGE_QUEUE_SIZE', 10000))
+    app.config['MESSAGE_BATCH_SIZE'] = int(os.environ.get('MESSAGE_BATCH_SIZE', 500))
+    app.config['MESSAGE_FLUSH_INTERVAL_MS'] = int(os.environ.get('MESSAGE_FLUSH_INTERVAL_MS', 200))
+    app.config['MESSAGE_SPILL_DIR'] = os.environ.get('MESSAGE_SPILL_DIR', str(Path.cwd() / 'backend' / 'message_spill'))
+    app.config['MESSAGE_SPILL_FSYNC'] = os.environ.get('MESSAGE_SPILL_FSYNC') == 'True'
+    message_writer.init_app(app)
+    mark('message_writer')
+
+    # 問い合わせメッセージの保存期間とアーカイブ先（flask archive-messages で移す。retention.py）
+    app.config['MESSAGE_RETENTION_DAYS'] = int(os.environ.get('MESSAGE_RETENTION_DAYS', 365))
+    app.config['MESSAGE_ARCHIVE_DIR'] = os.environ.get('MESSAGE_ARCHIVE_DIR', str(Path.cwd() / 'backend' / 'message_archive'))
+    app.config['MESSAGE_ARCHIVE_BATCH_SIZE'] = int(os.environ.get('MESSAGE_ARCHIVE_BATCH_SIZE', 5000))
+    # auto（zstd が使えれば zstd、無ければ gzip）/ zstd / gzip
+    app.config['MESSAGE_ARCHIVE_COMPRESSION'] = os.environ.get('MESSAGE_ARCHIVE_COMPRESSION', 'auto')
+
+    # API レスポンスの圧縮（Accept-Encoding に応じて zstd / br / gzip。compression.py）
+    # Nginx などのリバースプロキシで圧縮する場合は RESPONSE_COMPRESSION=False にする
+    app.config['RESPONSE_COMPRESSION'] = os.environ.get('RESPONSE_COMPRESSION', 'True') == 'True'
+    app.config['RESPONSE_COMPRESSION_MIN_SIZE'] = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+    # 同じ q 値のときに優先する順（使えない形式は無視する）
+    app.config['RESPONSE_COMPRESSION_ENCODINGS'] = [
+        name.strip() for name in os.environ.get('RESPONSE_COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if name.strip()
+    ]
+    # 圧縮レベル。リクエストごとに圧縮するので、静的ファイルの事前圧縮 (gzip 9 / brotli 11) より低くする
+    app.config['RESPONSE_COMPRESSION_GZIP_LEVEL'] = int(os.environ.get('RESPONSE_COMPRESSION_GZIP_LEVEL', 4))
+    app.config['RESPONSE_COMPRESSION_BR_LEVEL'] = int(os.environ.get('RESPONSE_COMPRESSION_BR_LEVEL', 4))
+    app.config['RESPONSE_COMPRESSION_ZSTD_LEVEL'] = int(os.environ.get('RESPONSE_COMPRESSION_ZSTD_LEVEL', 3))
+    # ETag の付いたレスポンスの圧縮結果を保存しておく上限（0 で保存しない）
+    app.config['RESPONSE_COMPRESSION_CACHE_MAX_BYTES'] = int(
+        os.environ.get('RESPONSE_COMPRESSION_CACHE_MAX_BYTES', 8 * 1024 * 1024)
+    )
+    response_compression.init_app(app)
+    mark('response_compression')
+
+    # リクエストごとのレイテンシと SQL の回数・時間の計測（/metrics で Prometheus 形式で公開する）
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'False') == 'True'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN') # 設定すると /metrics に Bearer トークンが必要
+    app.config['METRICS_SLOW_QUERY_MS'] = float(os.environ.get('METRICS_SLOW_QUERY_MS', 200)) # これより遅い SQL をログに出す
+    metrics.init_app(app, engines=(engine, *replica_pool.replicas))
+    mark('metrics')
+
+    # 一括インポート (/api/admin/items/import) で受け付けるサイズの上限と、1トランザクションで登録する行数
+    app.config['BULK_IMPORT_MAX_CONTENT_LENGTH'] = int(os.environ.get('BULK_IMPORT_MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))
+    app.config['BULK_IMPORT_BATCH_SIZE'] = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', 1000))
+
+    # リードレプリカ (DATABASE_REPLICA_URLS) を使う場合、書き込みをしたクライアントの参照をプライマリに送る秒数
+    app.config['READ_YOUR_WRITES_SECONDS'] = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+    read_your_writes.init_app(app)
+
+    # 非同期モード (asgi.py) で同期ビュー（アップロードなど）を実行するスレッド数
+    app.config['ASYNC_THREADS'] = int(os.environ.get('ASYNC_THREADS', 16))
+
+    # JSON のエンコードに使うライブラリ: auto（orjson があれば使う）/ orjson / stdlib
+    app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')
+
+    # 遅延・障害注入のルール（ステージング用。未設定なら無効。書式は faults.py を参照）
+    app.config['FAULT_INJECTION_RULES'] = json.loads(os.environ.get('FAULT_INJECTION', '[]'))
 
+    # 遅延初期化モード（コンテナのコールドスタート向け）: pydantic のスキーマなど重いモジュールを起動時に読み込まず、
+    # 最初に使われたときに読み込む。STARTUP_WARMUP=True なら各プロセスの最初のリクエストの後にバックグラウンドで読み込む
+    app.config['LAZY_INIT'] = os.environ.get('LAZY_INIT') == 'True'
+    app.config['STARTUP_WARMUP'] = os.environ.get('STARTUP_WARMUP', 'True') == 'True'
+    warmup.init_app(app)
+    mark('deferred_modules')
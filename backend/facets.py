@@ -0,0 +1,271 @@
+import heapq
+from bisect import bisect_right
+from collections import Counter
+from sqlalchemy import select, update, insert, delete, func, case, asc, desc, or_, and_, type_coerce, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import Item, ItemFacetCount
+from .pagination import PaginationError, bind_cursor_timestamp, decode_cursor, encode_cursor
+
+# カテゴリ・価格帯での絞り込みと、ファセット（カテゴリごとの件数・価格帯ごとの件数）
+#
+# ファセットの件数は item_facet_counts（カテゴリ × 価格帯ごとの件数）から求め、リクエストごとに items を集計しない。
+# 価格の範囲指定が価格帯の境界と一致しない場合だけ、はみ出した価格帯の分を price のインデックスで数える。
+# それぞれのファセットの件数には、そのファセット以外の絞り込みだけを適用する
+# （カテゴリを選んでも他のカテゴリの件数は消えない。いわゆる disjunctive faceting）。
+
+# 価格帯の下限。i 番目の価格帯は [PRICE_BUCKETS[i], PRICE_BUCKETS[i + 1])、最後は上限なし
+PRICE_BUCKETS = (0, 50, 100, 150, 200, 300, 500, 1000)
+
+# sort= で指定できる並び順: (並べる列, 降順かどうか)
+SORTS = {
+    'newest': (Item.updated_at, True),
+    'price_asc': (Item.price, False),
+    'price_desc': (Item.price, True),
+    'name': (Item.name, False),
+}
+DEFAULT_SORT = 'newest'
+
+
+class FacetError(PaginationError):
+    """category / min_price / max_price / sort パラメータが不正な場合のエラー"""
+
+
+def price_bucket(price):
+    return max(bisect_right(PRICE_BUCKETS, price) - 1, 0)
+
+
+def bucket_bounds(index):
+    """価格帯の (下限, 上限) を返す。どちらも含む（最後の価格帯の上限は None）"""
+    upper = PRICE_BUCKETS[index + 1] - 1 if index + 1 < len(PRICE_BUCKETS) else None
+    return PRICE_BUCKETS[index], upper
+
+
+def _bucket_expression():
+    # SQL 側で price から価格帯のインデックスを求める（集計テーブルの再構築用）
+    return case(
+        *[(Item.price >= lower, index) for index, lower in reversed(list(enumerate(PRICE_BUCKETS))) if index > 0],
+        else_=0,
+    )
+
+
+def parse_categories(values):
+    """category=Running&category=Tennis / category=Running,Tennis のどちらの形式も受け付ける"""
+    categories = []
+    for value in values:
+        categories.extend(c.strip() for c in value.split(',') if c.strip())
+    return list(dict.fromkeys(categories))
+
+
+def parse_price(value, name):
+    if value is None or value == '':
+        return None
+    try:
+        price = int(value)
+    except ValueError:
+        raise FacetError(f'"{name}" must be an integer.')
+    if price < 0:
+        raise FacetError(f'"{name}" must not be negative.')
+    return price
+
+
+def parse_sort(value):
+    if not value:
+        return DEFAULT_SORT
+    if value not in SORTS:
+        raise FacetError(f'"sort" must be one of: {", ".join(SORTS)}')
+    return value
+
+
+# ---- 集計テーブルの更新 ----
+
+def record_changes(db, added=(), removed=()):
+    """アイテムの追加・削除を集計テーブルに反映する（呼び出し側のトランザクション内で実行され、commit で確定する）
+
+    added / removed は (category, price) のリスト。更新は「古い値の削除 + 新しい値の追加」として渡す。
+    """
+    deltas = Counter()
+    for category, price in added:
+        deltas[(category, price_bucket(price))] += 1
+    for category, price in removed:
+        deltas[(category, price_bucket(price))] -= 1
+
+    dialect = db.get_bind().dialect.name
+    # 行のロックを常に同じ順で取る（並行する更新どうしがデッドロックしないように）
+    for (category, bucket), delta in sorted(deltas.items()):
+        if delta < 0:
+            db.execute(
+                update(ItemFacetCount)
+                .where(ItemFacetCount.category == category, ItemFacetCount.price_bucket == bucket)
+                .values(count=ItemFacetCount.count + delta)
+            )
+        elif delta > 0:
+            # 新しいカテゴリ・価格帯の最初のアイテムが同時に追加されても IntegrityError にならないよう、1文の UPSERT で増やす
+            db.execute(_upsert_count(dialect, category, bucket, delta))
+
+
+def _upsert_count(dialect, category, bucket, delta):
+    values = {'category': category, 'price_bucket': bucket, 'count': delta}
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite_insert if dialect == 'sqlite' else pg_insert)(ItemFacetCount).values(**values)
+        return stmt.on_conflict_do_update(index_elements=[ItemFacetCount.category, ItemFacetCount.price_bucket],
+                                          set_={'count': ItemFacetCount.count + stmt.excluded['count']})
+    from sqlalchemy.dialects.mysql import insert as mysql_insert
+    stmt = mysql_insert(ItemFacetCount).values(**values)
+    return stmt.on_duplicate_key_update(count=ItemFacetCount.count + stmt.inserted['count'])
+
+
+def rebuild_facet_counts(db):
+    """items を集計して集計テーブルを作り直す（集計テーブルを作成した直後や、SQL で直接データを投入した後に使う）"""
+    bucket = _bucket_expression()
+    db.execute(delete(ItemFacetCount))
+    db.execute(
+        insert(ItemFacetCount).from_select(
+            ['category', 'price_bucket', 'count'],
+            select(Item.category, bucket, func.count()).group_by(Item.category, bucket),
+        )
+    )
+    db.commit()
+
+
+def ensure_facet_counts(engine):
+    """集計テーブルが空でアイテムがある場合に集計し直す（init_db から呼ばれる）"""
+    from sqlalchemy.orm import Session
+
+    with Session(engine) as db:
+        if db.scalar(select(ItemFacetCount.category).limit(1)) is None and \
+                db.scalar(select(Item.id).limit(1)) is not None:
+            rebuild_facet_counts(db)
+
+
+# ---- 絞り込み・ファセット ----
+
+def _filters(categories=None, min_price=None, max_price=None):
+    conditions = []
+    if categories:
+        conditions.append(Item.category.in_(categories))
+    if min_price is not None:
+        conditions.append(Item.price >= min_price)
+    if max_price is not None:
+        conditions.append(Item.price <= max_price)
+    return conditions
+
+
+def browse_items(db, columns, categories=None, min_price=None, max_price=None,
+                 sort=DEFAULT_SORT, limit=50, cursor=None):
+    """絞り込んだアイテムを sort の順に limit 件返す（(sort の列, id) のキーセットページネーション）
+
+    戻り値は (行のリスト, 次ページのカーソル or None)。行は columns の順の列を持つ。
+    """
+    sort_column, descending = SORTS[sort]
+    last = decode_cursor(cursor, (str, int)) if cursor else None
+
+    if categories and len(categories) > 1:
+        # category IN (...) のまま並べると対象の全行をソートすることになるため、
+        # カテゴリごとに (category, 並べる列) のインデックス順で limit + 1 件ずつ取得してマージする
+        per_category = [
+            _page_rows(db, columns, [category], min_price, max_price, sort_column, descending, limit, last)
+            for category in categories
+        ]
+        rows = list(heapq.merge(*per_category, key=_sort_key, reverse=descending))[:limit + 1]
+    else:
+        rows = _page_rows(db, columns, categories, min_price, max_price, sort_column, descending, limit, last)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        value = rows[-1]._cursor_value
+        next_cursor = encode_cursor(value if isinstance(value, (str, int)) else str(value), rows[-1]._cursor_id)
+    return rows, next_cursor
+
+
+def _sort_key(row):
+    return row._cursor_value, row._cursor_id
+
+
+def _page_rows(db, columns, categories, min_price, max_price, sort_column, descending, limit, last):
+    # updated_at はページネーションと同じく、DB に保存されている形式のまま比較する
+    cursor_value = type_coerce(sort_column, String) if sort_column is Item.updated_at else sort_column
+
+    stmt = select(*columns, cursor_value.label('_cursor_value'), Item.id.label('_cursor_id')).where(
+        *_filters(categories, min_price, max_price)
+    )
+
+    if last is not None:
+        last_value, last_id = last
+        if sort_column is Item.updated_at:
+            last_value = bind_cursor_timestamp(db, last_value)
+        if descending:
+            stmt = stmt.where(or_(sort_column < last_value, and_(sort_column == last_value, Item.id < last_id)))
+        else:
+            stmt = stmt.where(or_(sort_column > last_value, and_(sort_column == last_value, Item.id > last_id)))
+
+    order = desc if descending else asc
+    return db.execute(stmt.order_by(order(sort_column), order(Item.id)).limit(limit + 1)).all()
+
+
+def facet_counts(db, categories=None, min_price=None, max_price=None):
+    """カテゴリごと・価格帯ごとの件数と、絞り込み後の合計件数を返す"""
+    # 集計テーブルはカテゴリ数 × 価格帯数の行しかないので、まとめて読み込んで Python で集計する
+    summary = db.execute(
+        select(ItemFacetCount.category, ItemFacetCount.price_bucket, ItemFacetCount.count)
+        .where(ItemFacetCount.count > 0)
+    ).all()
+    selected = set(categories) if categories else None
+
+    # 価格帯ごとの件数: カテゴリの絞り込みだけを適用する
+    by_bucket = Counter()
+    for category, bucket, count in summary:
+        if selected is None or category in selected:
+            by_bucket[bucket] += count
+    price_facet = []
+    for index in range(len(PRICE_BUCKETS)):
+        lower, upper = bucket_bounds(index)
+        price_facet.append({'min': lower, 'max': upper, 'count': by_bucket[index]})
+
+    # カテゴリごとの件数: 価格の絞り込みだけを適用する
+    full, partial = _split_buckets(min_price, max_price)
+    by_category = Counter()
+    for category, bucket, count in summary:
+        if full is None or bucket in full:
+            by_category[category] += count
+    # 範囲の端の価格帯は一部だけが対象なので、その分だけ items を数える。
+    # category IN (...) を付けて (category, price) のインデックスの範囲検索だけで済むようにする
+    all_categories = sorted({category for category, _, _ in summary})
+    for lower, upper in partial:
+        if not all_categories:
+            break
+        stmt = select(Item.category, func.count()).where(
+            Item.category.in_(all_categories), *_filters(None, lower, upper)
+        ).group_by(Item.category)
+        for category, count in db.execute(stmt).all():
+            by_category[category] += count
+
+    category_facet = [
+        {'value': category, 'count': count}
+        for category, count in sorted(by_category.items(), key=lambda kv: (-kv[1], kv[0])) if count > 0
+    ]
+    total = sum(count for category, count in by_category.items() if selected is None or category in selected)
+    return {'category': category_facet, 'price': price_facet}, total
+
+
+def _split_buckets(min_price, max_price):
+    """価格の範囲を、全体が含まれる価格帯のリストと、一部だけが含まれる範囲のリストに分ける
+
+    範囲の指定が無い場合は (None, [])（すべての価格帯が対象）。
+    """
+    if min_price is None and max_price is None:
+        return None, []
+
+    full, partial = [], []
+    for index in range(len(PRICE_BUCKETS)):
+        lower, upper = bucket_bounds(index)
+        lo = lower if min_price is None else max(lower, min_price)
+        hi = upper if max_price is None else (max_price if upper is None else min(upper, max_price))
+        if hi is not None and lo > hi:
+            continue  # 範囲外の価格帯
+        if lo == lower and hi == upper:
+            full.append(index)
+        else:
+            partial.append((lo, hi))
+    return full, partial
@@ -0,0 +1,111 @@
+import random
+import re
+import time
+from fnmatch import translate
+from flask import jsonify, request
+
+# ステージング環境で遅いバックエンドや障害を再現するための遅延・エラー注入
+#
+# 環境変数 FAULT_INJECTION に JSON でルールの配列を指定する（未指定なら完全に無効）。例:
+#   FAULT_INJECTION='[
+#     {"path": "/api/item/*", "delay_ms": 300},
+#     {"path": "/api/items*", "methods": ["GET"], "distribution": "normal", "mean_ms": 200, "stddev_ms": 50},
+#     {"path": "/api/message", "distribution": "uniform", "min_ms": 100, "max_ms": 800, "error_rate": 0.1, "error_status": 503}
+#   ]'
+#
+# path は fnmatch 形式のパターン。リクエストに最初に一致したルールだけが適用される。
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'normal', 'exponential')
+
+
+class FaultRule:
+    def __init__(self, path, methods=None, distribution='fixed', delay_ms=0,
+                 min_ms=0, max_ms=0, mean_ms=0, stddev_ms=0,
+                 error_rate=0.0, error_status=503):
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown distribution {distribution!r} (expected one of {DISTRIBUTIONS})")
+        if not 0.0 <= error_rate <= 1.0:
+            raise ValueError("error_rate must be between 0 and 1")
+
+        self.path = path
+        self._pattern = re.compile(translate(path))
+        self.methods = {m.upper() for m in methods} if methods else None
+        self.distribution = distribution
+        self.delay_ms = delay_ms
+        self.min_ms = min_ms
+        self.max_ms = max_ms
+        self.mean_ms = mean_ms
+        self.stddev_ms = stddev_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+
+    def matches(self, path, method):
+        if self.methods is not None and method not in self.methods:
+            return False
+        return self._pattern.match(path) is not None
+
+    def sample_delay(self, rng):
+        """今回のリクエストで待機する秒数"""
+        if self.distribution == 'fixed':
+            ms = self.delay_ms
+        elif self.distribution == 'uniform':
+            ms = rng.uniform(self.min_ms, self.max_ms)
+        elif self.distribution == 'normal':
+            ms = rng.gauss(self.mean_ms, self.stddev_ms)
+        else:  # exponential
+            ms = rng.expovariate(1 / self.mean_ms) if self.mean_ms > 0 else 0
+        return max(ms, 0) / 1000
+
+
+def load_rules(raw_rules):
+    return [FaultRule(**rule) for rule in raw_rules]
+
+
+# 非同期モード (asgi.py) で遅延を asyncio.sleep で注入済みであることを示す environ のキー
+APPLIED_ENVIRON_KEY = 'vuedemo.fault_injected'
+
+
+class FaultInjector:
+
+    def __init__(self, rules, rng=None):
+        self.rules = rules
+        self.rng = rng or random.Random()
+
+    def pick(self, path, method):
+        """(待機する秒数, エラーにする場合のステータス or None) を返す"""
+        rule = next((r for r in self.rules if r.matches(path, method)), None)
+        if rule is None:
+            return 0, None
+        delay = rule.sample_delay(self.rng)
+        if rule.error_rate and self.rng.random() < rule.error_rate:
+            return delay, rule.error_status
+        return delay, None
+
+
+def fault_response(status):
+    return jsonify({'error': 'Injected fault.'}), status
+
+
+def init_fault_injection(app, rng=None):
+    """FAULT_INJECTION_RULES が設定されている場合だけ before_request フックを登録する
+
+    ルールが空ならフック自体を登録しないため、本番環境ではリクエストごとのオーバーヘッドはない。
+    """
+    rules = load_rules(app.config.get('FAULT_INJECTION_RULES') or [])
+    if not rules:
+        return
+
+    injector = app.extensions['fault_injection'] = FaultInjector(rules, rng)
+    app.logger.warning(f"Fault injection is enabled for: {', '.join(rule.path for rule in rules)}")
+
+    @app.before_request
+    def inject_fault():
+        if request.environ.get(APPLIED_ENVIRON_KEY):
+            return None  # 非同期ビューでは asgi.py がイベントループを止めずに注入済み
+
+        delay, error_status = injector.pick(request.path, request.method)
+        if delay:
+            time.sleep(delay)
+        if error_status:
+            return fault_response(error_status)
+        return None
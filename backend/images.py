@@ -0,0 +1,228 @@
+import importlib.util
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Pillow が無い環境では画像パイプラインを無効にして、元画像だけを配信する
+# Pillow 自体は縮小版を生成するときに初めて読み込む（プロセスプールのワーカー内。起動時間に含めない）
+HAS_PILLOW = importlib.util.find_spec('PIL') is not None
+
+# 生成する横幅（元画像より大きい幅は作らない）
+VARIANT_WIDTHS = (320, 640, 1280)
+
+# 縮小版の URL を組み立てるためのひな形に埋め込むファイル名
+URL_PLACEHOLDER = '__variant__'
+
+
+def supported_formats():
+    """このPillowで書き出せる形式（新しい形式ほどファイルサイズが小さい）"""
+    if not HAS_PILLOW:
+        return ()
+    from PIL import features
+
+    formats = []
+    if features.check('avif'):
+        formats.append('avif')
+    if features.check('webp'):
+        formats.append('webp')
+    return tuple(formats)
+
+
+def variant_filename(filename, width, fmt):
+    stem = Path(filename).stem
+    return f"{stem}-{width}w.{fmt}"
+
+
+def generate_variants(source_path, dest_dir, filename, widths=VARIANT_WIDTHS, formats=None):
+    """元画像から幅・形式ごとの縮小版を作成する（プロセスプール内で実行される）
+
+    戻り値は [{"format", "width", "height", "filename", "bytes"}, ...]
+    """
+    from PIL import Image, ImageOps
+
+    formats = formats or supported_formats()
+    variants = []
+
+    with Image.open(source_path) as original:
+        # スマホ写真の回転情報 (EXIF) を反映してから縮小する
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        # 元画像が小さい場合でも最小の幅は必ず作る（形式変換だけでも小さくなるため）
+        targets = [w for w in widths if w < image.width] or [min(image.width, min(widths))]
+        for width in targets:
+            height = round(image.height * width / image.width)
+            resized = image.resize((width, height), Image.LANCZOS)
+            for fmt in formats:
+                name = variant_filename(filename, width, fmt)
+                path = os.path.join(dest_dir, name)
+                resized.save(path, format=fmt.upper(), quality=80 if fmt == 'webp' else 60)
+                variants.append({
+                    'format': fmt,
+                    'width': width,
+                    'height': height,
+                    'filename': name,
+                    'bytes': os.path.getsize(path),
+                })
+
+    return variants
+
+
+class ImagePipeline:
+    """アップロード画像の縮小版をバックグラウンドのプロセスプールで生成する
+
+    IMAGE_PIPELINE の設定:
+      process: プロセスプールで非同期に生成（リクエストはすぐに返る）
+      inline : リクエスト内で同期的に生成（比較・デバッグ用）
+      off    : 生成しない
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def init_app(self, app):
+        mode = app.config.get('IMAGE_PIPELINE', 'process')
+        if not HAS_PILLOW and mode != 'off':
+            app.logger.warning("Pillow is not installed; image variants will not be generated.")
+            mode = 'off'
+        app.config['IMAGE_PIPELINE'] = mode
+        self._pending = threading.BoundedSemaphore(app.config.get('IMAGE_PIPELINE_MAX_PENDING', 32))
+        app.extensions['image_pipeline'] = self
+
+    def _get_executor(self, app):
+        # Gunicorn の preload で fork された後は、ワーカーごとにプールを作り直す
+        with self._lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=app.config.get('IMAGE_PIPELINE_WORKERS', 2),
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def submit(self, app, item_id, filename, url_for_file):
+        """item_id の画像 filename の縮小版生成を開始する
+
+        url_for_file はファイル名から配信URLを作る関数（photos.url）。
+        バックグラウンドスレッドにはリクエストコンテキストが無いため、URL のひな形をここで作っておく。
+        """
+        mode = app.config['IMAGE_PIPELINE']
+        if mode == 'off' or not filename:
+            return
+
+        url_template = url_for_file(URL_PLACEHOLDER)
+        self.process(app, item_id, filename, url_template, background=(mode == 'process'))
+
+    def process(self, app, item_id, filename, url_template, background=True):
+        """縮小版を生成して item_id に保存する（url_template は URL_PLACEHOLDER を含む URL）"""
+        dest_dir = app.config['UPLOADED_PHOTOS_DEST']
+        source_path = os.path.join(dest_dir, filename)
+
+        # 同じ画像（コンテンツアドレスで同じファイル名）の縮小版が既にあれば、生成せずに使い回す
+        existing = self._existing_variants(item_id, filename)
+        if existing:
+            self._store(app, item_id, filename, existing, url_template)
+            return
+
+        if not background:
+            try:
+                variants = generate_variants(source_path, dest_dir, filename)
+                self._store(app, item_id, filename, variants, url_template)
+            except Exception as e:
+                app.logger.error(f"Image processing failed for item {item_id}: {e}", exc_info=True)
+            return
+
+        # キューが詰まっている場合はリクエストを待たせず、縮小版なし（元画像のみ）で続行する
+        if not self._pending.acquire(blocking=False):
+            app.logger.warning(f"Image pipeline is busy; skipped variants for item {item_id}")
+            return
+
+        future = self._get_executor(app).submit(generate_variants, source_path, dest_dir, filename)
+
+        def on_done(f):
+            try:
+                self._store(app, item_id, filename, f.result(), url_template)
+            except Exception as e:
+                app.logger.error(f"Image processing failed for item {item_id}: {e}", exc_info=True)
+            finally:
+                self._pending.release()
+
+        future.add_done_callback(on_done)
+
+    def _store(self, app, item_id, filename, variants, url_template):
+        """生成結果を Item に保存する（処理中に画像が差し替えられていた場合は破棄する）
+
+        縮小版は内容の変更ではないので、version を上げない UPDATE で保存する（管理者が持っている ETag で
+        次の If-Match 付きの更新が 412 にならないように）。GET の ETag には縮小版のハッシュが入るので、
+        本文が変わったのに 304 を返すことはない (concurrency.item_etag)。画像が同じ場合だけ更新するので、
+        並行する更新（画像以外の変更）があっても縮小版は失われない。
+        """
+        from sqlalchemy import update
+        from .database import SessionLocal
+        from .models import Item
+        from .cache import response_cache
+        from .config import blob_store
+
+        for v in variants:
+            v['url'] = url_template.replace(URL_PLACEHOLDER, v['filename'])
+
+        db = SessionLocal()
+        try:
+            updated = db.execute(
+                update(Item)
+                .where(Item.id == item_id, Item.image_filename == filename)
+                .values(image_variants=variants)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            db.commit()
+            if not updated:
+                # 処理中にアイテムが削除されたか画像が差し替えられた。他のアイテムも使っていなければ縮小版を消す
+                if not blob_store.is_referenced(db, filename):
+                    remove_variant_files(app.config['UPLOADED_PHOTOS_DEST'], variants)
+                return
+        finally:
+            db.close()
+
+        with app.app_context():
+            response_cache.invalidate()
+
+    def _existing_variants(self, item_id, filename):
+        """同じファイルを使っている他のアイテムの縮小版"""
+        from sqlalchemy import select
+        from .database import SessionLocal
+        from .models import Item
+
+        db = SessionLocal()
+        try:
+            variants = db.scalar(
+                select(Item.image_variants).where(
+                    Item.image_filename == filename, Item.id != item_id, Item.image_variants.is_not(None)
+                ).limit(1)
+            )
+        finally:
+            db.close()
+        if not variants:
+            return None
+        return [dict(v) for v in variants]
+
+    def shutdown(self):
+        if self._executor is not None and self._executor_pid == os.getpid():
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def remove_variant_files(dest_dir, variants):
+    for v in variants or []:
+        try:
+            os.remove(os.path.join(dest_dir, v['filename']))
+        except FileNotFoundError:
+            pass
+
+
+image_pipeline = ImagePipeline()
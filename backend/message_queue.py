@@ -0,0 +1,270 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+# 問い合わせフォームのメッセージをまとめて書き込む write-behind キュー
+#
+# save_message はバリデーション後にメッセージをキューに入れて 202 を返し、バックグラウンドのスレッドが
+# 件数 (MESSAGE_BATCH_SIZE) か時間 (MESSAGE_FLUSH_INTERVAL_MS) のどちらかに達したところで
+# 1トランザクションの executemany でまとめて INSERT する。
+#
+# キューに入れたメッセージは同時にジャーナルファイル（NDJSON）にも追記しておき、
+# 書き込み前にプロセスが落ちても次の起動時に再投入する。ジャーナルはプロセスごとに分け、
+# 生きているプロセスのジャーナルは flock で保護する。
+# ジャーナルはバッチを取り出すたびに新しいセグメントに切り替え、中身がすべてコミットされたセグメントから削除する
+# （負荷が途切れなくてもジャーナルが増え続けない）。
+
+
+class _Segment:
+    """ジャーナルの1ファイル。pending はこのファイルに書いたがまだDBにコミットしていない件数"""
+
+    def __init__(self, path):
+        # 別名で作って flock してから公開する（recover() がロック前の空のファイルを消さないように）。
+        # path が既にあれば FileExistsError
+        tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+        self.file = open(tmp_path, 'w', encoding='utf-8')
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.link(tmp_path, path)
+        except BaseException:
+            self.file.close()
+            raise
+        finally:
+            os.remove(tmp_path)
+        self.path = path
+        self.pending = 0
+
+    def remove(self):
+        self.file.close()
+        os.remove(self.path)
+
+
+class QueueFullError(Exception):
+    """キューが満杯でメッセージを受け付けられない（クライアントには 503 を返す）"""
+
+
+class MessageWriter:
+
+    def __init__(self):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._journal_lock = threading.Lock()
+        self._journal = None   # 追記中のセグメント
+        self._segments = []    # まだ削除していないセグメント（古い順。最後が self._journal）
+        self._sequence = 0
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['message_writer'] = self
+        if app.config['MESSAGE_WRITE_MODE'] == 'async':
+            self._queue = queue.Queue(maxsize=app.config['MESSAGE_QUEUE_SIZE'])
+            os.makedirs(app.config['MESSAGE_SPILL_DIR'], exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self._queue is not None
+
+    def _ensure_started(self):
+        # Gunicorn の preload で fork された後は、ワーカーごとにスレッドとジャーナルを用意する
+        if self._pid == os.getpid():
+            return
+        with self._journal_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._queue = queue.Queue(maxsize=self.app.config['MESSAGE_QUEUE_SIZE'])
+            self._segments = []
+            self._open_segment()
+
+            # 落ちたプロセスが残したジャーナルの再投入も、このスレッドが最初に行う（enqueue は待たせない）
+            self._thread = threading.Thread(target=self._run, name='message-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _open_segment(self):
+        """新しいセグメントを開いて追記先にする（_journal_lock を持って呼ぶ）"""
+        while True:
+            self._sequence += 1
+            path = os.path.join(self.app.config['MESSAGE_SPILL_DIR'],
+                                f'messages-{self._pid}-{self._sequence:06d}.ndjson')
+            try:
+                segment = _Segment(path)
+                break
+            except FileExistsError:
+                continue  # コンテナの再起動などで同じ pid の古いジャーナルが残っている（再投入の対象なので残す）
+        self._journal = segment
+        self._segments.append(segment)
+
+    def enqueue(self, username, email, message, client_id):
+        """メッセージをキューに入れる。満杯なら QueueFullError"""
+        self._ensure_started()
+        record = {
+            'client_id': client_id,
+            'username': username,
+            'email': email,
+            'message': message,
+            'created_at': datetime.now(timezone.utc).isoformat(), # 受け付けた時刻 (UTC)
+        }
+        with self._journal_lock:
+            segment = self._journal
+            try:
+                self._queue.put_nowait((segment, record))
+            except queue.Full:
+                raise QueueFullError()
+            segment.file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            segment.file.flush()
+            if self.app.config['MESSAGE_SPILL_FSYNC']:
+                os.fsync(segment.file.fileno())
+            segment.pending += 1
+
+    def _run(self):
+        batch_size = self.app.config['MESSAGE_BATCH_SIZE']
+        interval = self.app.config['MESSAGE_FLUSH_INTERVAL_MS'] / 1000
+
+        try:
+            self.recover()
+        except Exception as e:
+            self.app.logger.error(f"Failed to recover queued messages: {e}", exc_info=True)
+
+        while not (self._stop.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=interval)]
+            except queue.Empty:
+                continue
+
+            # 最初の1件から interval 秒以内に届いたものをまとめる
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._write_with_retry(batch)
+
+    def _write_with_retry(self, batch):
+        segments = [segment for segment, _ in batch]
+        records = [record for _, record in batch]
+        with self._journal_lock:
+            # このバッチを含むセグメントには以後追記しない（コミットしたら削除できるようにする）
+            if self._journal in segments:
+                self._open_segment()
+
+        delay = 0.1
+        while True:
+            try:
+                self._write(records)
+                break
+            except Exception as e:
+                self.app.logger.error(f"Failed to write {len(batch)} message(s), retrying: {e}", exc_info=True)
+                if self._stop.is_set() and delay > 5:
+                    # 終了処理中に書き込めない場合はジャーナルに残したまま諦める（次回起動時に再投入）
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, 10)
+
+        with self._journal_lock:
+            for segment in segments:
+                segment.pending -= 1
+            # 全件コミット済みになった（追記中ではない）セグメントを削除する
+            for segment in [s for s in self._segments if s.pending == 0 and s is not self._journal]:
+                segment.remove()
+                self._segments.remove(segment)
+
+    def _write(self, records):
+        """1トランザクションの executemany でまとめて INSERT する（client_id が既にあるものは除く）"""
+        from sqlalchemy import insert, select
+        from .database import SessionLocal
+        from .models import Message
+
+        db = SessionLocal()
+        try:
+            # クライアントの再送などで同じ client_id が含まれていても1件だけ書き込む
+            unique = {}
+            for r in records:
+                unique.setdefault(r['client_id'], r)
+            existing = set(db.scalars(select(Message.client_id).where(Message.client_id.in_(list(unique)))))
+            rows = [
+                {**r, 'created_at': datetime.fromisoformat(r['created_at'])}
+                for client_id, r in unique.items() if client_id not in existing
+            ]
+            if rows:
+                db.execute(insert(Message), rows)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def recover(self):
+        """他の（終了済みの）プロセスが残したジャーナルのメッセージを書き込んで削除する"""
+        pattern = os.path.join(self.app.config['MESSAGE_SPILL_DIR'], 'messages-*.ndjson')
+        with self._journal_lock:
+            own = {segment.path for segment in self._segments}
+        for path in sorted(glob.glob(pattern)):
+            if path in own:
+                continue
+            with open(path, 'r+', encoding='utf-8') as f:
+                try:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # 生きているワーカーのジャーナル
+                records = self._read_journal(path, f)
+                if records:
+                    batch_size = self.app.config['MESSAGE_BATCH_SIZE']
+                    for i in range(0, len(records), batch_size):
+                        self._write(records[i:i + batch_size])
+                    self.app.logger.info(f"Recovered {len(records)} queued message(s) from {path}")
+                os.remove(path)
+
+    def _read_journal(self, path, f):
+        """ジャーナルのレコードを読む
+
+        追記の途中でプロセスが終了すると、最後の行が途中までしか書かれていないことがある。
+        その行（書き込みの途中で終了したので、そのリクエストには 202 を返していない）は警告を出して捨て、
+        残りのレコードと他のセグメントの回復は続ける。
+        """
+        records = []
+        lines = [line for line in f if line.strip()]
+        for number, line in enumerate(lines, 1):
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                where = 'partial last line' if number == len(lines) else f'corrupt line {number}'
+                self.app.logger.warning(f"Dropped the {where} of {path}: {line[:80]!r}")
+        return records
+
+    def shutdown(self, timeout=30):
+        """キューに残っているメッセージを書き込んでからスレッドを止める"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._pid = None
+        with self._journal_lock:
+            # コミットできなかったメッセージのセグメントは次回起動時の再投入のために残す
+            for segment in self._segments:
+                if segment.pending == 0:
+                    segment.remove()
+                else:
+                    segment.file.close()
+            self._segments = []
+            self._journal = None
+
+
+message_writer = MessageWriter()
@@ -0,0 +1,274 @@
+import hmac
+import time
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from flask import request
+from sqlalchemy import event
+from werkzeug.wsgi import ClosingIterator
+
+# リクエストごとのレイテンシと SQL の実行回数・時間を集計し、/metrics で Prometheus のテキスト形式で公開する
+#
+#   http_requests_total{endpoint, method, status}          リクエスト数
+#   http_request_duration_seconds{endpoint, method}         レイテンシのヒストグラム
+#   db_queries_per_request{endpoint}                        1リクエストあたりの SQL 実行回数のヒストグラム
+#   db_time_per_request_seconds{endpoint}                   1リクエストあたりの SQL 実行時間の合計のヒストグラム
+#   db_query_duration_seconds{endpoint}                     SQL 1回ごとの実行時間のヒストグラム
+#   db_slow_queries_total{endpoint}                         METRICS_SLOW_QUERY_MS を超えた SQL の数
+#
+# リクエスト外（画像パイプラインやメッセージの書き込みスレッドなど）で実行された SQL は endpoint="background" になる。
+# 値はプロセスごとに持つため、Gunicorn の複数ワーカー構成では /metrics を返したワーカーの値だけが見える。
+# 既定では無効 (METRICS_ENABLED=False)。METRICS_TOKEN を設定すると /metrics は Authorization: Bearer <token> が必要になる。
+
+# 秒単位のバケット（Prometheus クライアントの既定値と同じ）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+BACKGROUND = 'background'
+
+# 実行中のリクエストの集計（リクエスト外では None）
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestStats:
+    __slots__ = ('environ', 'started', 'queries', 'db_seconds', '_endpoint')
+
+    def __init__(self, environ):
+        self.environ = environ
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self._endpoint = None
+
+    @property
+    def endpoint(self):
+        # Flask の Request は environ に自身を登録するので、そこからルーティング結果を参照する
+        if self._endpoint is None:
+            request = self.environ.get('werkzeug.request')
+            rule = getattr(request, 'url_rule', None)
+            if rule is None:
+                return 'unmatched'  # まだルーティング前
+            self._endpoint = rule.endpoint
+        return self._endpoint
+
+
+class Histogram:
+    """ラベルの組ごとの累積バケット・合計・件数"""
+
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [バケットごとの件数..., 合計, 件数]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            base = _format_labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {values[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {values[-1]}")
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{{{_format_labels(self.label_names, labels)}}} {value}")
+        return lines
+
+
+def _format_labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """リクエストと SQL の計測（METRICS_ENABLED が False ならフックもリスナーも登録しない）"""
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_seconds = None
+        self.token = None
+        self._engines = set()
+        self._started_at = time.time()
+
+        buckets = DEFAULT_BUCKETS
+        self.requests = Counter('http_requests_total', 'Total HTTP requests.', ('endpoint', 'method', 'status'))
+        self.latency = Histogram('http_request_duration_seconds', 'HTTP request latency in seconds.',
+                                 ('endpoint', 'method'), buckets)
+        self.queries_per_request = Histogram('db_queries_per_request', 'SQL statements executed per request.',
+                                             ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.db_time_per_request = Histogram('db_time_per_request_seconds',
+                                             'Total SQL execution time per request in seconds.', ('endpoint',), buckets)
+        self.query_latency = Histogram('db_query_duration_seconds', 'SQL statement execution time in seconds.',
+                                       ('endpoint',), buckets)
+        self.slow_queries = Counter('db_slow_queries_total', 'SQL statements slower than the slow query threshold.',
+                                    ('endpoint',))
+
+    def init_app(self, app, engines=()):
+        app.extensions['metrics'] = self
+        self.enabled = app.config['METRICS_ENABLED']
+        if not self.enabled:
+            return
+
+        self.logger = app.logger
+        self.token = app.config.get('METRICS_TOKEN')
+        if not self.token:
+            app.logger.warning("METRICS_TOKEN is not set; /metrics is readable by anyone who can reach the server.")
+        self.slow_query_seconds = app.config['METRICS_SLOW_QUERY_MS'] / 1000
+        buckets = app.config.get('METRICS_BUCKETS')
+        if buckets:
+            self.latency.buckets = self.db_time_per_request.buckets = self.query_latency.buckets = tuple(sorted(buckets))
+
+        for engine in engines:
+            self.instrument_engine(engine)
+
+        # Flask の before/after_request フックではなく WSGI のミドルウェアで計測する。
+        # フックは呼び出しごとのオーバーヘッドがあるうえ、他の before_request（障害注入など）の時間を含められず、
+        # after_request はストリーミングのレスポンス（一括エクスポートなど）の本文を送る前に呼ばれてしまう。
+        # ミドルウェアなら本文を送り終えて close() されたときに記録できる
+        app.wsgi_app = self._wrap(app.wsgi_app)
+        app.add_url_rule('/metrics', 'metrics', self.render_response)
+
+    def instrument_engine(self, engine):
+        """engine に SQL の計測用リスナーを登録する（同じ engine には1度だけ）"""
+        if engine in self._engines:
+            return
+        self._engines.add(engine)
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _wrap(self, wsgi_app):
+        def instrumented_app(environ, start_response):
+            stats, token = self.begin(environ)
+            result = []
+
+            def capture_start_response(status_line, headers, exc_info=None):
+                # リクエストコンテキストが終了すると Request を参照できなくなるため、ここでエンドポイントを取り出す
+                result.append((stats.endpoint, status_line.split(' ', 1)[0]))
+                return start_response(status_line, headers, exc_info)
+
+            def finish():
+                endpoint, status = result[-1] if result else ('unmatched', '500')
+                self.end((stats, token), endpoint, environ['REQUEST_METHOD'], status)
+
+            try:
+                app_iter = wsgi_app(environ, capture_start_response)
+            except BaseException:
+                finish()
+                raise
+            # 本文を送り終えて close() されたときに記録する（ストリーミング中の SQL もこのリクエストに数える）
+            return ClosingIterator(app_iter, finish)
+
+        return instrumented_app
+
+    def begin(self, environ):
+        """リクエストの計測を開始する。戻り値は end() に渡す
+
+        WSGI ミドルウェアを通らない非同期ビュー (asgi.py) からも呼ばれる。無効な場合は None を返す。
+        """
+        if not self.enabled:
+            return None
+        stats = RequestStats(environ)
+        return stats, _current.set(stats)
+
+    def end(self, handle, endpoint, method, status):
+        if handle is None:
+            return
+        stats, token = handle
+        try:
+            _current.reset(token)
+        except ValueError:
+            _current.set(None)  # サーバーが別のコンテキストで close() を呼んだ
+        self._observe_request(stats, endpoint, method, status)
+
+    def _observe_request(self, stats, endpoint, method, status):
+        self.latency.observe((endpoint, method), time.perf_counter() - stats.started)
+        self.requests.inc((endpoint, method, status))
+        self.queries_per_request.observe((endpoint,), stats.queries)
+        self.db_time_per_request.observe((endpoint,), stats.db_seconds)
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_started', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+
+        stats = _current.get()
+        endpoint = BACKGROUND
+        if stats is not None:
+            endpoint = stats.endpoint
+            stats.queries += 1
+            stats.db_seconds += elapsed
+
+        self.query_latency.observe((endpoint,), elapsed)
+        if elapsed >= self.slow_query_seconds:
+            self.slow_queries.inc((endpoint,))
+            self.logger.warning(
+                f"Slow query ({elapsed * 1000:.1f} ms, endpoint={endpoint}): {' '.join(statement.split())[:500]}"
+            )
+
+    def render(self):
+        lines = [
+            '# HELP process_start_time_seconds Start time of the process since unix epoch in seconds.',
+            '# TYPE process_start_time_seconds gauge',
+            f'process_start_time_seconds {self._started_at:.3f}',
+        ]
+        for metric in (self.requests, self.latency, self.queries_per_request, self.db_time_per_request,
+                       self.query_latency, self.slow_queries):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def render_response(self):
+        if self.token:
+            scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+            if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), self.token.encode()):
+                return 'Unauthorized\n', 401, {'Content-Type': 'text/plain; charset=utf-8',
+                                                'WWW-Authenticate': 'Bearer'}
+        return self.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # 開始時刻は実行ごとの ExecutionContext に持たせる（失敗した場合も後始末が要らない）
+    context._metrics_started = time.perf_counter()
+
+
+metrics = Metrics()
@@ -1,11 +1,10 @@
 from datetime import datetime # datetime型を型ヒントで使用
-from sqlalchemy import String, DateTime, Integer, CheckConstraint, Text
+from sqlalchemy import String, DateTime, Integer, CheckConstraint, Text, Index, JSON
 from sqlalchemy.orm import Mapped, mapped_column
 # func オブジェクトは、SQLAlchemyがデータベースサーバー側で実行されるSQL関数を表現するためのものです。
 # SQLAlchemyがデータベースの方言 (dialect) に応じて適切なSQL関数に変換してくれる抽象的な表現
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from .database import Base
-from pydantic import BaseModel, EmailStr, constr, Field, ValidationError
 
 
 # str | None は Python 3.10以降で導入された標準の型ヒント構文で、
@@ -22,8 +21,25 @@ class Item(Base):
     image_url: Mapped[str | None] = mapped_column(String(500), nullable=True)
     # 画像のファイル名も保存（削除時などに便利）サーバー上のファイル管理用
     image_filename: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # 画像パイプラインが生成した縮小版 [{"format", "width", "height", "filename", "bytes", "url"}, ...]
+    image_variants: Mapped[list | None] = mapped_column(JSON(none_as_null=True), nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    # 楽観的排他制御用のバージョン番号。更新のたびに1ずつ増え、GET /api/item/<id> の ETag になる (concurrency.py)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, server_default=text('1'))
+
+    # 一覧取得のカーソルページネーション (updated_at DESC, id DESC) 用の複合インデックス
+    # カテゴリで絞り込んで価格順 / 新着順に並べる絞り込み検索 (facets.py) 用の複合インデックス
+    # SQLite では AUTOINCREMENT にして、削除したアイテムの id を再利用しない
+    # （ETag "<id>.<version>" が、削除後に作られた別のアイテムと一致しないように）
+    __table_args__ = (
+        Index('ix_items_updated_at_id', 'updated_at', 'id'),
+        Index('ix_items_category_price', 'category', 'price'),
+        Index('ix_items_category_updated_at', 'category', 'updated_at'),
+        {'sqlite_autoincrement': True},
+    )
+    # ORM での更新時に WHERE version = <読み込んだ値> を付け、他のリクエストに先に更新されていれば StaleDataError にする
+    __mapper_args__ = {'version_id_col': version}
 
     def __repr__(self):
         return f"<Item(id={self.id}, name={self.name}, category={self.category}, price={self.price})>"
@@ -36,32 +52,59 @@ class Item(Base):
             "category": self.category,
             "price": self.price,
             "image_url": self.image_url,
+            "image_variants": self.public_variants(self.image_variants),
+            "image_srcset": self.build_srcset(self.image_variants),
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
 
+    @staticmethod
+    def public_variants(variants):
+        """クライアントに返す縮小版の情報（サーバー内部のファイル名などは含めない）"""
+        if not variants:
+            return None
+        return [
+            {"format": v["format"], "width": v["width"], "height": v["height"], "url": v["url"]}
+            for v in variants
+        ]
+
+    @staticmethod
+    def build_srcset(variants):
+        """<img srcset> / <source srcset> にそのまま使える形式ごとの文字列
+        例: {"webp": "https://.../a-320w.webp 320w, https://.../a-640w.webp 640w"}
+        """
+        if not variants:
+            return None
+        srcset = {}
+        for v in sorted(variants, key=lambda v: v["width"]):
+            srcset.setdefault(v["format"], []).append(f'{v["url"]} {v["width"]}w')
+        return {fmt: ", ".join(entries) for fmt, entries in srcset.items()}
+
+
+# コンテンツアドレス方式で保存したアップロードファイルと、その参照カウント
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    filename: Mapped[str] = mapped_column(String(255), primary_key=True) # sha256 + 拡張子
+    size: Mapped[int] = mapped_column(Integer)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<Blob(filename={self.filename}, size={self.size}, ref_count={self.ref_count})>"
 
-class ItemCreate(BaseModel):
-    name: str = Field(..., max_length=100)
-    description: str | None = Field(None, max_length=1000)
-    category: str = Field(..., max_length=50)
-    price: int = Field(..., gt=0)
-    # image_url と image_filename はファイルアップロード後に設定するため、
-    # リクエストボディからは提供されないことを想定し Optional で良い。
-    image_url: str | None = Field(None, max_length=500)
-    image_filename: str | None = Field(None, max_length=255)
-    # id, created_at, updated_at はDB側で自動生成されるため、入力には含めない
 
+# カテゴリ × 価格帯ごとのアイテム数（絞り込み検索のファセット用の集計テーブル）
+# アイテムの作成・更新・削除のたびに facets.py の record_changes() で増減させ、リクエストごとに items を集計し直さない
+class ItemFacetCount(Base):
+    __tablename__ = "item_facet_counts"
 
-class ItemUpdate(BaseModel):
-    name: str | None = Field(..., max_length=100)
-    description: str | None = Field(None, max_length=1000)
-    category: str | None = Field(..., max_length=50)
-    price: int | None = Field(..., gt=0)
-    # image_url と image_filename はファイルアップロード後に設定するため、
-    # リクエストボディからは提供されないことを想定し Optional で良い。
-    image_url: str | None = Field(None, max_length=500)
-    image_filename: str | None = Field(None, max_length=255)
+    category: Mapped[str] = mapped_column(String(50), primary_key=True)
+    price_bucket: Mapped[int] = mapped_column(Integer, primary_key=True) # facets.PRICE_BUCKETS のインデックス
+    count: Mapped[int] = mapped_column(Integer, default=0)
+
+    def __repr__(self):
+        return f"<ItemFacetCount(category={self.category}, price_bucket={self.price_bucket}, count={self.count})>"
 
 
 class Message(Base):
@@ -71,6 +114,8 @@ class Message(Base):
     username: Mapped[str] = mapped_column(String(50), index=True)
     email: Mapped[str] = mapped_column(String(100), index=True)
     message: Mapped[str] = mapped_column(Text)
+    # クライアント（またはサーバー）が生成した UUID。非同期で書き込む場合の重複防止と、202 で返す受付番号に使う
+    client_id: Mapped[str | None] = mapped_column(String(36), unique=True, index=True, nullable=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now()
 )
 
@@ -88,12 +133,6 @@ class Message(Base):
             "username": self.username,
             "email": self.email,
             "message": self.message,
+            "client_id": self.client_id,
             "created_at": self.created_at.isoformat() if self.created_at else None
         }
-
-
-class MessageCreateSchema(BaseModel):
-    # ...は、そのフィールドが必須であることを示します。
-    username: str = Field(..., min_length=1, max_length=50, description="ユーザー名")
-    email: EmailStr = Field(..., description="メールアドレス") # EmailStrがメール形式を検証
-    message: str = Field(..., min_length=1, description="メッセージ本文")
\ No newline at end of file
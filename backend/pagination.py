@@ -0,0 +1,150 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import select, desc, or_, and_, literal, type_coerce, String
+from .models import Item
+from .serialization import ITEM_SERIALIZER
+
+# 1ページあたりの件数の既定値と上限
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+
+# ids= で一度に取得できるアイテム数の上限
+MAX_BATCH_IDS = 100
+
+# fields= で指定できる列（Item.to_dict() のキーと同じ）
+ITEM_FIELDS = tuple(ITEM_SERIALIZER.names)
+
+# format= で指定できるレスポンスの形式
+OUTPUT_FORMATS = ('objects', 'columnar')
+
+
+class PaginationError(ValueError):
+    """limit / cursor / fields パラメータが不正な場合のエラー"""
+
+
+def parse_limit(value):
+    if value is None or value == '':
+        return DEFAULT_LIMIT
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('"limit" must be an integer.')
+    if limit < 1:
+        raise PaginationError('"limit" must be greater than 0.')
+    return min(limit, MAX_LIMIT)
+
+
+def parse_fields(value):
+    """fields=name,price のような指定を列名のリストに変換する（未指定なら全列）"""
+    if not value:
+        return list(ITEM_FIELDS)
+    fields = [f.strip() for f in value.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in ITEM_FIELDS]
+    if unknown:
+        raise PaginationError(f'Unknown fields: {", ".join(unknown)}')
+    # 重複を除きつつ指定順を保つ
+    return list(dict.fromkeys(fields))
+
+
+def parse_format(value):
+    """format=objects（既定）/ columnar"""
+    if value is None or value == '':
+        return 'objects'
+    if value not in OUTPUT_FORMATS:
+        raise PaginationError(f'"format" must be one of: {", ".join(OUTPUT_FORMATS)}')
+    return value
+
+
+def parse_ids(value):
+    """ids=1,5,9 をアイテム id のリストに変換する（重複を除きつつ指定順を保つ）"""
+    try:
+        ids = [int(v) for v in value.split(',') if v.strip()]
+    except ValueError:
+        raise PaginationError('"ids" must be a comma-separated list of integers.')
+    if not ids:
+        raise PaginationError('"ids" must not be empty.')
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > MAX_BATCH_IDS:
+        raise PaginationError(f'"ids" accepts at most {MAX_BATCH_IDS} ids.')
+    return ids
+
+
+def encode_cursor(value, item_id):
+    # クライアントからは中身が見えない（意識しなくてよい）不透明な文字列にする
+    payload = json.dumps([value, item_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, value_types=(str,)):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, item_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(value, value_types) or not isinstance(item_id, int):
+            raise ValueError
+        return value, item_id
+    except (ValueError, TypeError):
+        raise PaginationError('Invalid cursor.')
+
+
+def bind_cursor_timestamp(db, value):
+    """カーソルに入れた updated_at を、比較に使うバインドパラメータにする（日時として解釈できなければ PaginationError）
+
+    SQLite では DateTime が文字列で保存されているので、取り出したときの文字列のまま比較する
+    （datetime に変換してバインドし直すと、マイクロ秒の有無で文字列表現が変わり同一時刻の行を正しく比較できない）。
+    それ以外のデータベースでは datetime に変換し、列と同じ型でバインドする。
+    """
+    try:
+        timestamp = datetime.fromisoformat(value)
+    except ValueError:
+        raise PaginationError('Invalid cursor.')
+    if db.get_bind().dialect.name == 'sqlite':
+        return literal(value, String)
+    return literal(timestamp, Item.updated_at.type)
+
+
+def fetch_item_page(db, limit, cursor=None, fields=None):
+    """(updated_at, id) の降順でキーセットページネーションを行う
+
+    ORMオブジェクトは作らず、列のみの select() で必要な列だけを取得する。
+    戻り値は (行のリスト, 次ページのカーソル or None)。行は ITEM_SERIALIZER.subset(fields) でそのままエンコードできる。
+    """
+    serializer = ITEM_SERIALIZER.subset(fields or ITEM_FIELDS)
+
+    # カーソル用の値は DB に保存されている形式のまま取り出す（比較のしかたは bind_cursor_timestamp を参照）
+    cursor_ts = type_coerce(Item.updated_at, String).label('_cursor_updated_at')
+    cursor_id = Item.id.label('_cursor_id')
+
+    stmt = select(*serializer.columns, cursor_ts, cursor_id)
+
+    if cursor:
+        last_ts, last_id = decode_cursor(cursor)
+        last_ts = bind_cursor_timestamp(db, last_ts)
+        stmt = stmt.where(
+            or_(
+                Item.updated_at < last_ts,
+                and_(Item.updated_at == last_ts, Item.id < last_id),
+            )
+        )
+
+    # 次ページの有無を判定するために1件多く取得する
+    stmt = stmt.order_by(desc(Item.updated_at), desc(Item.id)).limit(limit + 1)
+    rows = db.execute(stmt).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(str(last._cursor_updated_at), last._cursor_id)
+
+    return rows, next_cursor
+
+
+def fetch_items_by_id(db, ids, fields=None):
+    """ids のアイテムを1回の IN クエリで取得し、{id: 行} を返す（存在しない id は含まない）
+
+    行は ITEM_SERIALIZER.subset(fields) でそのままエンコードできる（末尾に id の列を足している）。
+    """
+    serializer = ITEM_SERIALIZER.subset(fields or ITEM_FIELDS)
+    rows = db.execute(select(*serializer.columns, Item.id.label('_batch_id')).where(Item.id.in_(ids))).all()
+    return {row._batch_id: row for row in rows}
@@ -0,0 +1,77 @@
+import sqlite3
+import time
+from flask import request
+from . import database
+
+# リードレプリカへの振り分けの Flask 側の処理
+#
+# 参照系のエンドポイント (get_read_db) のセッションは database.RoutingSession で、SELECT を
+# database.replica_pool のレプリカに送る。レプリカは書き込みの反映が遅れることがあるため、
+# 書き込みに成功したクライアントには READ_YOUR_WRITES_SECONDS 秒の Cookie を付け、その間の参照は
+# プライマリに送る（自分が登録・更新した内容が一覧に出ない、ということを避ける）。
+# Cookie はクライアント側に残るため、どのアプリのノードにリクエストが届いても同じように振り分けられる。
+
+COOKIE_NAME = 'db_primary_until'
+
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class ReadYourWrites:
+    def __init__(self):
+        self.window = 0
+
+    def init_app(self, app):
+        app.extensions['read_your_writes'] = self
+        # レプリカを使っていない（SQLite の同じファイルを読み込み専用で開いているだけの）場合は何もしない
+        self.window = app.config['READ_YOUR_WRITES_SECONDS'] if database.replica_pool.replicated else 0
+        if not self.window:
+            return
+
+        @app.after_request
+        def mark_recent_write(response):
+            if request.method in WRITE_METHODS and response.status_code < 400:
+                until = time.time() + self.window
+                response.set_cookie(COOKIE_NAME, f'{until:.3f}', max_age=self.window, httponly=True, samesite='Lax')
+            return response
+
+    def prefer_primary(self):
+        """このリクエストの参照をプライマリに送るべきか（直前に書き込みをしたクライアント）"""
+        if not self.window:
+            return False
+        try:
+            return float(request.cookies.get(COOKIE_NAME, 0)) > time.time()
+        except ValueError:
+            return False
+
+
+read_your_writes = ReadYourWrites()
+
+
+def sync_sqlite_replicas(log=print):
+    """プライマリの SQLite ファイルの内容を、DATABASE_REPLICA_URLS の SQLite ファイルにコピーする
+
+    ローカルで複数のファイルをレプリカの代わりに使うためのもの（バックアップ API で一貫した状態をコピーする）。
+    レプリカは読み込み専用で開くため、ジャーナルモードは DELETE にしておく。
+    """
+    primary = database.engine
+    if primary.dialect.name != 'sqlite':
+        raise ValueError("sync-replicas only supports SQLite databases.")
+
+    copied = 0
+    for replica in database.replica_pool.replicas:
+        if replica is primary or replica is database.read_engine:
+            continue
+        path = replica.url.database.removeprefix('file:')
+        source = primary.raw_connection()
+        try:
+            target = sqlite3.connect(path)
+            try:
+                source.driver_connection.backup(target)
+                target.execute('PRAGMA journal_mode=DELETE')
+            finally:
+                target.close()
+        finally:
+            source.close()
+        log(f"Copied the primary database to {path}")
+        copied += 1
+    return copied
@@ -0,0 +1,307 @@
+import fcntl
+import gzip
+import io
+import json
+import os
+import re
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from sqlalchemy import select, delete
+from .models import Message
+from .serialization import MESSAGE_SERIALIZER
+
+try:
+    from compression import zstd  # Python 3.14 以降の標準ライブラリ
+except ImportError:
+    zstd = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# 問い合わせメッセージの保存期間とアーカイブ
+#
+# flask archive-messages は created_at が保存期間 (MESSAGE_RETENTION_DAYS) を過ぎたメッセージを id 順に
+# batch_size 件ずつ読み、作成月ごとのファイル (messages-YYYY-MM.ndjson.zst / .ndjson.gz) に追記してから DB から削除する。
+# 1バッチを1つの圧縮フレーム（gzip ではメンバー）として追記するので、既存のファイルを展開し直さずに何度でも追記でき、
+# 読み込みは連結されたフレームを先頭から順に展開するだけでよい。ファイルへの書き込みを fsync してから削除をコミットするため、
+# 途中で落ちても消えるメッセージはない（落ちた場合は同じメッセージが2回書かれることがあるが、読み込み時に id で除く）。
+#
+# flask query-message-archive はファイル名の月で対象のファイルを絞り、1行ずつ展開しながら条件に合うものだけを返す
+# （ファイル全体をメモリに展開しない）。
+#
+# 削除で空いたページは SQLite の auto_vacuum=INCREMENTAL (PRAGMA incremental_vacuum) で少しずつファイルから切り詰める。
+# 全体の VACUUM と違って短い書き込みトランザクションに分けられるので、問い合わせの INSERT を長く止めない。
+# 既存のデータベースを INCREMENTAL にするには1度だけ VACUUM が必要で、init_db() で行う。
+
+ARCHIVE_COMPRESSIONS = ('zstd', 'gzip')
+ARCHIVE_SUFFIXES = {'zstd': '.ndjson.zst', 'gzip': '.ndjson.gz'}
+# 1度書けば何度も読まないので、レスポンスの圧縮 (compression.py) より高い圧縮レベルを使う
+ARCHIVE_LEVELS = {'zstd': 10, 'gzip': 9}
+DEFAULT_BATCH_SIZE = 5000
+
+PARTITION_RE = re.compile(r'messages-(\d{4}-\d{2})\.ndjson\.(zst|gz)')
+
+# MESSAGE_SERIALIZER の列の位置
+_ID, _CREATED_AT = MESSAGE_SERIALIZER.names.index('id'), MESSAGE_SERIALIZER.names.index('created_at')
+
+
+class ArchiveError(ValueError):
+    """アーカイブの設定やファイルが不正な場合のエラー"""
+
+
+def resolve_compression(name='auto'):
+    """MESSAGE_ARCHIVE_COMPRESSION の値から圧縮形式を決める（auto は zstd が使えれば zstd、無ければ gzip）"""
+    has_zstd = zstd is not None or zstandard is not None
+    if name == 'auto':
+        return 'zstd' if has_zstd else 'gzip'
+    if name not in ARCHIVE_COMPRESSIONS:
+        raise ArchiveError(f"MESSAGE_ARCHIVE_COMPRESSION must be one of: auto, {', '.join(ARCHIVE_COMPRESSIONS)}")
+    if name == 'zstd' and not has_zstd:
+        raise ArchiveError("zstd compression requires Python 3.14 or the zstandard package.")
+    return name
+
+
+def _compress(data, compression):
+    level = ARCHIVE_LEVELS[compression]
+    if compression == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if zstd is not None:
+        return zstd.compress(data, level=level)
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _open_partition(path):
+    """アーカイブのファイルを展開しながら読むバイナリストリーム（連結されたフレームをすべて読む）"""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if zstd is not None:
+        return zstd.open(path, 'rb')
+    if zstandard is None:
+        raise ArchiveError(f"Cannot read {path}: zstd requires Python 3.14 or the zstandard package.")
+    reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), read_across_frames=True)
+    return io.BufferedReader(reader)
+
+
+def _as_utc(value):
+    """タイムゾーンの無い日時（SQLite に保存された値）は UTC として扱う"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+@contextmanager
+def _archive_lock(directory):
+    # 同じディレクトリへのアーカイブを同時に実行しない（同じ行を2つのプロセスが書き出さないように）
+    with open(os.path.join(directory, '.lock'), 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise ArchiveError(f"Another archive-messages is running for {directory}.")
+        yield
+
+
+class ArchiveResult:
+    def __init__(self):
+        self.archived = 0
+        self.batches = 0
+        self.partitions = {}  # ファイル名 -> 追記した件数
+        self.bytes_written = 0
+
+    def to_dict(self):
+        return {
+            'archived': self.archived,
+            'batches': self.batches,
+            'partitions': dict(sorted(self.partitions.items())),
+            'bytes_written': self.bytes_written,
+        }
+
+
+def archive_messages(db, directory, before, batch_size=DEFAULT_BATCH_SIZE, compression='auto'):
+    """created_at が before より前のメッセージを作成月ごとのファイルに移し、DB から削除する
+
+    id の昇順に batch_size 件ずつ処理する（メモリ使用量はバッチの大きさで決まる）。各バッチは
+    SELECT（読み込みのみで終了）→ ファイルに追記して fsync → DELETE してコミット の順に行う。
+    読み込みと削除を別のトランザクションにするのは、SQLite の WAL で読み込みトランザクションを書き込みに昇格させると、
+    その間に他の接続（問い合わせの INSERT）がコミットしていた場合に待たずに失敗するため。
+    """
+    compression = resolve_compression(compression)
+    before = _as_utc(before)
+    os.makedirs(directory, exist_ok=True)
+    result = ArchiveResult()
+
+    with _archive_lock(directory):
+        last_id = 0
+        while True:
+            rows = db.execute(
+                select(*MESSAGE_SERIALIZER.columns)
+                .where(Message.id > last_id, Message.created_at < before)
+                .order_by(Message.id)
+                .limit(batch_size)
+            ).all()
+            db.rollback()  # 読み込みのトランザクションを終える
+            if not rows:
+                break
+            last_id = rows[-1][_ID]
+
+            months = {}
+            for row in rows:
+                months.setdefault(_as_utc(row[_CREATED_AT]).strftime('%Y-%m'), []).append(row)
+            for month, group in months.items():
+                name = f'messages-{month}{ARCHIVE_SUFFIXES[compression]}'
+                result.bytes_written += _append_frame(
+                    os.path.join(directory, name), _compress(MESSAGE_SERIALIZER.encode_ndjson(group), compression)
+                )
+                result.partitions[name] = result.partitions.get(name, 0) + len(group)
+
+            try:
+                db.execute(
+                    delete(Message)
+                    .where(Message.id.in_([row[_ID] for row in rows]))
+                    .execution_options(synchronize_session=False)
+                )
+                db.commit()
+            except Exception:
+                db.rollback()
+                raise
+            result.archived += len(rows)
+            result.batches += 1
+    return result
+
+
+def _append_frame(path, frame):
+    """圧縮済みのフレームをファイルの末尾に追記して fsync する。失敗したら追記前のサイズに戻す"""
+    with open(path, 'ab') as f:
+        size = f.tell()
+        try:
+            f.write(frame)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.truncate(size)
+            raise
+    return len(frame)
+
+
+def list_partitions(directory, since=None, until=None):
+    """アーカイブのファイルを月の順に [(月 'YYYY-MM', パス), ...] で返す（since / until の月に掛からないものは除く）
+
+    MESSAGE_ARCHIVE_COMPRESSION を変えた場合は、同じ月に .zst と .gz の両方のファイルがある。
+    """
+    if not os.path.isdir(directory):
+        return []
+    first = _as_utc(since).strftime('%Y-%m') if since else None
+    last = _as_utc(until).strftime('%Y-%m') if until else None
+    partitions = []
+    for name in os.listdir(directory):
+        match = PARTITION_RE.fullmatch(name)
+        if not match:
+            continue
+        month = match.group(1)
+        if (first and month < first) or (last and month > last):
+            continue
+        partitions.append((month, os.path.join(directory, name)))
+    return sorted(partitions)
+
+
+def _needle(value):
+    # JSON の文字列としてエンコードされた形（前後の引用符を除く）。行を JSON として読む前の絞り込みに使う
+    return json.dumps(value, ensure_ascii=False)[1:-1].encode()
+
+
+def iter_archived_messages(directory, since=None, until=None, username=None, email=None, contains=None):
+    """アーカイブのメッセージのうち条件に合うものを作成月の順に返すジェネレータ
+
+    since 以上 until 未満の created_at、username / email の完全一致、本文の部分一致 (contains) で絞り込む。
+    ファイルは1行ずつ展開して読むため、メモリ使用量はファイルの大きさによらない
+    （同じ月の重複を除くための id の集合だけは保持する）。
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    since = _as_utc(since) if since else None
+    until = _as_utc(until) if until else None
+    needles = [_needle(v) for v in (username, email, contains) if v]
+
+    seen, current_month = set(), None
+    for month, path in list_partitions(directory, since, until):
+        if month != current_month:
+            seen, current_month = set(), month
+        with _open_partition(path) as f:
+            for line in f:
+                if not line.strip() or not all(needle in line for needle in needles):
+                    continue
+                record = loads(line)
+                if record['id'] in seen:
+                    continue
+                seen.add(record['id'])
+                if username and record['username'] != username:
+                    continue
+                if email and record['email'] != email:
+                    continue
+                if contains and contains not in record['message']:
+                    continue
+                if since or until:
+                    created_at = _as_utc(datetime.fromisoformat(record['created_at']))
+                    if (since and created_at < since) or (until and created_at >= until):
+                        continue
+                yield record
+
+
+def ensure_incremental_vacuum(engine):
+    """SQLite の auto_vacuum を INCREMENTAL にする。変更した場合は True
+
+    既に作成済みのファイル（接続時の journal_mode=WAL でヘッダーが書かれた空のファイルも含む）では、
+    設定を反映するのに VACUUM でファイルを作り直す必要がある（データベースが大きい場合は時間が掛かる。1度だけ行えばよい）。
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:  # 2 = INCREMENTAL
+            return False
+        conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+            conn.exec_driver_sql('VACUUM')
+    return True
+
+
+def database_size(engine):
+    """SQLite のファイルの (全体のバイト数, 空きページのバイト数)。SQLite 以外は None"""
+    if engine.dialect.name != 'sqlite':
+        return None
+    with engine.connect() as conn:
+        page_size = conn.exec_driver_sql('PRAGMA page_size').scalar()
+        page_count = conn.exec_driver_sql('PRAGMA page_count').scalar()
+        free = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+    return page_count * page_size, free * page_size
+
+
+def incremental_vacuum(engine, step_pages=1000, max_pages=None):
+    """空きページを step_pages ずつ別々のトランザクションで解放し、解放したページ数を返す
+
+    1回の incremental_vacuum は書き込みロックを取るので、小さく分けて他の書き込みを待たせる時間を短くする。
+    最後に WAL をチェックポイントして切り詰め、データベースと WAL のファイルを小さくする。
+    auto_vacuum が INCREMENTAL でない場合（ensure_incremental_vacuum() の前）や SQLite 以外では何もしない。
+    """
+    if engine.dialect.name != 'sqlite':
+        return 0
+    freed = 0
+    with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != 2:
+            return 0
+        free = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+        while free and (max_pages is None or freed < max_pages):
+            pages = min(free, step_pages) if max_pages is None else min(free, step_pages, max_pages - freed)
+            # sqlite3 の execute() は文を1ステップしか実行せず、incremental_vacuum は1ステップで1ページしか解放しないため、
+            # 最後まで実行する executescript() を使う
+            conn.connection.dbapi_connection.executescript(f'PRAGMA incremental_vacuum({pages});')
+            remaining = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+            if remaining >= free:
+                break
+            freed += free - remaining
+            free = remaining
+        conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+    return freed
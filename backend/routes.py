@@ -1,34 +1,190 @@
-from flask import jsonify, request, render_template, send_from_directory
-from .models import Item, Message, MessageCreateSchema, ItemCreate, ItemUpdate
-from sqlalchemy.exc import SQLAlchemyError
+from flask import jsonify, request, render_template, stream_with_context
+from .models import Item, Message
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 # appオブジェクトを直接インポートしようとすると、循環参照の問題が発生したり、アプリケーションの構造が複雑になったりすることがあります。
 # current_appを使うことで、　循環参照を起こさずに、どこからでも現在のアプリケーションインスタンスにアクセスできる便利な方法を提供します。
-from sqlalchemy import desc, or_
+from sqlalchemy import desc, select
 from flask import current_app # ログ出力用
-from pydantic import ValidationError
-from .config import photos
-import os
-import time
+from werkzeug.exceptions import HTTPException
+from .config import photos, blob_store
+from .cache import response_cache
+from .images import image_pipeline
+from .static_files import static_files
+from .message_queue import message_writer, QueueFullError
+import uuid
+from .pagination import (
+    PaginationError, ITEM_FIELDS, parse_limit, parse_fields, parse_format, parse_ids, fetch_item_page, fetch_items_by_id,
+)
+from .search import search_items as search_catalog
+from .serialization import ITEM_SERIALIZER, raw_json_response, dumps_bytes
+from .bulk import BulkError, ZipImages, detect_format, iter_records, import_items as bulk_import_items, export_items
+from .images import URL_PLACEHOLDER
+from .uploads import UploadError, receive_upload
+from .concurrency import (
+    ItemNotFound, PreconditionFailed, item_etag, parse_if_match, update_item_row, delete_item_row,
+)
+from . import facets
+import csv
+
+
+# ---- 同期版と非同期版 (async_routes.py) のビューで共通の処理 ----
+
+def is_paginated_request():
+    # limit / cursor / fields / format のいずれかが指定された場合はカーソルページネーションで返す
+    # 何も指定されない場合は従来どおり全件の配列を返す（既存フロントエンドとの互換性のため）
+    return any(key in request.args for key in ('limit', 'cursor', 'fields', 'format'))
+
+
+def item_page_response(rows, next_cursor, fields, output_format):
+    # ORM オブジェクトや辞書を作らず、取得した列から直接 JSON を組み立てる
+    serializer = ITEM_SERIALIZER.subset(fields)
+    if output_format == 'columnar':
+        # {"fields": [...], "rows": [[...]], "next_cursor": ...}（キーを行ごとに繰り返さない）
+        body = serializer.encode_columnar(rows)[:-1]
+        return raw_json_response(body + b',"next_cursor":' + dumps_bytes(next_cursor) + b'}')
+    items = serializer.encode(rows)
+    return raw_json_response(b'{"items":' + items + b',"next_cursor":' + dumps_bytes(next_cursor) + b'}')
+
+
+def is_batch_request():
+    return 'ids' in request.args
 
 
-def register_routes(app, get_db):
+def parse_batch_args():
+    """ids=1,5,9（ids=1&ids=5 も可）と fields"""
+    return parse_ids(','.join(request.args.getlist('ids'))), parse_fields(request.args.get('fields'))
+
+
+def lookup_cached_items(ids, fields):
+    """id ごとのキャッシュから (キーの接頭辞, {id: body}) を返す。キャッシュするのは全列の場合のみ"""
+    if fields != list(ITEM_FIELDS):
+        return None, {}
+    return response_cache.get_many('item', ids)
+
+
+def item_batch_response(ids, fields, prefix, cached, rows):
+    # {"items": [...指定順...], "missing": [見つからなかった id]}
+    encoded = dict(zip(rows, ITEM_SERIALIZER.subset(fields).encode_each(rows.values())))
+    response_cache.set_many(prefix, encoded)
+    bodies = cached | encoded
+    items = b','.join([bodies[i] for i in ids if i in bodies])
+    missing = [i for i in ids if i not in bodies]
+    return raw_json_response(b'{"items":[' + items + b'],"missing":' + dumps_bytes(missing) + b'}')
+
+
+def item_response(item):
+    # ETag はバージョン番号（と縮小版）から作る（更新・削除の If-Match にそのまま使える）
+    response = jsonify(item.to_dict())
+    response.set_etag(item_etag(item.id, item.version, item.image_variants))
+    return response
+
+
+def precondition_failed_response(error):
+    response = jsonify({"error": str(error)})
+    response.status_code = 412
+    if error.current_etag:
+        response.set_etag(error.current_etag)
+    return response
+
+
+def parse_browse_args():
+    """/api/items/browse のクエリパラメータ。不正な値は PaginationError (FacetError)"""
+    return {
+        'categories': facets.parse_categories(request.args.getlist('category')),
+        'min_price': facets.parse_price(request.args.get('min_price'), 'min_price'),
+        'max_price': facets.parse_price(request.args.get('max_price'), 'max_price'),
+        'sort': facets.parse_sort(request.args.get('sort')),
+        'limit': parse_limit(request.args.get('limit')),
+        'cursor': request.args.get('cursor'),
+    }
+
+
+def wants_facets():
+    # 2ページ目以降では件数は変わらないので、クライアントは facets=false で省略できる
+    return request.args.get('facets', 'true').lower() not in ('false', '0', 'no')
+
+
+def browse_response(rows, next_cursor, serializer, facet_result=None):
+    body = b'{"items":' + serializer.encode(rows) + b',"next_cursor":' + dumps_bytes(next_cursor)
+    if facet_result is not None:
+        counts, total = facet_result
+        body += b',"total":' + dumps_bytes(total) + b',"facets":' + dumps_bytes(counts)
+    return raw_json_response(body + b'}')
+
+
+def parse_message_request():
+    """問い合わせメッセージの JSON を検証する。(validated_data, client_id, None) か、エラー時は (None, None, レスポンス)"""
+    from .schemas import MessageCreateSchema, ValidationError # 遅延初期化モードでは最初の投稿で読み込まれる
+
+    json_data = request.get_json()
+
+    if not json_data:
+        return None, None, (jsonify({"error": "Request body must be JSON and not empty."}), 400)
+
+    try:
+        # Pydanticモデルでデータのバリデーションと型変換を行う
+        validated_data = MessageCreateSchema(**json_data)
+    except ValidationError as e:
+        # バリデーションエラーが発生した場合、詳細なエラー情報を返す
+        # e.errors() はエラーのリストを返します
+        return None, None, (jsonify({"error": "Validation Failed", "details": e.errors()}), 422) # 422 Unprocessable Entity
+
+    return validated_data, str(validated_data.client_id or uuid.uuid4()), None
+
+
+def enqueue_message(validated_data, client_id):
+    """非同期書き込みモード: キューに入れてすぐに 202 を返す（DBへの書き込みはバックグラウンドでまとめて行う）"""
+    try:
+        message_writer.enqueue(validated_data.username, validated_data.email, validated_data.message, client_id)
+    except QueueFullError:
+        current_app.logger.warning("Message queue is full; rejecting message.")
+        return jsonify({'error': 'Too many messages. Please try again later.'}), 503, {'Retry-After': '1'}
+    return jsonify({'id': client_id, 'status': 'queued'}), 202
+
+
+def register_routes(app, get_db, get_read_db=None):
+    # 参照系のエンドポイントは読み込み専用のセッションを使う（指定が無ければ書き込み用と同じ）
+    get_read_db = get_read_db or get_db
+
 
     # Vue.jsのSPAをサーブするためのルート
     @app.route('/')
     def index():
-        return send_from_directory('static', 'index.html')
+        return static_files.serve('index.html')
 
 
 
 
 
 # 全てのアイテムを取得するエンドポイント (GET)
+# ids=1,5,9 を指定すると、そのアイテムだけを指定順に返す: {"items": [...], "missing": [...]}
     @app.route('/api/items', methods=['GET'])
+    @response_cache.cached
     def get_items():
         try:
-            db = get_db()
-            items = db.query(Item).order_by(desc(Item.updated_at)).all()
-            return jsonify([item.to_dict() for item in items]), 200
+            db = get_read_db()
+
+            if is_batch_request():
+                # ids=1,5,9: 指定したアイテムを1回の IN クエリでまとめて取得する（/api/item/<id> を件数分呼ばない）
+                # キャッシュに無い id だけを DB から取得する
+                ids, fields = parse_batch_args()
+                prefix, cached = lookup_cached_items(ids, fields)
+                misses = [i for i in ids if i not in cached]
+                rows = fetch_items_by_id(db, misses, fields) if misses else {}
+                return item_batch_response(ids, fields, prefix, cached, rows)
+
+            if is_paginated_request():
+                limit = parse_limit(request.args.get('limit'))
+                fields = parse_fields(request.args.get('fields'))
+                output_format = parse_format(request.args.get('format'))
+                rows, next_cursor = fetch_item_page(db, limit, request.args.get('cursor'), fields)
+                return item_page_response(rows, next_cursor, fields, output_format)
+
+            rows = db.execute(select(*ITEM_SERIALIZER.columns).order_by(desc(Item.updated_at))).all()
+            return raw_json_response(ITEM_SERIALIZER.encode(rows))
+
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
 
         except SQLAlchemyError as e: # DB関連の具体的なエラー
             current_app.logger.error(f"Database error retrieving items: {e}", exc_info=True) # メッセージを具体的に
@@ -41,6 +197,7 @@ def register_routes(app, get_db):
 
 
     @app.route('/api/items/search', methods=['GET'])
+    @response_cache.cached
     def search_items():
         try:
             query = request.args.get('q', '').strip()
@@ -48,16 +205,17 @@ def register_routes(app, get_db):
             if not query:
                 return jsonify({'error': 'Query parameter "q" is required.'}), 400
 
-            db = get_db()
-            items = db.query(Item).filter(
-                or_(
-                    Item.name.ilike(f'%{query}%'),
-                    Item.category.ilike(f'%{query}%'),
-                    Item.description.ilike(f'%{query}%'),
-                )
-            ).order_by(desc(Item.updated_at)).all()
+            # 入力補完などで件数を絞りたい場合は limit を指定できる（未指定なら全件）
+            limit = parse_limit(request.args.get('limit')) if 'limit' in request.args else None
+
+            db = get_read_db()
+            # SQLite では FTS5 索引を使い関連度 (bm25) 順、それ以外は部分一致検索
+            rows = search_catalog(db, query, limit, columns=ITEM_SERIALIZER.columns)
 
-            return jsonify([item.to_dict() for item in items]), 200
+            return raw_json_response(ITEM_SERIALIZER.encode(rows))
+
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
 
         except SQLAlchemyError as e:
             current_app.logger.error(f"Database error during search: {e}", exc_info=True)
@@ -69,16 +227,47 @@ def register_routes(app, get_db):
 
 
 
+    # カテゴリ・価格で絞り込んだアイテムとファセットの件数を返すエンドポイント (GET)
+    #   category=Running&category=Tennis（または category=Running,Tennis）, min_price, max_price,
+    #   sort=newest|price_asc|price_desc|name, limit, cursor, fields, facets=false（件数を省く）
+    # 応答: {"items": [...], "next_cursor": ..., "total": N, "facets": {"category": [...], "price": [...]}}
+    @app.route('/api/items/browse', methods=['GET'])
+    @response_cache.cached
+    def browse_items():
+        try:
+            args = parse_browse_args()
+            serializer = ITEM_SERIALIZER.subset(parse_fields(request.args.get('fields')))
+
+            db = get_read_db()
+            rows, next_cursor = facets.browse_items(db, serializer.columns, **args)
+            facet_result = None
+            if wants_facets():
+                facet_result = facets.facet_counts(db, args['categories'], args['min_price'], args['max_price'])
+            return browse_response(rows, next_cursor, serializer, facet_result)
+
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except SQLAlchemyError as e:
+            current_app.logger.error(f"Database error during browse: {e}", exc_info=True)
+            return jsonify({'error': 'A database error occurred. Please try again later.'}), 500
+
+        except Exception as e:
+            current_app.logger.error(f"Unexpected error during browse: {e}", exc_info=True)
+            return jsonify({"error": "An unexpected server error occurred."}), 500
+
+
+
 # 特定のアイテムを取得するエンドポイント (GET)。　Flaskが自動的にitem_idを整数に変換してくれます。
     @app.route('/api/item/<int:item_id>', methods=['GET'])
+    @response_cache.cached
     def get_item(item_id: int):
-        time.sleep(0.3)
         try:
-            db = get_db()
+            db = get_read_db()
             item = db.query(Item).filter(Item.id == item_id).first()
             if item is None:
                 return jsonify({"error": "Item not found"}), 404
-            return jsonify(item.to_dict()), 200
+            return item_response(item)
 
         except SQLAlchemyError as e:
             current_app.logger.error(f"Database error retrieving the item: {e}", exc_info=True) # メッセージを具体的に
@@ -94,44 +283,49 @@ def register_routes(app, get_db):
 # アイテムを作成するためのエンドポイント
     @app.route('/api/admin/create-item', methods=['POST'])
     def create_item():
-        # 1. ファイルの存在チェックと初期検証
-        # リクエストが 'multipart/form-data' であることを想定
-        if 'image' not in request.files:
-            current_app.logger.warning("No 'image' file part in the request.")
-            return jsonify({'error': 'There is no image file selected.'}), 400
-
-        file = request.files['image']
+        from .schemas import ItemCreate, ITEM_REQUIRED_FIELDS, ValidationError
 
-        if file.filename == '':
-            current_app.logger.warning("No selected file for 'image'. filename is empty.")
+        # 1. 本文をストリームのまま解析し、フォームの検証と画像の保存を同時に行う（uploads.py）
+        # リクエストが 'multipart/form-data' であることを想定
+        # request.files / request.form は本文をすべて読み込んでしまうため、ここでは使わない
+        boundary = request.mimetype_params.get('boundary')
+        if request.mimetype != 'multipart/form-data' or not boundary:
+            current_app.logger.warning("Request is not multipart/form-data.")
             return jsonify({'error': 'There is no image file selected.'}), 400
 
-        # 2. テキストデータ（フォームフィールド）のPydanticバリデーション
-        # request.form は ImmutableMultiDict なので、辞書に変換してPydanticに渡す
-        item_data_from_form = request.form.to_dict()
-
+        # 2. テキストデータ（フォームフィールド）のPydanticバリデーションと 3. ファイルの保存
+        # name / category / price が画像より先に届いていれば、画像を受信する前に検証して不正なら中断する。
+        # 画像は保存先の一時ファイルに直接書き込み、参照カウントを増やすとき (acquire) にハッシュ名で確定する。
+        # image_url と image_filename は、この時点ではまだファイル保存前なので、
+        # Pydanticモデルの Optional なフィールドとして自動的に None が扱われる。
+        saved_filename = None # DB保存失敗時にファイルを削除するために保持
+        upload = None
         try:
-            # Pydanticモデルで入力データをバリデーション
-            # image_url と image_filename は、この時点ではまだファイル保存前なので、
-            # Pydanticモデルの Optional なフィールドとして自動的に None が扱われる。
-            validated_data = ItemCreate(**item_data_from_form)
-            current_app.logger.info("Pydantic validation successful.")
+            upload = receive_upload(
+                request.stream, boundary.encode('latin-1'), blob_store,
+                validate=lambda fields: ItemCreate(**fields),
+                required_fields=ITEM_REQUIRED_FIELDS,
+                spool_max_size=current_app.config['UPLOAD_SPOOL_MAX_MEMORY'],
+                max_form_memory_size=current_app.config['MAX_FORM_MEMORY_SIZE'],
+                max_parts=current_app.config['MAX_FORM_PARTS'],
+            )
+            validated_data = upload.validated
+            saved_filename = upload.filename
+            image_url = photos.url(saved_filename)
+            current_app.logger.info(f"Image saved: {saved_filename} ({upload.size} bytes), URL: {image_url}")
         except ValidationError as e:
             current_app.logger.error(f"Pydantic validation error for create_item: {e.errors()}")
             # PydanticエラーメッセージをJSON形式で返す
             return jsonify({'error': e.errors()}), 400
-        except Exception as e:
-            # Pydanticモデルのインスタンス化中に発生する予期せぬエラー
-            current_app.logger.error(f"Unexpected error during Pydantic model creation: {e}", exc_info=True)
-            return jsonify({'error': 'リクエストデータの処理中に予期せぬエラーが発生しました。'}), 400
-
-        # 3. ファイルの保存
-        # Pydanticバリデーション成功後にファイルを保存する
-        saved_filename = None # DB保存失敗時にファイルを削除するために保持
-        try:
-            saved_filename = photos.save(file)
-            image_url = photos.url(saved_filename)
-            current_app.logger.info(f"Image saved: {saved_filename}, URL: {image_url}")
+        except UploadError as e:
+            current_app.logger.warning(f"Rejected upload for create_item: {e}")
+            return jsonify({'error': str(e)}), e.status
+        except HTTPException:
+            raise # 413（本文が大きすぎる）や切断は Flask に任せる
+        except ValueError as e:
+            # multipart の書式が不正
+            current_app.logger.warning(f"Malformed multipart body for create_item: {e}")
+            return jsonify({'error': 'The multipart body is malformed.'}), 400
         except Exception as e:
             current_app.logger.error(f"Error saving image file: {e}", exc_info=True)
             return jsonify({'error': '写真ファイルの保存に失敗しました。'}), 500
@@ -148,10 +342,16 @@ def register_routes(app, get_db):
             new_item = Item(**item_dict)
 
             db.add(new_item)
+            blob_store.acquire(db, saved_filename, writer=upload.writer) # 画像ファイルの参照カウントを増やして確定する
+            facets.record_changes(db, added=[(new_item.category, new_item.price)]) # ファセットの件数を増やす
             db.commit() # commit時に自動的に内部で flush() が実行されるため、idが生成される
+            response_cache.invalidate() # カタログが変わったので参照系のキャッシュを無効化
 
             current_app.logger.info(f"Item created successfully with ID: {new_item.id}")
             result = new_item.to_dict()
+
+            # 縮小版 (WebP/AVIF) の生成はバックグラウンドで行い、レスポンスは待たせない
+            image_pipeline.submit(current_app._get_current_object(), new_item.id, saved_filename, photos.url)
             return jsonify(result), 201
 
         except SQLAlchemyError as e:
@@ -159,14 +359,9 @@ def register_routes(app, get_db):
                 db.rollback() # DBエラーの場合はロールバック
             current_app.logger.error(f"Database error saving item: {e}", exc_info=True)
             # DB保存に失敗した場合、保存したファイルを削除して孤立ファイルを防ぐ
+            # （同じ画像を他のアイテムが使っている場合は削除されない）
             if saved_filename:
-                file_path_to_remove = os.path.join(current_app.config['UPLOADED_PHOTOS_DEST'], saved_filename)
-                try:
-                    if os.path.exists(file_path_to_remove):
-                        os.remove(file_path_to_remove)
-                        current_app.logger.info(f"Successfully removed orphaned file: {saved_filename}")
-                except Exception as file_e:
-                    current_app.logger.error(f"Error deleting orphaned file {saved_filename}: {file_e}", exc_info=True)
+                _remove_file_safe(saved_filename)
             return jsonify({'error': 'データベース処理中にエラーが発生しました。'}), 500
 
         except Exception as e:
@@ -174,78 +369,180 @@ def register_routes(app, get_db):
                 db.rollback() # その他の予期せぬエラーでもロールバック
             current_app.logger.error(f"An unexpected error occurred during item creation: {e}", exc_info=True)
             # その他の予期せぬエラーの場合も、保存したファイルを削除
+            # （同じ画像を他のアイテムが使っている場合は削除されない）
             if saved_filename:
-                file_path_to_remove = os.path.join(current_app.config['UPLOADED_PHOTOS_DEST'], saved_filename)
-                try:
-                    if os.path.exists(file_path_to_remove):
-                        os.remove(file_path_to_remove)
-                        current_app.logger.info(f"Successfully removed orphaned file due to unexpected error: {saved_filename}")
-                except Exception as file_e:
-                    current_app.logger.error(f"Error deleting orphaned file {saved_filename}: {file_e}", exc_info=True)
+                _remove_file_safe(saved_filename)
             return jsonify({'error': 'アイテム作成中に予期せぬエラーが発生しました。'}), 500
 
+        finally:
+            upload.writer.abort() # 確定しなかった一時ファイルを削除（確定済みなら何もしない）
+
+
+
+    # アイテムを一括登録するエンドポイント (POST)
+    # multipart で file（.ndjson / .csv）と任意の images（画像の ZIP）を送るか、
+    # Content-Type: application/x-ndjson / text/csv で本文に直接データを送る（ストリームのまま読み込む）
+    @app.route('/api/admin/items/import', methods=['POST'])
+    def import_items():
+        # 通常のアップロードより大きなファイルを受け付ける（request.files / stream を読む前に設定する）
+        request.max_content_length = current_app.config['BULK_IMPORT_MAX_CONTENT_LENGTH']
+        images = None
+        try:
+            if request.mimetype in ('application/x-ndjson', 'application/jsonl', 'text/csv'):
+                fmt = detect_format(mimetype=request.mimetype, explicit=request.args.get('format'))
+                stream = request.stream
+            else:
+                file = request.files.get('file')
+                if not file or not file.filename:
+                    return jsonify({'error': 'There is no import file selected.'}), 400
+                fmt = detect_format(file.filename, file.mimetype, request.form.get('format') or request.args.get('format'))
+                stream = file.stream
+                if request.files.get('images'):
+                    images = ZipImages(request.files['images'].stream)
+
+            result = bulk_import_items(
+                get_db(), iter_records(stream, fmt), blob_store, images,
+                url_template=photos.url(URL_PLACEHOLDER),
+                batch_size=current_app.config['BULK_IMPORT_BATCH_SIZE'],
+            )
+
+        except (BulkError, UnicodeDecodeError, csv.Error) as e:
+            return jsonify({'error': str(e)}), 400
+
+        except SQLAlchemyError as e:
+            current_app.logger.error(f"Database error during bulk import: {e}", exc_info=True)
+            return jsonify({'error': 'A database error occurred during import.'}), 500
+
+        except Exception as e:
+            current_app.logger.error(f"Unexpected error during bulk import: {e}", exc_info=True)
+            return jsonify({'error': 'An unexpected error occurred during import.'}), 500
+
+        finally:
+            if images is not None:
+                images.close()
+            # 途中で失敗しても、それまでのバッチはコミット済みなのでキャッシュは無効化する
+            response_cache.invalidate()
+
+        current_app.logger.info(f"Bulk import: {result.inserted} inserted, {result.failed} failed")
+        for item_id, filename in result.images:
+            image_pipeline.submit(current_app._get_current_object(), item_id, filename, photos.url)
+        return jsonify(result.to_dict()), 200
+
+
+    # 全アイテムをエクスポートするエンドポイント (GET)。format=ndjson（既定）/ csv
+    # サーバーサイドカーソルから少しずつ読みながら送るので、件数が多くてもメモリ使用量は一定
+    @app.route('/api/admin/items/export', methods=['GET'])
+    def export_items_route():
+        try:
+            fmt = detect_format(explicit=request.args.get('format') or 'ndjson')
+        except BulkError as e:
+            return jsonify({'error': str(e)}), 400
+
+        mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+        return current_app.response_class(
+            stream_with_context(export_items(get_read_db(), fmt)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=items.{fmt}'},
+        )
 
 
     # アイテムを更新するエンドポイント (PATCH)
+    # If-Match に GET /api/item/<id> の ETag を付けると、その後に他の更新があった場合は 412 を返す (concurrency.py)
     @app.route('/api/admin/item/<int:item_id>/edit', methods=['PATCH'])
     def update_item(item_id: int):
+        from .schemas import ItemUpdate, ValidationError
+
         db = get_db()
         new_image_filename = None
+        old_image_filename = None
+        upload = None
 
         try:
-            item = db.query(Item).filter(Item.id == item_id).first()
-            if not item:
-                return jsonify({"error": "Item not found"}), 404
-
-            # テキストフィールド更新
-            if request.form:
-                validated = ItemUpdate(**request.form.to_dict())
-                for key, value in validated.model_dump(exclude_unset=True).items():
-                    setattr(item, key, value)
+            versions = parse_if_match(item_id)
+            # テキストフィールド
+            values = ItemUpdate(**request.form.to_dict()).model_dump(exclude_unset=True) if request.form else {}
 
-            # 画像更新
-            old_image_filename = getattr(item, 'image_filename', None)
+            # 画像（先に保存しておき、UPDATE で差し替える）
+            image = None
             file = request.files.get('image')
             if file and file.filename:
-                new_image_filename = photos.save(file)
-                item.image_filename = new_image_filename
-                item.image_url = photos.url(new_image_filename)
-
-            # DB更新
+                upload = blob_store.save(file) # ここではまだ確定しない（acquire で確定する）
+                new_image_filename = upload.filename
+                image = (new_image_filename, photos.url(new_image_filename))
+
+            if not values and image is None:
+                # 変更がなければ現在の内容を返す
+                item = db.get(Item, item_id)
+                if item is None:
+                    return jsonify({"error": "Item not found"}), 404
+                if versions is not None and item.version not in versions:
+                    raise PreconditionFailed(item_etag(item_id, item.version, item.image_variants))
+                return item_response(item)
+
+            # UPDATE ... RETURNING の1文で更新し、変更後の行と変更前の値を受け取る
+            item, (old_category, old_price, old_image_filename, old_image_variants) = update_item_row(
+                db, item_id, values, image, versions
+            )
+            # カテゴリか価格が変わった場合はファセットの件数を付け替える
+            if (item.category, item.price) != (old_category, old_price):
+                facets.record_changes(db, added=[(item.category, item.price)], removed=[(old_category, old_price)])
+            if new_image_filename and new_image_filename != old_image_filename:
+                blob_store.acquire(db, new_image_filename, writer=upload)
+                blob_store.release(db, old_image_filename)
+
+            # commit すると属性が期限切れになり再読み込みが走るため、先にレスポンスを作っておく
+            response = item_response(item)
             db.commit()
+            response_cache.invalidate()
 
-            # 成功時：古いファイルを削除
+            # 成功時：古いファイルを削除（他のアイテムがまだ使っている場合は残る）
             if old_image_filename and old_image_filename != new_image_filename and new_image_filename != None:
-                _remove_file_safe(old_image_filename)
+                _remove_file_safe(old_image_filename, old_image_variants)
+
+            if new_image_filename and new_image_filename != old_image_filename:
+                image_pipeline.submit(current_app._get_current_object(), item_id, new_image_filename, photos.url)
 
-            return jsonify(item.to_dict()), 200
+            return response
+
+        except ItemNotFound:
+            db.rollback()
+            if new_image_filename:
+                _remove_file_safe(new_image_filename)
+            return jsonify({"error": "Item not found"}), 404
+
+        except PreconditionFailed as e:
+            db.rollback()
+            if new_image_filename:
+                _remove_file_safe(new_image_filename)
+            return precondition_failed_response(e)
 
         except ValidationError as e:
             db.rollback()
             # エラー時：新しいファイルを削除
-            if new_image_filename:
+            if new_image_filename and new_image_filename != old_image_filename:
                 _remove_file_safe(new_image_filename)
             return jsonify({'error': e.errors()}), 400
 
         except Exception as e:
             db.rollback()
             # エラー時：新しいファイルを削除
-            if new_image_filename:
+            if new_image_filename and new_image_filename != old_image_filename:
                 _remove_file_safe(new_image_filename)
             current_app.logger.error(f"Error: {e}", exc_info=True)
             return jsonify({'error': 'エラーが発生しました。'}), 500
 
+        finally:
+            if upload is not None:
+                upload.abort() # 確定しなかった一時ファイルを削除（確定済みなら何もしない）
+
 
-    def _remove_file_safe(filename):
-        """ファイルを安全に削除（エラーでも継続）"""
+    def _remove_file_safe(filename, variants=None):
+        """どのアイテムからも参照されなくなった画像ファイル（と縮小版）を安全に削除（エラーでも継続）"""
         if not filename:
             return
 
-        file_path = os.path.join(current_app.config['UPLOADED_PHOTOS_DEST'], filename)
-
         try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            if blob_store.collect(filename, variants):
                 current_app.logger.info(f"Removed image file: {filename}")
         except Exception as e:
             current_app.logger.warning(f"Could not remove file {filename}: {e}")
@@ -257,17 +554,24 @@ def register_routes(app, get_db):
     def delete_item(item_id: int):
         db = get_db()
         try:
-            item = db.query(Item).filter(Item.id == item_id).first()
-            if item is None:
-                return jsonify({"error": "Item not found"}), 404
-            db.delete(item)
+            # DELETE ... RETURNING の1文で削除し、ファセットと画像の後始末に必要な値を受け取る
+            category, price, image_filename, image_variants = delete_item_row(db, item_id, parse_if_match(item_id))
+            blob_store.release(db, image_filename)
+            facets.record_changes(db, removed=[(category, price)])
             db.commit()
+            response_cache.invalidate()
 
-            if item.image_filename:
-                current_app.logger.warning(item.image_filename)
-                _remove_file_safe(item.image_filename)
+            if image_filename:
+                current_app.logger.warning(image_filename)
+                _remove_file_safe(image_filename, image_variants)
 
             return jsonify({"message": "Item deleted successfully"}), 200
+        except ItemNotFound:
+            db.rollback()
+            return jsonify({"error": "Item not found"}), 404
+        except PreconditionFailed as e:
+            db.rollback()
+            return precondition_failed_response(e)
         except Exception as e:
             db.rollback()
             return jsonify({"error": str(e)}), 500
@@ -279,18 +583,13 @@ def register_routes(app, get_db):
 
     @app.route('/api/message', methods=['POST'])
     def save_message():
-        json_data = request.get_json()
+        validated_data, client_id, error = parse_message_request()
+        if error:
+            return error
 
-        if not json_data:
-            return jsonify({"error": "Request body must be JSON and not empty."}), 400
-
-        try:
-            # Pydanticモデルでデータのバリデーションと型変換を行う
-            validated_data = MessageCreateSchema(**json_data)
-        except ValidationError as e:
-            # バリデーションエラーが発生した場合、詳細なエラー情報を返す
-            # e.errors() はエラーのリストを返します
-            return jsonify({"error": "Validation Failed", "details": e.errors()}), 422 # 422 Unprocessable Entity
+        # 非同期モード: キューに入れてすぐに 202 を返す
+        if message_writer.enabled:
+            return enqueue_message(validated_data, client_id)
 
         # get_db() が失敗する可能性を考慮し、except ブロック内で db.rollback() を安全に呼び出すために依然として有用な防御的プログラミング
         db = None # finallyブロックで確実にcloseするために、先に定義
@@ -303,6 +602,7 @@ def register_routes(app, get_db):
                 username=validated_data.username,
                 email=validated_data.email,
                 message=validated_data.message,
+                client_id=client_id,
             )
 
             db.add(new_message)
@@ -314,6 +614,11 @@ def register_routes(app, get_db):
             result = new_message.to_dict()
             return jsonify(result), 201
 
+        except IntegrityError: # 同じ client_id のメッセージが既に登録されている（再送）
+            if db:
+                db.rollback()
+            return jsonify({'error': 'A message with this client_id already exists.'}), 409
+
         except SQLAlchemyError as e: # DB関連の具体的なエラー
             if db: # dbが取得できていればロールバック
                 db.rollback()
@@ -337,13 +642,17 @@ def register_routes(app, get_db):
         # APIルートは除外
         if path.startswith('api/'):
             return {'error': 'API endpoint not found'}, 404
+        # /metrics は metrics.py のルートが処理する（計測を無効にしている場合もSPAは返さない）
+        if path == 'metrics':
+            return {'error': 'Not found'}, 404
 
-        # 静的ファイルが存在する場合はそれを返す
-        if os.path.exists(os.path.join('static', path)):
-            return send_from_directory('static', path)
+        # 静的ファイルが存在する場合はそれを返す（起動時に作ったファイル一覧を参照するのでディスクは見ない）
+        response = static_files.serve(path)
+        if response is not None:
+            return response
 
         # それ以外はVue.jsのindex.htmlを返す
-        return send_from_directory('static', 'index.html')
+        return static_files.serve('index.html')
 
 
 
@@ -0,0 +1,40 @@
+from uuid import UUID
+from pydantic import BaseModel, EmailStr, Field, ValidationError
+
+# リクエストの入力を検証する Pydantic のスキーマ（データベースのモデルは models.py）
+#
+# pydantic と email_validator の読み込み、スキーマの構築は起動時間の中でも重いため、models.py から分けている。
+# 遅延初期化モード (LAZY_INIT) では最初に使われたときか、ウォームアップ (startup.py) で読み込まれる。
+# ビューからは関数の中で import する。
+
+
+class ItemCreate(BaseModel):
+    name: str = Field(..., max_length=100)
+    description: str | None = Field(None, max_length=1000)
+    category: str = Field(..., max_length=50)
+    price: int = Field(..., gt=0)
+    # image_url と image_filename はファイルアップロード後に設定するため、
+    # リクエストボディからは提供されないことを想定し Optional で良い。
+    image_url: str | None = Field(None, max_length=500)
+    image_filename: str | None = Field(None, max_length=255)
+    # id, created_at, updated_at はDB側で自動生成されるため、入力には含めない
+
+
+class ItemUpdate(BaseModel):
+    name: str | None = Field(..., max_length=100)
+    description: str | None = Field(None, max_length=1000)
+    category: str | None = Field(..., max_length=50)
+    price: int | None = Field(..., gt=0)
+    # image_url と image_filename は受け付けない（画像は image ファイルで送り、参照カウントと一緒に差し替える）
+
+
+class MessageCreateSchema(BaseModel):
+    # ...は、そのフィールドが必須であることを示します。
+    username: str = Field(..., min_length=1, max_length=50, description="ユーザー名")
+    email: EmailStr = Field(..., description="メールアドレス") # EmailStrがメール形式を検証
+    message: str = Field(..., min_length=1, description="メッセージ本文")
+    client_id: UUID | None = Field(None, description="クライアントが生成した受付番号 (UUID)。省略時はサーバーで生成")
+
+
+# 画像を受信する前に検証できる条件（ItemCreate の必須フィールドがすべて届いている）
+ITEM_REQUIRED_FIELDS = tuple(name for name, field in ItemCreate.model_fields.items() if field.is_required())
@@ -0,0 +1,160 @@
+import re
+from sqlalchemy import desc, or_, select, text, inspect, table, column
+from .models import Item
+
+# SQLite の FTS5 仮想テーブル。items を外部コンテンツとして参照するため、本文は二重に保存されない
+# trigram トークナイザ (SQLite 3.34 以降) で、従来の ILIKE '%...%' と同じく単語の途中にも一致させる
+# （'Nova' で "AirNova ZX 200" がヒットする。大文字・小文字は区別しない）
+FTS_TABLE = 'items_fts'
+FTS_TOKENIZER = 'trigram'
+
+_fts = table(FTS_TABLE, column('rowid'))
+
+# bm25 の列ごとの重み (name, category, description)。名前の一致を最も高く評価する
+BM25_WEIGHTS = (10.0, 5.0, 1.0)
+
+_FTS_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, category, description,
+        content='items', content_rowid='id',
+        tokenize='{FTS_TOKENIZER}'
+    )
+    """,
+    # items への INSERT / UPDATE / DELETE をトリガーで索引に反映する
+    f"""
+    CREATE TRIGGER IF NOT EXISTS items_fts_ai AFTER INSERT ON items BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS items_fts_ad AFTER DELETE ON items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS items_fts_au AFTER UPDATE OF name, category, description ON items BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END
+    """,
+]
+
+# エンジンごとに FTS5 索引が使えるかどうかをキャッシュする
+_fts_available = {}
+
+
+def ensure_search_index(engine):
+    """SQLite の場合に FTS5 索引とトリガーを作成する（init_db から呼ばれる）
+
+    新しく索引を作成したときは既存の items から索引を再構築する。以前の unicode61 トークナイザの索引は作り直す。
+    SQLite 以外、または FTS5 (trigram) が使えない SQLite では何もしない（ILIKE 検索にフォールバック）。
+    """
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    created = not inspect(engine).has_table(FTS_TABLE)
+    try:
+        with engine.begin() as conn:
+            if not created and not _uses_tokenizer(conn):
+                conn.execute(text(f"DROP TABLE {FTS_TABLE}"))
+                created = True
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if created:
+                conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    except Exception as e:
+        # "no such module: fts5" など
+        print(f"Full-text search index is not available: {e}")
+        _fts_available[engine] = False
+        return False
+
+    _fts_available[engine] = True
+    return True
+
+
+def _uses_tokenizer(conn):
+    sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).scalar()
+    return f"tokenize='{FTS_TOKENIZER}'" in (sql or '')
+
+
+def rebuild_search_index(engine):
+    """items の内容から FTS5 索引を作り直す（トリガー作成前のデータを取り込む場合など）"""
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def _has_fts(db):
+    engine = db.get_bind().engine # 参照系のセッションでは接続 (Connection) が返る
+    if engine not in _fts_available:
+        _fts_available[engine] = (
+            engine.dialect.name == 'sqlite' and inspect(engine).has_table(FTS_TABLE)
+        )
+    return _fts_available[engine]
+
+
+def build_match_query(query):
+    """ユーザー入力を FTS5 の MATCH 式に変換する
+
+    各単語をダブルクォートで囲んで FTS5 の演算子として解釈されないようにする。
+    trigram 索引なので、それぞれの単語は列のどこに含まれていてもよい。
+    例: 'air nov' -> '"air" "nov"' （両方を含む行にヒット）
+    3文字未満の単語は trigram 索引で検索できないので、空文字列を返す（呼び出し側は ILIKE で検索する）。
+    """
+    tokens = [t for t in re.split(r'\s+', query) if t]
+    if any(len(t) < 3 for t in tokens):
+        return ''
+    return ' '.join('"{}"'.format(t.replace('"', '""')) for t in tokens)
+
+
+def search_items(db, query, limit=None, columns=None):
+    """検索語にヒットするアイテムを関連度順に返す
+
+    SQLite + FTS5 では bm25 でランキングし、それ以外のデータベースや3文字未満の単語を含む検索語では
+    name / category / description の部分一致 (ILIKE) にフォールバックする。
+    columns を指定した場合は Item ではなく、その列だけの行を返す。
+    """
+    if _has_fts(db):
+        match = build_match_query(query)
+        if match:
+            weights = ', '.join(str(w) for w in BM25_WEIGHTS)
+            stmt = (
+                _select(columns)
+                .join(_fts, _fts.c.rowid == Item.id)
+                .where(text(f"{FTS_TABLE} MATCH :match"))
+                .order_by(text(f"bm25({FTS_TABLE}, {weights})"), desc(Item.updated_at))
+                .params(match=match)
+            )
+            if limit:
+                stmt = stmt.limit(limit)
+            return _fetch(db, stmt, columns)
+
+    return ilike_search_items(db, query, limit, columns)
+
+
+def ilike_search_items(db, query, limit=None, columns=None):
+    """索引を使わない部分一致検索（従来の実装）"""
+    stmt = _select(columns).where(
+        or_(
+            Item.name.ilike(f'%{query}%'),
+            Item.category.ilike(f'%{query}%'),
+            Item.description.ilike(f'%{query}%'),
+        )
+    ).order_by(desc(Item.updated_at))
+    if limit:
+        stmt = stmt.limit(limit)
+    return _fetch(db, stmt, columns)
+
+
+def _select(columns):
+    return select(*columns) if columns else select(Item)
+
+
+def _fetch(db, stmt, columns):
+    return db.execute(stmt).all() if columns else db.scalars(stmt).all()
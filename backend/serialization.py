@@ -0,0 +1,239 @@
+import json
+from datetime import date, datetime
+from json.encoder import encode_basestring
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Integer, DateTime, String, Text
+from .models import Item, Message
+
+# orjson が入っていれば使う（無ければ標準ライブラリの json）
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+JSON_BACKENDS = ('auto', 'orjson', 'stdlib')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """jsonify / request.get_json で使う JSON プロバイダ
+
+    JSON_BACKEND が auto（既定）か orjson で、orjson がインストールされていれば orjson でエンコードする。
+    datetime などの変換は Flask の既定 (DefaultJSONProvider) と同じ結果になる。
+    キーはソートせず、非ASCII文字もエスケープしない（どちらもサイズと速度のため）。
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def __init__(self, app):
+        super().__init__(app)
+        backend = app.config.get('JSON_BACKEND', 'auto')
+        if backend not in JSON_BACKENDS:
+            raise ValueError(f"JSON_BACKEND must be one of {', '.join(JSON_BACKENDS)}: {backend!r}")
+        if backend == 'orjson' and orjson is None:
+            app.logger.warning("orjson is not installed; falling back to the standard json module.")
+        self.use_orjson = orjson is not None and backend != 'stdlib'
+
+    def _orjson_options(self, indent=False):
+        # datetime / dataclass は Flask の既定と同じ変換 (self.default) を通す
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # orjson が対応していない引数 (cls など) が指定された場合は標準ライブラリに任せる
+        if not self.use_orjson or set(kwargs) - {'indent', 'separators'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._orjson_options(kwargs.get('indent'))).decode()
+
+    def loads(self, s, **kwargs):
+        if not self.use_orjson or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def dumps_bytes(self, obj):
+        """レスポンス本文用に bytes のまま返す（str を経由しない）"""
+        if self.use_orjson:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_options())
+        return super().dumps(obj, separators=(',', ':')).encode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(obj)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+def raw_json_response(body, status=200):
+    """エンコード済みの JSON (bytes) をそのままレスポンスにする"""
+    return current_app.response_class(body + b'\n', status=status, mimetype='application/json')
+
+
+def dumps_bytes(obj):
+    return current_app.json.dumps_bytes(obj)
+
+
+class RowSerializer:
+    """列のみの select() の結果（Row = タプル）を、行ごとの辞書を作らずに JSON 配列へエンコードする
+
+    fields は (出力するキー, 列, 値の変換関数 or None) のリスト。
+    columns を select() に渡し、その結果の行をそのまま encode() に渡す（行の先頭から順に fields に対応する）。
+    ORM オブジェクトの生成と to_dict() での辞書作成を省くため、一覧のエンドポイントで使う。
+    """
+
+    def __init__(self, fields, use_orjson=None):
+        self.fields = list(fields)
+        self.names = [name for name, _, _ in self.fields]
+        self.columns = [column.label(name) for name, column, _ in self.fields]
+        self._converters = [(i, fn) for i, (_, _, fn) in enumerate(self.fields) if fn is not None]
+        self._use_orjson = use_orjson
+        self._subsets = {}
+
+        # 標準ライブラリ用: キー部分を埋め込んだテンプレートと、列の型ごとのエンコード関数
+        self._template = '{' + ','.join(f'{encode_basestring(name)}:%s' for name in self.names) + '}'
+        self._encoders = [
+            _encode_json if fn is not None else _encoder_for(column)
+            for _, column, fn in self.fields
+        ]
+
+    def subset(self, names):
+        """names の列だけを持つ RowSerializer（fields= 指定用。作ったものは使い回す）"""
+        key = tuple(names)
+        if key not in self._subsets:
+            by_name = {f[0]: f for f in self.fields}
+            self._subsets[key] = RowSerializer([by_name[n] for n in key], self._use_orjson)
+        return self._subsets[key]
+
+    @property
+    def use_orjson(self):
+        if self._use_orjson is not None:
+            return self._use_orjson
+        try:
+            return current_app.json.use_orjson
+        except (RuntimeError, AttributeError):  # アプリケーションコンテキスト外 / 既定のプロバイダ
+            return orjson is not None
+
+    def _convert(self, rows):
+        # image_variants のように加工が必要な列だけ、値を差し替えたタプルを作る
+        if not self._converters:
+            return rows
+        converted = []
+        for row in rows:
+            row = list(row)
+            for i, fn in self._converters:
+                row[i] = fn(row[i])
+            converted.append(row)
+        return converted
+
+    def encode(self, rows):
+        """[{"key": value, ...}, ...] の JSON (bytes)"""
+        rows = self._convert(rows)
+        if self.use_orjson:
+            names = self.names
+            return orjson.dumps([dict(zip(names, row)) for row in rows])
+
+        n = len(self.names)
+        template, encoders = self._template, self._encoders
+        return ('[' + ','.join([
+            template % tuple([encode(value) for encode, value in zip(encoders, row[:n])])
+            for row in rows
+        ]) + ']').encode()
+
+    def encode_each(self, rows):
+        """行ごとの JSON オブジェクト (bytes) のリスト。行を個別にキャッシュする場合に使う"""
+        rows = self._convert(rows)
+        if self.use_orjson:
+            names = self.names
+            return [orjson.dumps(dict(zip(names, row))) for row in rows]
+
+        n = len(self.names)
+        template, encoders = self._template, self._encoders
+        return [
+            (template % tuple([encode(value) for encode, value in zip(encoders, row[:n])])).encode()
+            for row in rows
+        ]
+
+    def encode_ndjson(self, rows):
+        """1行1オブジェクトの NDJSON (bytes)。エクスポートのストリーミング用"""
+        rows = self._convert(rows)
+        if self.use_orjson:
+            names = self.names
+            return b''.join([orjson.dumps(dict(zip(names, row))) + b'\n' for row in rows])
+
+        n = len(self.names)
+        template, encoders = self._template, self._encoders
+        return ''.join([
+            template % tuple([encode(value) for encode, value in zip(encoders, row[:n])]) + '\n'
+            for row in rows
+        ]).encode()
+
+    def encode_columnar(self, rows):
+        """{"fields": [...], "rows": [[...], ...]} の JSON (bytes)。キーを行ごとに繰り返さない"""
+        n = len(self.names)
+        rows = [row[:n] for row in self._convert(rows)]
+        if self.use_orjson:
+            return orjson.dumps({'fields': self.names, 'rows': rows})
+        return json.dumps({'fields': self.names, 'rows': rows}, default=_default,
+                          ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def _encode_str(value):
+    return 'null' if value is None else encode_basestring(value)
+
+
+def _encode_int(value):
+    return 'null' if value is None else int.__repr__(value)
+
+
+def _encode_datetime(value):
+    return 'null' if value is None else f'"{value.isoformat()}"'
+
+
+def _encode_json(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_default)
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _encoder_for(column):
+    column_type = column.type
+    if isinstance(column_type, Integer):
+        return _encode_int
+    if isinstance(column_type, (String, Text)):
+        return _encode_str
+    if isinstance(column_type, DateTime):
+        return _encode_datetime
+    return _encode_json
+
+
+# Item.to_dict() と同じキー・同じ値になるようにする
+ITEM_SERIALIZER = RowSerializer([
+    ('id', Item.id, None),
+    ('name', Item.name, None),
+    ('description', Item.description, None),
+    ('category', Item.category, None),
+    ('price', Item.price, None),
+    ('image_url', Item.image_url, None),
+    ('image_variants', Item.image_variants, Item.public_variants),
+    ('image_srcset', Item.image_variants, Item.build_srcset),
+    ('created_at', Item.created_at, None),
+    ('updated_at', Item.updated_at, None),
+])
+
+# Message.to_dict() と同じキー・同じ値になるようにする
+MESSAGE_SERIALIZER = RowSerializer([
+    ('id', Message.id, None),
+    ('username', Message.username, None),
+    ('email', Message.email, None),
+    ('message', Message.message, None),
+    ('client_id', Message.client_id, None),
+    ('created_at', Message.created_at, None),
+])
@@ -0,0 +1,165 @@
+import importlib
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+
+# 起動時間の計測（flask profile-startup）と遅延初期化モード (LAZY_INIT) のウォームアップ
+#
+# 遅延初期化モードでは DEFERRED_MODULES を起動時に読み込まず、最初に使われたときに読み込む。
+# STARTUP_WARMUP=True なら、各プロセスで最初のレスポンスを返した後にバックグラウンドのスレッドで
+# 先に読み込み、DB への最初の接続（SQLite では PRAGMA の設定）も済ませておく。
+# Gunicorn の preload_app ではアプリをマスターで作ってから fork するため、スレッドは起動時ではなく
+# ワーカーが最初のリクエストを処理した後に開始する（fork の前に作ったスレッドは子プロセスに引き継がれない）。
+
+# 遅延初期化モードで起動時に読み込まないモジュール（pydantic と email_validator、スキーマの構築）
+DEFERRED_MODULES = ('backend.schemas',)
+
+
+def load_deferred_modules():
+    for name in DEFERRED_MODULES:
+        importlib.import_module(name)
+
+
+class StartupProfile:
+    """create_app() の各段階にかかった時間を記録する（app.extensions['startup_profile']）"""
+
+    def __init__(self):
+        self.steps = []  # [(名前, ミリ秒), ...]
+        self._last = time.perf_counter()
+
+    def mark(self, name):
+        """前回の mark() からの経過時間を name の段階として記録する"""
+        now = time.perf_counter()
+        self.steps.append((name, (now - self._last) * 1000))
+        self._last = now
+
+
+class Warmup:
+    """遅延初期化モードで、後回しにしたモジュールの読み込みと DB への接続をバックグラウンドで行う"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self.thread = None
+
+    def init_app(self, app):
+        app.extensions['warmup'] = self
+        if not app.config['LAZY_INIT']:
+            load_deferred_modules()  # 従来どおり起動時にすべて読み込む
+            return
+        if not app.config['STARTUP_WARMUP']:
+            return
+
+        @app.after_request
+        def start_warmup(response):
+            # 最初のリクエストの処理を遅らせないよう、レスポンスを送り終えてから開始する
+            if self._pid != os.getpid():
+                response.call_on_close(lambda: self.start(app))
+            return response
+
+    def start(self, app):
+        """このプロセスでまだ開始していなければウォームアップのスレッドを開始する"""
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+        self.thread = threading.Thread(target=self._run, args=(app,), name='warmup', daemon=True)
+        self.thread.start()
+
+    def _run(self, app):
+        from .database import engine, replica_pool
+
+        started = time.perf_counter()
+        try:
+            load_deferred_modules()
+            for eng in {engine, *replica_pool.replicas}:
+                eng.connect().close()
+        except Exception as e:
+            app.logger.warning(f"Warm-up failed: {e}", exc_info=True)
+            return
+        app.logger.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+warmup = Warmup()
+
+
+# ---- flask profile-startup ----
+
+# 子プロセスで実行するコード: import / create_app() / 最初のリクエストの時間を JSON で出力する
+# （インタプリタ自体の起動時間は含めない）
+_CHILD_CODE = '''
+import json, sys, time
+started = time.perf_counter()
+from backend import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+client = app.test_client()
+request_started = time.perf_counter()
+response = client.get(sys.argv[1])
+finished = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (finished - request_started) * 1000,
+    "status": response.status_code,
+    "steps": app.extensions["startup_profile"].steps,
+    "modules": len(sys.modules),
+}))
+'''
+
+_IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+
+def _run_child(root, path, lazy, importtime=False):
+    env = dict(os.environ, LAZY_INIT='True' if lazy else 'False', STARTUP_WARMUP='False')
+    args = [sys.executable, *(['-X', 'importtime'] if importtime else []), '-c', _CHILD_CODE, path]
+    proc = subprocess.run(args, cwd=root, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Startup profiling failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1]), proc.stderr
+
+
+def import_breakdown(importtime_output):
+    """python -X importtime の出力を、パッケージ（backend はモジュール）ごとの自己時間 (ms) に集計する"""
+    totals = Counter()
+    for line in importtime_output.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        if match:
+            name = match.group(4)
+            key = name if name.startswith('backend.') else name.split('.')[0]
+            totals[key] += int(match.group(1)) / 1000
+    return totals
+
+
+def profile_startup(root, path='/api/items?limit=20', lazy=False, repeat=5):
+    """子プロセスでアプリを repeat 回起動し、最初のリクエストまでの時間の内訳を返す
+
+    import の内訳は -X importtime を付けた別の1回で計測する（付けると遅くなるため時間の計測とは分ける）。
+    """
+    runs = [_run_child(root, path, lazy)[0] for _ in range(repeat)]
+    _, importtime_output = _run_child(root, path, lazy, importtime=True)
+
+    def median(key):
+        return statistics.median(run[key] for run in runs)
+
+    steps = {}
+    for run in runs:
+        for name, ms in run['steps']:
+            steps.setdefault(name, []).append(ms)
+    return {
+        'import_ms': median('import_ms'),
+        'create_app_ms': median('create_app_ms'),
+        'first_request_ms': median('first_request_ms'),
+        'total_ms': statistics.median(r['import_ms'] + r['create_app_ms'] + r['first_request_ms'] for r in runs),
+        'status': runs[-1]['status'],
+        'modules': runs[-1]['modules'],
+        'steps': [(name, statistics.median(values)) for name, values in steps.items()],
+        'imports': import_breakdown(importtime_output),
+    }
@@ -0,0 +1,144 @@
+import gzip
+import mimetypes
+import os
+import re
+from flask import request, send_file
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+# Vite のビルド成果物のようにファイル名にハッシュが入っているもの（例: assets/index-BoB_mEkW.js）
+# 内容が変わればファイル名も変わるので、ブラウザに永久キャッシュさせてよい。
+# vite.config.js の assets/[name]-[hash] の形式（8文字のハッシュ）だけを対象にする
+# （site-navigation.js のような普通のファイル名や、assets/ 以外のファイルは対象外）
+FINGERPRINT_RE = re.compile(r'assets/[^/]+-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+')
+
+# 事前圧縮の対象（画像・動画などは既に圧縮されているので対象外）
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.mjs', '.css', '.svg', '.json', '.txt', '.map', '.xml', '.ico'}
+MIN_COMPRESS_SIZE = 1024
+
+# Accept-Encoding で優先する順（サイズが小さくなる順）
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class StaticEntry:
+    __slots__ = ('path', 'size', 'mtime', 'mimetype', 'etag', 'immutable', 'encoded')
+
+    def __init__(self, path, stat, immutable):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = f"{int(stat.st_mtime)}-{stat.st_size:x}"
+        self.immutable = immutable
+        self.encoded = {}  # encoding -> (path, size)
+
+
+class StaticFiles:
+    """backend/static 以下のファイルを配信する
+
+    起動時にディレクトリを走査してメモリ上のマニフェストを作り、リクエストごとにディスクを stat しない。
+    ハッシュ付きのファイルには immutable の Cache-Control を付け、.br / .gz が隣にあれば
+    Accept-Encoding に応じてそちらを返す。Range リクエスト（動画のシーク）にも対応する。
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.manifest = {}
+
+    def init_app(self, app, directory):
+        self.directory = directory
+        self.manifest = build_manifest(directory)
+        # Nginx / Apache の背後では X-Sendfile でファイル送信をWebサーバーに任せられる
+        app.config.setdefault('USE_X_SENDFILE', False)
+        app.extensions['static_files'] = self
+
+    def serve(self, path):
+        """path に対応するレスポンスを返す（マニフェストに無ければ None）"""
+        entry = self.manifest.get(path)
+        if entry is None:
+            return None
+
+        file_path, encoding = entry.path, None
+        # 圧縮版は Range 指定が無いときだけ使う（Range は元のバイト列に対する位置のため）
+        if entry.encoded and 'Range' not in request.headers:
+            for name, _ in ENCODINGS:
+                if name in entry.encoded and request.accept_encodings[name]:
+                    file_path, encoding = entry.encoded[name][0], name
+                    break
+
+        response = send_file(
+            file_path,
+            mimetype=entry.mimetype,
+            etag=f"{entry.etag}-{encoding}" if encoding else entry.etag,
+            last_modified=entry.mtime,
+            conditional=True,  # If-None-Match / If-Modified-Since / Range を処理する
+            max_age=None,
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry.encoded:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE if entry.immutable else 'no-cache'
+        return response
+
+
+def build_manifest(directory):
+    manifest = {}
+    encoded = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            full_path = os.path.join(root, name)
+            rel_path = os.path.relpath(full_path, directory).replace(os.sep, '/')
+            ext = os.path.splitext(name)[1]
+            if ext in ('.br', '.gz'):
+                encoded.append((rel_path, full_path, ext))
+                continue
+            manifest[rel_path] = StaticEntry(full_path, os.stat(full_path), bool(FINGERPRINT_RE.fullmatch(rel_path)))
+
+    # app.js.br などを元ファイルのエントリに結び付ける
+    for rel_path, full_path, ext in encoded:
+        entry = manifest.get(rel_path[:-len(ext)])
+        if entry is None:
+            continue
+        for encoding, suffix in ENCODINGS:
+            if suffix == ext:
+                entry.encoded[encoding] = (full_path, os.path.getsize(full_path))
+    return manifest
+
+
+def precompress(directory, log=print):
+    """圧縮できる静的ファイルの隣に .gz（と brotli が使えれば .br）を作成する（ビルド時に実行）"""
+    count = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1] not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            if len(data) < MIN_COMPRESS_SIZE:
+                continue
+
+            variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(data, quality=11)
+            for suffix, compressed in variants.items():
+                # 小さくならない場合は作らない
+                if len(compressed) >= len(data):
+                    continue
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+                count += 1
+                log(f"{os.path.relpath(path, directory)}{suffix}: {len(data)} -> {len(compressed)} bytes")
+    return count
+
+
+static_files = StaticFiles()
@@ -0,0 +1,340 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from flask import request
+from flask_uploads import UploadNotAllowed, extension
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+# ハッシュ値から作るファイル名 (sha256 の16進 + 拡張子)。内容が変わればファイル名も変わるため
+# ブラウザに「永久にキャッシュしてよい」と伝えられる
+BLOB_NAME_RE = re.compile(r'^[0-9a-f]{64}(-\d+w)?\.[a-z0-9]+$')
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobMissingError(LookupError):
+    """参照を増やそうとしたファイルが存在しない（確定前の内容もない）"""
+
+
+class BlobStore:
+    """UPLOADED_PHOTOS_DEST 以下に、内容のハッシュ値をファイル名として画像を保存する
+
+    同じ画像を複数のアイテムで使っても実体は1つだけ保存し、blobs テーブルの参照カウントが
+    0 になったときにだけファイルを削除する。
+
+    参照の追加 (acquire) と削除 (collect) は blobs の行のロックで順序付ける:
+    acquire は先に参照カウントを増やして（行をロックして）からファイルを確定・確認し、
+    collect は参照カウントが 0 の行を削除してロックを持ったままファイルを消してからコミットする。
+    そのため「既存のファイルを使う（重複排除）」と判断したアップロードと、最後の参照の削除が同時に起きても、
+    参照されている行がファイルの無いまま残ることはない。
+    """
+
+    def __init__(self, upload_set):
+        self.upload_set = upload_set
+
+    def init_app(self, app):
+        app.extensions['blob_store'] = self
+
+        # ハッシュ名のファイルは内容が変わらないので、長期間キャッシュさせる
+        @app.after_request
+        def set_immutable_cache_headers(response):
+            if request.endpoint == '_uploads.uploaded_file' and response.status_code == 200:
+                filename = (request.view_args or {}).get('filename', '')
+                if BLOB_NAME_RE.match(filename):
+                    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+            return response
+
+    @property
+    def destination(self):
+        return self.upload_set.config.destination
+
+    def save(self, storage):
+        """アップロードされたファイルを一時ファイルに書き込み、確定前の BlobWriter を返す
+
+        ストリームをチャンクごとに読みながらハッシュを計算する（ファイル名は writer.filename）。
+        ハッシュ名での確定は acquire(db, writer.filename, writer=writer) が参照カウントと一緒に行う。
+        確定しなかった場合は writer.abort() で一時ファイルを削除する。
+        """
+        if not storage or not storage.filename:
+            raise ValueError("Filename must not be empty!")
+        writer = self.open_writer(extension(storage.filename))
+        try:
+            while True:
+                chunk = storage.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+            return writer
+        except BaseException:
+            writer.abort()
+            raise
+
+    def open_writer(self, ext, spool_max_size=0):
+        """チャンクを順に書き込んで保存する BlobWriter を返す（拡張子が許可されていなければ UploadNotAllowed）
+
+        spool_max_size バイトまではメモリに溜め、それを超えたら保存先ディレクトリの一時ファイルに書き出す。
+        """
+        ext = ext.lower()
+        if not self.upload_set.extension_allowed(ext):
+            raise UploadNotAllowed()
+        return BlobWriter(self.destination, ext, spool_max_size)
+
+    def acquire(self, db, filename, count=1, writer=None):
+        """filename の参照を count 増やす（呼び出し側のトランザクション内で実行され、commit で確定する）
+
+        writer はこのファイルの確定前の BlobWriter（save() / receive_upload() の結果）。参照カウントを増やして
+        行をロックしてから確定するので、確定から commit までの間に collect() がファイルを消すことはない。
+        ファイルが無い（writer も無い）場合は BlobMissingError。
+        """
+        from .models import Blob
+
+        path = os.path.join(self.destination, filename)
+        size = writer.size if writer is not None else (os.path.getsize(path) if os.path.exists(path) else 0)
+        # 同じ内容の最初のアップロードが同時に来ても IntegrityError にならないよう、1文の UPSERT で増やす
+        values = {'filename': filename, 'size': size, 'ref_count': count}
+        dialect = db.get_bind().dialect.name
+        if dialect in ('sqlite', 'postgresql'):
+            stmt = (sqlite_insert if dialect == 'sqlite' else pg_insert)(Blob).values(**values)
+            stmt = stmt.on_conflict_do_update(index_elements=[Blob.filename],
+                                              set_={'ref_count': Blob.ref_count + count})
+        else:
+            from sqlalchemy.dialects.mysql import insert as mysql_insert
+            stmt = mysql_insert(Blob).values(**values).on_duplicate_key_update(ref_count=Blob.ref_count + count)
+        db.execute(stmt)
+
+        if writer is not None:
+            writer.commit()
+        if not os.path.exists(path):
+            raise BlobMissingError(f"{filename} does not exist.")
+
+    def release(self, db, filename):
+        """filename の参照を1つ減らす（ファイルの削除は commit 後に collect() で行う）"""
+        from .models import Blob
+
+        if filename:
+            db.execute(
+                update(Blob).where(Blob.filename == filename, Blob.ref_count > 0)
+                .values(ref_count=Blob.ref_count - 1)
+            )
+
+    def is_referenced(self, db, filename):
+        from .models import Blob, Item
+
+        ref_count = db.scalar(select(Blob.ref_count).where(Blob.filename == filename))
+        if ref_count is None:
+            # blobs に登録されていない（移行前の）ファイルは、アイテムから参照されているかで判断する
+            ref_count = db.scalar(select(func.count()).select_from(Item).where(Item.image_filename == filename))
+        return ref_count > 0
+
+    def collect(self, filename, variants=None):
+        """どのアイテムからも参照されなくなったファイル（と縮小版）を削除する
+
+        削除した場合は True を返す。
+        """
+        from .database import SessionLocal
+        from .models import Blob
+        from .images import remove_variant_files
+
+        if not filename:
+            return False
+
+        db = SessionLocal()
+        try:
+            # 参照カウントが 0 の行を削除し、そのロックを持ったままファイルを消してからコミットする。
+            # 並行する acquire() はロックが外れるまで待ち、その後にファイルの有無を確認する
+            deleted = db.execute(
+                delete(Blob).where(Blob.filename == filename, Blob.ref_count <= 0)
+            ).rowcount
+            if not deleted and self.is_referenced(db, filename):
+                db.rollback()
+                return False
+
+            path = os.path.join(self.destination, filename)
+            if os.path.exists(path):
+                os.remove(path)
+            remove_variant_files(self.destination, variants)
+            db.commit()
+        finally:
+            db.close()
+        return True
+
+    def backfill(self, db, log=print):
+        """既存のアップロードファイルをハッシュ名に移行し、参照カウントを作り直す
+
+        同じ内容のファイルは1つにまとめられる。移行したアイテムの縮小版は作り直しが必要になるため
+        image_variants をクリアし、移行したアイテムの id のリストを返す。
+        途中で失敗してもアイテムが存在しないファイルを指さないよう、ハッシュ名のファイルを（リンクかコピーで）
+        先に作り、古いファイル名を参照するすべての行を更新してコミットしてから、古いファイルと縮小版を削除する。
+        """
+        from .models import Blob, Item
+        from .images import remove_variant_files
+
+        # 古いファイル名 -> その名前を参照しているアイテム（同じファイルを複数のアイテムが使っている場合がある）
+        referrers = {}
+        for item in db.scalars(select(Item).where(Item.image_filename.is_not(None)).order_by(Item.id)):
+            if not BLOB_NAME_RE.match(item.image_filename):
+                referrers.setdefault(item.image_filename, []).append(item)
+
+        renames = {}
+        for old_name, items in referrers.items():
+            old_path = os.path.join(self.destination, old_name)
+            if not os.path.exists(old_path):
+                log(f"Skipped item(s) {', '.join(str(item.id) for item in items)}: {old_name} does not exist")
+                continue
+
+            hasher = hashlib.sha256()
+            with open(old_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    hasher.update(chunk)
+            new_name = f"{hasher.hexdigest()}.{extension(old_name).lower()}"
+            _link_or_copy(old_path, os.path.join(self.destination, new_name))
+            renames[old_name] = new_name
+
+        migrated = []
+        stale_variants = []
+        for old_name, new_name in renames.items():
+            for item in referrers[old_name]:
+                stale_variants.append(item.image_variants)
+                item.image_filename = new_name
+                if item.image_url and item.image_url.endswith(old_name):
+                    item.image_url = item.image_url[:-len(old_name)] + new_name
+                item.image_variants = None
+                migrated.append(item.id)
+                log(f"Item {item.id}: {old_name} -> {new_name}")
+
+        # 参照カウントをアイテムの実際の参照から作り直す（autoflush=False なので先に変更を反映する）
+        db.flush()
+        db.query(Blob).delete()
+        counts = db.execute(
+            select(Item.image_filename, func.count()).where(Item.image_filename.is_not(None))
+            .group_by(Item.image_filename)
+        ).all()
+        for filename, count in counts:
+            path = os.path.join(self.destination, filename)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            db.add(Blob(filename=filename, size=size, ref_count=count))
+        db.commit()
+
+        # どのアイテムからも参照されなくなった古いファイルと縮小版を削除する
+        for old_name in renames:
+            try:
+                os.remove(os.path.join(self.destination, old_name))
+            except OSError as e:
+                log(f"Could not remove {old_name}: {e}")
+        for variants in stale_variants:
+            remove_variant_files(self.destination, variants)
+        return migrated
+
+
+def _link_or_copy(src, dst):
+    """src と同じ内容のファイルを dst に作る（既にあれば何もしない。ハッシュ名なので内容は同じ）
+
+    ハードリンクできないファイルシステムでは一時ファイルにコピーしてからリネームする（途中の内容を見せない）。
+    """
+    if os.path.exists(dst):
+        return
+    try:
+        os.link(src, dst)
+        return
+    except FileExistsError:
+        return
+    except OSError:
+        pass
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), prefix='.backfill-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out, open(src, 'rb') as f:
+            shutil.copyfileobj(f, out, CHUNK_SIZE)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class BlobWriter:
+    """ハッシュを計算しながら保存先にファイルを書き込む（BlobStore.open_writer() で作る）
+
+    一時ファイルは保存先と同じディレクトリに作るため、commit() はハッシュ名へのリネームだけで済み、
+    内容をコピーし直すことはない。spool_max_size 以下の小さなファイルは commit() まで一時ファイルを作らない。
+    commit() は BlobStore.acquire() が参照カウントを増やした後に呼ぶ。
+    """
+
+    def __init__(self, destination, ext, spool_max_size=0):
+        self.destination = destination
+        self.ext = ext
+        self.spool_max_size = spool_max_size
+        self.size = 0
+        self._hasher = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = None
+        self._tmp_path = None
+        self._committed = False
+
+    @property
+    def filename(self):
+        """書き込んだ内容のハッシュ名"""
+        return f"{self._hasher.hexdigest()}.{self.ext}"
+
+    def write(self, chunk):
+        self._hasher.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.size <= self.spool_max_size:
+            self._buffer += chunk
+            return
+        if self._file is None:
+            self._open_tmp()
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+        self._file.write(chunk)
+
+    def _open_tmp(self):
+        os.makedirs(self.destination, exist_ok=True)
+        fd, self._tmp_path = tempfile.mkstemp(dir=self.destination, prefix='.upload-', suffix='.tmp')
+        self._file = os.fdopen(fd, 'wb')
+
+    def commit(self):
+        """書き込んだ内容をハッシュ名で確定し、ファイル名を返す。同じ内容のファイルが既にあればそれを使う
+
+        確定済みなら何もしない（バッチの複数の行で同じ画像を使う場合など）。
+        """
+        filename = self.filename
+        if self._committed:
+            return filename
+        target = os.path.join(self.destination, filename)
+        try:
+            if self._file is None:
+                if os.path.exists(target):
+                    self._buffer = bytearray()
+                    self._committed = True
+                    return filename  # 重複: メモリに溜めた内容は書き出さずに捨てる
+                self._open_tmp()
+                self._file.write(self._buffer)
+                self._buffer = bytearray()
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+            if os.path.exists(target):
+                os.remove(self._tmp_path)  # 重複: 既存のファイルをそのまま使う
+            else:
+                os.replace(self._tmp_path, target)
+            self._tmp_path = None
+            self._file = None
+            self._committed = True
+            return filename
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """書き込みを中止し、一時ファイルを削除する（確定済みなら何もしない）"""
+        self._buffer = bytearray()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._tmp_path and os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+        self._tmp_path = None
@@ -0,0 +1,162 @@
+from flask_uploads import UploadNotAllowed, extension
+from werkzeug.sansio.multipart import MultipartDecoder, Field, File, Data, Epilogue, NeedData
+from .storage import CHUNK_SIZE
+
+# 画像付きフォーム (multipart/form-data) をストリームのまま解析して保存する
+#
+# Werkzeug の request.files / request.form は本文をすべて受信してから解析するため、フォームの値が不正でも
+# 画像を最後まで受け取り、一時ファイルに書いた後で保存先にもう一度書き込むことになる。
+# ここでは CHUNK_SIZE ずつ読みながらパートを順に処理し、
+#   - 画像のパートが始まった時点で、それまでに届いたテキストフィールドをバリデーションする
+#     （フロントエンドは name / category / price を画像より先に送る）
+#   - 画像の先頭のバイト列（マジックナンバー）を確認し、画像でなければ残りを受信せずに中断する
+#   - 画像のチャンクは BlobWriter で保存先に直接書き込む（一時ファイルをリネームするだけでコピーしない）
+# 1件のアップロードが使うメモリは、読み込みのチャンク + デコーダーのバッファ + テキストフィールド
+# (MAX_FORM_MEMORY_SIZE) + メモリに溜める画像 (UPLOAD_SPOOL_MAX_MEMORY) までに収まる。
+
+# 先頭のバイト列 -> 画像の種類
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+# 拡張子 -> 画像の種類（photos で許可している拡張子）
+EXTENSION_KINDS = {
+    'jpg': 'jpeg', 'jpe': 'jpeg', 'jpeg': 'jpeg',
+    'png': 'png', 'gif': 'gif', 'bmp': 'bmp', 'webp': 'webp', 'svg': 'svg',
+}
+
+# 種類の判定に使う先頭のバイト数
+SNIFF_SIZE = 512
+
+
+class UploadError(ValueError):
+    """アップロードを受け付けられない（status は返す HTTP ステータス）"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sniff_image_type(head):
+    """ファイルの先頭のバイト列から画像の種類を判定する（判定できなければ None）"""
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    text = bytes(head).lstrip(b'\xef\xbb\xbf').lstrip()
+    if text.startswith(b'<svg') or (text.startswith(b'<?xml') and b'<svg' in text):
+        return 'svg'
+    return None
+
+
+class UploadResult:
+    """receive_upload() の結果"""
+
+    def __init__(self, fields, validated, writer):
+        self.fields = fields        # テキストフィールド（文字列の辞書）
+        self.validated = validated  # validate(fields) の戻り値
+        self.writer = writer        # 確定前の画像（blob_store.acquire(..., writer=writer) で確定する）
+        self.filename = writer.filename  # 画像のファイル名（ハッシュ名）
+        self.size = writer.size     # 画像のバイト数
+
+
+def receive_upload(stream, boundary, blob_store, validate, required_fields=(), file_field='image',
+                   spool_max_size=0, max_form_memory_size=None, max_parts=None):
+    """multipart の本文を stream から読みながら解析し、file_field の画像を保存する
+
+    validate(fields) はテキストフィールドを検証して結果を返す関数（不正なら例外を送出する）。
+    required_fields がすべて画像より先に届いた場合は、画像を受信する前にも validate() を呼ぶ。
+    最後にすべてのフィールドでもう一度 validate() を呼び、成功した場合だけ確定前の画像 (BlobWriter) を返す。
+    確定は呼び出し側が blob_store.acquire(db, result.filename, writer=result.writer) で参照カウントと一緒に行い、
+    最後に result.writer.abort() を呼んで確定しなかった一時ファイルを片付ける。
+    画像がない・画像ではない場合は UploadError。validate() の例外はそのまま送出する。
+    """
+    decoder = MultipartDecoder(boundary, max_form_memory_size, max_parts=max_parts)
+    fields = {}
+    field_name, field_value = None, None  # 受信中のテキストフィールド
+    writer, head = None, None              # 受信中の画像（head は種類の判定前に溜める先頭部分）
+    in_file = False
+    complete = False
+
+    try:
+        while not complete:
+            chunk = stream.read(CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, NeedData):
+                if isinstance(event, Epilogue):
+                    complete = True
+                    break
+
+                if isinstance(event, Field):
+                    field_name, field_value, in_file = event.name, bytearray(), False
+
+                elif isinstance(event, File):
+                    field_name, in_file = None, event.name == file_field and writer is None
+                    if in_file:
+                        writer = _open_image_writer(blob_store, event.filename, spool_max_size)
+                        head = bytearray()
+                        # 画像を受信する前に、それまでに届いたフィールドで検証する
+                        if all(name in fields for name in required_fields):
+                            validate(fields)
+
+                elif isinstance(event, Data):
+                    if field_name is not None:
+                        field_value += event.data
+                        if max_form_memory_size is not None and len(field_value) > max_form_memory_size:
+                            raise UploadError('Form field is too large.', 413)
+                        if not event.more_data:
+                            try:
+                                fields[field_name] = field_value.decode('utf-8')
+                            except UnicodeDecodeError:
+                                raise UploadError(f"Form field '{field_name}' is not valid UTF-8.")
+                            field_name, field_value = None, None
+                    elif in_file:
+                        if head is None:
+                            writer.write(event.data)
+                        else:
+                            head += event.data
+                            if len(head) >= SNIFF_SIZE or not event.more_data:
+                                _check_image_type(writer.ext, head)
+                                writer.write(bytes(head))
+                                head = None
+                        if not event.more_data:
+                            in_file = False
+                    # それ以外のパート（別名のファイルなど）は読み捨てる
+
+                event = decoder.next_event()
+
+            if not chunk and not complete:
+                raise UploadError('The request body ended unexpectedly.')
+
+        if writer is None:
+            raise UploadError('There is no image file selected.')
+        validated = validate(fields)
+        return UploadResult(fields, validated, writer)
+
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+
+def _open_image_writer(blob_store, filename, spool_max_size):
+    if not filename:
+        raise UploadError('There is no image file selected.')
+    try:
+        return blob_store.open_writer(extension(filename), spool_max_size)
+    except UploadNotAllowed:
+        raise UploadError('This file type is not allowed.', 415)
+
+
+def _check_image_type(ext, head):
+    kind = sniff_image_type(head)
+    if kind is None:
+        raise UploadError('The uploaded file is not a supported image.', 415)
+    if EXTENSION_KINDS.get(ext) != kind:
+        raise UploadError(f"The file extension .{ext} does not match the image content ({kind}).", 415)
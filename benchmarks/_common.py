@@ -0,0 +1,141 @@
+"""ベンチマーク共通のヘルパー
+
+各ベンチマークは一時ディレクトリに SQLite データベースを作り、環境変数 DATABASE_URL で
+アプリケーションをそこへ向けてから backend を import する。
+"""
+import os
+import random
+import resource
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+CATEGORIES = ['Running', 'Lifestyle', 'Basketball', 'Training', 'Tennis', 'Walking', 'Trail', 'Skate']
+WORDS = ['comfort', 'lightweight', 'breathable', 'mesh', 'cushion', 'street', 'urban', 'classic',
+         'leather', 'knit', 'sole', 'grip', 'support', 'foam', 'retro', 'sleek', 'durable', 'flex']
+# 説明文用の語彙。実際のカタログに近づけるため、音節を組み合わせた数千語から Zipf 的に選ぶ
+_SYLLABLES = ['ka', 'ri', 'to', 'ne', 'mo', 'sa', 'lu', 'vi', 'den', 'por', 'tex', 'al', 'gro', 'fin', 'zu']
+VOCABULARY = WORDS + [a + b + c for a in _SYLLABLES for b in _SYLLABLES for c in _SYLLABLES]
+
+
+def temp_database_url(name='bench.db'):
+    """一時ディレクトリ内の SQLite URL を返し、DATABASE_URL に設定する"""
+    workdir = Path(tempfile.mkdtemp(prefix='vuedemo-bench-'))
+    url = f"sqlite:///{workdir / name}"
+    os.environ['DATABASE_URL'] = url
+    return url, workdir
+
+
+def seed_items(url, count, seed=42, batch_size=10_000):
+    """items テーブルに count 件のダミーデータを高速に投入する
+
+    スキーマは backend.database.init_db() で作成し、データ投入のみ sqlite3 の executemany で行う。
+    """
+    from backend.database import init_db
+    init_db()
+
+    rng = random.Random(seed)
+    base = 1_700_000_000
+    conn = sqlite3.connect(url.removeprefix('sqlite:///'))
+    try:
+        rows = []
+        for i in range(1, count + 1):
+            # 同じ updated_at を持つ行を混ぜて、カーソルの id による順序付けも検証されるようにする
+            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(base + i // 3))
+            name = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()} {i}"
+            description = ' '.join(
+                VOCABULARY[min(int(rng.paretovariate(1.0)) - 1, len(VOCABULARY) - 1)] if rng.random() < 0.3
+                else rng.choice(VOCABULARY)
+                for _ in range(30)
+            )
+            filename = f"item{i}.jpg"
+            rows.append((i, name, description, rng.choice(CATEGORIES), rng.randint(20, 300),
+                         f"http://localhost:5000/_uploads/photos/{filename}", filename, ts, ts))
+            if len(rows) >= batch_size:
+                _insert_items(conn, rows)
+                rows = []
+        if rows:
+            _insert_items(conn, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _insert_items(conn, rows):
+    conn.executemany(
+        "INSERT INTO items (id, name, description, category, price, image_url, image_filename, created_at, updated_at)"
+        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+
+
+def seed_messages(url, count, seed=42, batch_size=10_000):
+    """messages テーブルに count 件のダミーの問い合わせを投入する（スキーマは init_db() で作成する）"""
+    from backend.database import init_db
+    init_db()
+
+    rng = random.Random(seed)
+    base = 1_700_000_000
+    conn = sqlite3.connect(url.removeprefix('sqlite:///'))
+    try:
+        rows = []
+        for i in range(1, count + 1):
+            ts = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(base + i * 60))
+            username = f"user{rng.randrange(count // 4 + 1)}"
+            message = ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(5, 80)))
+            rows.append((username, f"{username}@example.com", message, f"00000000-0000-4000-8000-{i:012d}", ts))
+            if len(rows) >= batch_size:
+                _insert_messages(conn, rows)
+                rows = []
+        if rows:
+            _insert_messages(conn, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _insert_messages(conn, rows):
+    conn.executemany(
+        "INSERT INTO messages (username, email, message, client_id, created_at) VALUES (?, ?, ?, ?, ?)", rows
+    )
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples_ms):
+    return {
+        'n': len(samples_ms),
+        'p50_ms': round(percentile(samples_ms, 50), 3),
+        'p99_ms': round(percentile(samples_ms, 99), 3),
+        'mean_ms': round(statistics.fmean(samples_ms), 3) if samples_ms else 0.0,
+    }
+
+
+def peak_rss_mb():
+    """このプロセスのピーク RSS (MB)。Linux では ru_maxrss は KB 単位"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return round(usage / 1024 / 1024, 1)
+    return round(usage / 1024, 1)
+
+
+def time_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
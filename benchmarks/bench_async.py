@@ -0,0 +1,170 @@
+"""同期モード (Gunicorn gthread) と非同期モード (uvicorn + asgi.py) の、遅いクライアントが多数いる場合の比較
+
+どちらもワーカープロセス1つで起動し、--clients 本の接続を同時に張り続けるクライアントから次の2種類を送る。
+
+slow-db   : GET /api/item/<id>。FAULT_INJECTION で --db-delay-ms の遅延を入れて、遅いデータベースを再現する
+slow-body : POST /api/message。本文を --body-chunks 回に分けて --body-interval-ms ごとに送る（遅い回線のクライアント）
+
+スレッド数を固定した同期モードは、DB を待つ間もスレッドを占有するため、同時に処理できるリクエスト数が
+スレッド数で頭打ちになる（スレッドを増やすとその分メモリを使う）。サーバーのプロセスツリー全体のピーク RSS も表示する。
+slow-body は比較用: Gunicorn はデータが届いた接続だけをスレッドに渡し、順番待ちの間に本文が届き終わるため、
+クライアントが多い場合はどちらのモードでも差が出にくい。
+
+使い方:
+    python benchmarks/bench_async.py --clients 1000 --duration 15 --threads 4 64
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+from _common import temp_database_url, seed_items, summarize
+from loadtest import free_port, start_server
+
+
+def process_tree_rss_mb(root_pid):
+    """root_pid とその子孫プロセスの RSS の合計 (MB)"""
+    children = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+
+    total_kb, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            pass
+    return total_kb / 1024
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+
+    def run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, process_tree_rss_mb(self.pid))
+
+    def stop(self):
+        self._stop.set()
+        self.join()
+        return self.peak
+
+
+async def request(port, method, path, body=b'', chunks=1, interval=0.0, timeout=60):
+    """1リクエストを送り、ステータスコードを返す（本文は chunks 回に分けて interval 秒ごとに送る）"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    try:
+        head = (f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n')
+        writer.write(head.encode())
+        size = -(-len(body) // chunks) if body else 0
+        for i in range(chunks if body else 0):
+            if i:
+                await asyncio.sleep(interval)
+            writer.write(body[i * size:(i + 1) * size])
+            await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        await asyncio.wait_for(reader.read(), timeout)
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def run_clients(port, scenario, clients, duration, args):
+    latencies, errors = [], [0]
+    stop_at = time.perf_counter() + duration
+
+    async def client(n):
+        i = 0
+        while time.perf_counter() < stop_at:
+            i += 1
+            start = time.perf_counter()
+            try:
+                if scenario == 'slow-db':
+                    status = await request(port, 'GET', f'/api/item/{(n * 7 + i) % args.items + 1}')
+                else:
+                    body = json.dumps({'username': f'user{n}', 'email': f'user{n}@example.com',
+                                       'message': f'Hello from client {n}, request {i}.'}).encode()
+                    status = await request(port, 'POST', '/api/message', body,
+                                           args.body_chunks, args.body_interval_ms / 1000)
+                if status >= 400:
+                    raise OSError(status)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                errors[0] += 1
+                await asyncio.sleep(0.1)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(n) for n in range(clients)))
+    # duration の終了時に処理中だったリクエストの完了も待つので、実際にかかった時間で割る
+    result = summarize(latencies)
+    result['rps'] = round(len(latencies) / (time.perf_counter() - started), 1)
+    result['errors'] = errors[0]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[4, 64], help='同期モードのスレッド数')
+    parser.add_argument('--db-delay-ms', type=int, default=200)
+    parser.add_argument('--body-chunks', type=int, default=4)
+    parser.add_argument('--body-interval-ms', type=int, default=250)
+    parser.add_argument('--scenarios', nargs='+', default=['slow-db', 'slow-body'])
+    args = parser.parse_args()
+
+    url, _ = temp_database_url()
+    seed_items(url, args.items)
+
+    # キャッシュが効くと遅延注入の前に応答できないため無効にする（遅延は before_request で入る）
+    # Gunicorn は接続数の上限に達すると止まり、N リクエストごとのワーカーの入れ替えでも接続が切れるため、どちらも外す
+    env = dict(os.environ, DATABASE_URL=url, WEB_CONCURRENCY='1', RESPONSE_CACHE_BACKEND='none',
+               UVICORN_ACCESSLOG='False', IMAGE_PIPELINE='off', METRICS_ENABLED='False',
+               GUNICORN_WORKER_CONNECTIONS=str(args.clients * 2), GUNICORN_MAX_REQUESTS='0',
+               FAULT_INJECTION=json.dumps([{'path': '/api/item/*', 'delay_ms': args.db_delay_ms}]))
+
+    servers = [(f'sync/{threads}t', 'production', {'GUNICORN_THREADS': str(threads)}) for threads in args.threads]
+    servers.append(('async', 'async', {}))
+
+    print(f"clients={args.clients} duration={args.duration}s db_delay={args.db_delay_ms}ms "
+          f"body={args.body_chunks}x{args.body_interval_ms}ms")
+    print(f"{'server':<10} {'scenario':<10} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'peak RSS MB':>12}")
+    for label, mode, extra_env in servers:
+        port = free_port()
+        proc = start_server(mode, port, dict(env, **extra_env))
+        try:
+            for scenario in args.scenarios:
+                sampler = RssSampler(proc.pid)
+                sampler.start()
+                r = asyncio.run(run_clients(port, scenario, args.clients, args.duration, args))
+                peak = sampler.stop()
+                print(f"{label:<10} {scenario:<10} {r['rps']:>8} {r['p50_ms']:>9} {r['p99_ms']:>9} "
+                      f"{r['errors']:>7} {peak:>12.1f}")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""50件のグリッドの読み込み: /api/item/<id> を件数分呼ぶ場合と /api/items?ids= で1回にまとめる場合の比較
+
+サーバーを子プロセスで起動し（loadtest.py と同じ）、Keep-Alive 接続で1グリッド分を読み込むまでの時間を測る。
+
+single    : /api/item/<id> を1件ずつ順番に呼ぶ
+single x6 : 6本の接続で並行に呼ぶ（HTTP/1.1 のブラウザの同時接続数）
+batch     : /api/items?ids=... を1回
+
+グリッドは毎回ランダムに選ぶので、レスポンス全体のキャッシュ（URL 単位）にはほぼ当たらない。
+RESPONSE_CACHE_BACKEND=memory（既定）では batch も id ごとのキャッシュに当たる分が増えていく。
+
+使い方:
+    python benchmarks/bench_batch.py --items 20000 --grid 50 --repeat 50
+    python benchmarks/bench_batch.py --cache none --mode production
+"""
+import argparse
+import http.client
+import os
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _common import temp_database_url, seed_items, percentile
+from loadtest import free_port, start_server
+
+
+class Client:
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def get(self, path):
+        try:
+            self.conn.request('GET', path)
+            response = self.conn.getresponse()
+        except (ConnectionError, http.client.RemoteDisconnected):
+            # サーバーが Keep-Alive のタイムアウトで閉じた接続は張り直す
+            self.conn.close()
+            self.conn.request('GET', path)
+            response = self.conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path} -> {response.status}")
+        return body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=20_000)
+    parser.add_argument('--grid', type=int, default=50, help='1グリッドのアイテム数')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--parallel', type=int, default=6)
+    parser.add_argument('--cache', default='memory', choices=['memory', 'none'])
+    parser.add_argument('--mode', default='production', choices=['development', 'production', 'async'])
+    args = parser.parse_args()
+
+    url, _ = temp_database_url()
+    seed_items(url, args.items)
+    env = dict(os.environ, RESPONSE_CACHE_BACKEND=args.cache, IMAGE_PIPELINE='off', METRICS_ENABLED='False')
+    port = free_port()
+    server = start_server(args.mode, port, env)
+    try:
+        rng = random.Random(42)
+        single = Client(port)
+        batch = Client(port)
+        pool_clients = [Client(port) for _ in range(args.parallel)]
+        pool = ThreadPoolExecutor(args.parallel)
+
+        def load_single(ids):
+            return sum(len(single.get(f'/api/item/{i}')) for i in ids)
+
+        def load_parallel(ids):
+            chunks = [ids[n::args.parallel] for n in range(args.parallel)]
+            return sum(pool.map(lambda pair: sum(len(pair[0].get(f'/api/item/{i}')) for i in pair[1]),
+                                zip(pool_clients, chunks)))
+
+        def load_batch(ids):
+            return len(batch.get('/api/items?ids=' + ','.join(map(str, ids))))
+
+        modes = {'single': load_single, f'single x{args.parallel}': load_parallel, 'batch': load_batch}
+        samples = {name: [] for name in modes}
+        sizes = {}
+        for _ in range(args.repeat):
+            ids = rng.sample(range(1, args.items + 1), args.grid)
+            for name, load in modes.items():
+                started = time.perf_counter()
+                sizes[name] = load(ids)
+                samples[name].append((time.perf_counter() - started) * 1000)
+        pool.shutdown()
+    finally:
+        server.kill()
+        server.wait()
+
+    print(f"mode={args.mode} cache={args.cache} items={args.items} grid={args.grid} repeat={args.repeat}")
+    print(f"{'':<12} {'requests':>8} {'bytes':>9} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8}")
+    for name, values in samples.items():
+        requests = 1 if name == 'batch' else args.grid
+        print(f"{name:<12} {requests:>8} {sizes[name]:>9} {statistics.median(values):>8.2f} "
+              f"{percentile(values, 95):>8.2f} {statistics.fmean(values):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""API レスポンスの圧縮 (compression.py): 転送量とリクエストあたりの CPU 時間
+
+各エンドポイントに Accept-Encoding を変えてリクエストし、転送するバイト数と、1リクエストあたりの CPU 時間
+(time.process_time) を表示する。
+
+cached  : 既定の設定（response_cache と圧縮結果の保存あり）。2回目以降は圧縮し直さない
+uncached: RESPONSE_CACHE_BACKEND=none / RESPONSE_COMPRESSION_CACHE_MAX_BYTES=0（毎回シリアライズして圧縮する）
+
+identity との CPU 時間の差が圧縮のコストになる。
+
+使い方:
+    python benchmarks/bench_compression.py --items 2000 --repeat 200
+    RESPONSE_COMPRESSION_BR_LEVEL=6 python benchmarks/bench_compression.py
+"""
+import argparse
+import os
+import time
+
+from _common import temp_database_url, seed_items
+
+PATHS = [
+    '/api/items',  # 全件（既存フロントエンドの一覧）
+    '/api/items?limit=50',
+    '/api/items/browse?category=Running&limit=24',
+    '/api/items/search?q=comfort',
+    '/api/item/1',
+]
+ENCODINGS = ('identity', 'gzip', 'br', 'zstd')
+MODES = {
+    'cached': {},
+    'uncached': {'RESPONSE_CACHE_BACKEND': 'none', 'RESPONSE_COMPRESSION_CACHE_MAX_BYTES': '0'},
+}
+
+
+def measure(client, path, encoding, repeat):
+    headers = {'Accept-Encoding': encoding}
+    response = client.get(path, headers=headers)  # キャッシュを温める
+    used = response.headers.get('Content-Encoding', 'identity')
+    size = len(response.get_data())
+
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    for _ in range(repeat):
+        client.get(path, headers=headers).get_data()
+    cpu = (time.process_time() - cpu_started) / repeat * 1000
+    wall = (time.perf_counter() - wall_started) / repeat * 1000
+    return used, size, cpu, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    url, _ = temp_database_url()
+    seed_items(url, args.items)
+    os.environ.setdefault('IMAGE_PIPELINE', 'off')
+    os.environ.setdefault('METRICS_ENABLED', 'False')
+
+    from backend import create_app
+    from backend.database import init_db
+    from backend.compression import available_encodings
+
+    init_db()  # seed_items() の後にファセットの集計テーブルを作る
+    print(f"available: {', '.join(available_encodings())}")
+
+    for mode, env in MODES.items():
+        os.environ.update(env)
+        app = create_app()
+        app.logger.disabled = True
+        client = app.test_client()
+        levels = {name: app.config[f'RESPONSE_COMPRESSION_{key}_LEVEL']
+                  for name, key in (('gzip', 'GZIP'), ('br', 'BR'), ('zstd', 'ZSTD'))}
+        print(f"\n[{mode}] levels: " + ', '.join(f"{name}={level}" for name, level in levels.items()))
+        print(f"{'path':<45} {'encoding':<9} {'bytes':>9} {'ratio':>6} {'cpu ms/req':>11} {'wall ms/req':>12}")
+        for path in PATHS:
+            identity_size = None
+            for encoding in ENCODINGS:
+                used, size, cpu, wall = measure(client, path, encoding, args.repeat)
+                if encoding == 'identity':
+                    identity_size = size
+                elif used == 'identity':
+                    continue  # この環境では使えない形式（または小さすぎて圧縮されなかった）
+                print(f"{path:<45} {used:<9} {size:>9} {size / identity_size:>6.2f} {cpu:>11.3f} {wall:>12.3f}")
+        for key in env:
+            del os.environ[key]
+
+
+if __name__ == '__main__':
+    main()
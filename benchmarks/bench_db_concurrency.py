@@ -0,0 +1,112 @@
+"""SQLite の設定ごとの同時実行スループット（問い合わせフォームの書き込み + カタログの読み込み）
+
+default : 従来の SQLite 既定値 (rollback journal, synchronous=FULL, mmap なし)
+tuned   : database.py の既定プロファイル (WAL, synchronous=NORMAL, mmap, cache_size)
+
+使い方:
+    python benchmarks/bench_db_concurrency.py --readers 8 --writers 4 --duration 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from _common import temp_database_url, seed_items, summarize
+
+PROFILES = {
+    'default': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL',
+                'SQLITE_MMAP_SIZE': '0', 'SQLITE_CACHE_SIZE': '-2000'},
+    'tuned': {},
+}
+
+
+def run_child(readers, writers, duration, items):
+    url, _ = temp_database_url()
+    seed_items(url, items)
+
+    from backend import create_app
+    app = create_app()
+
+    results = {'read': [], 'write': []}
+    errors = {'read': 0, 'write': 0}
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def reader():
+        client = app.test_client()
+        latencies, failed = [], 0
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            if client.get('/api/items?limit=50').status_code == 200:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                failed += 1
+        with lock:
+            results['read'].extend(latencies)
+            errors['read'] += failed
+
+    def writer(n):
+        client = app.test_client()
+        latencies, failed, i = [], 0, 0
+        while time.time() < stop_at:
+            i += 1
+            payload = {'username': f'user{n}', 'email': f'user{n}@example.com', 'message': f'hello {i}'}
+            start = time.perf_counter()
+            if client.post('/api/message', json=payload).status_code in (201, 202):
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                failed += 1
+        with lock:
+            results['write'].extend(latencies)
+            errors['write'] += failed
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    out = {}
+    for kind in ('read', 'write'):
+        r = summarize(results[kind])
+        r['ops'] = round(len(results[kind]) / duration, 1)
+        r['errors'] = errors[kind]
+        out[kind] = r
+    print(json.dumps(out))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--items', type=int, default=10_000)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.readers, args.writers, args.duration, args.items)
+        return
+
+    print(f"readers={args.readers} writers={args.writers} duration={args.duration}s items={args.items}")
+    print(f"{'profile':<8} {'kind':<6} {'ops/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for profile, overrides in PROFILES.items():
+        # キャッシュが効くと読み込みが DB に届かないので無効にする
+        env = dict(os.environ, RESPONSE_CACHE_BACKEND='none', **overrides)
+        out = subprocess.run(
+            [sys.executable, __file__, '--child', '--readers', str(args.readers), '--writers', str(args.writers),
+             '--duration', str(args.duration), '--items', str(args.items)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        for kind in ('read', 'write'):
+            k = r[kind]
+            print(f"{profile:<8} {kind:<6} {k['ops']:>8} {k['p50_ms']:>9} {k['p99_ms']:>9} {k['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""絞り込み検索のファセット件数: 集計テーブル (item_facet_counts) と items の GROUP BY の比較
+
+summary : facets.facet_counts()（集計テーブル + 範囲の端の価格帯だけ items のインデックスで数える）
+group_by: 同じ件数を毎回 items の GROUP BY で集計する
+browse  : facets.browse_items() の1ページ目（50件）
+
+使い方:
+    python benchmarks/bench_facets.py --rows 1000000
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from _common import temp_database_url, seed_items, time_call, CATEGORIES
+
+# (ラベル, categories, min_price, max_price, sort)
+QUERIES = [
+    ('no filter', None, None, None, 'newest'),
+    ('1 category', ['Running'], None, None, 'newest'),
+    ('2 categories', ['Running', 'Tennis'], None, None, 'price_asc'),
+    ('price on buckets', None, 100, 199, 'price_asc'),
+    ('price off buckets', None, 75, 180, 'price_desc'),
+    ('category + price', ['Trail'], 120, 260, 'name'),
+]
+
+
+def run_child(rows, repeat):
+    url, _ = temp_database_url()
+    started = time.perf_counter()
+    seed_items(url, rows)
+    seed_seconds = time.perf_counter() - started
+
+    from sqlalchemy import select, func
+    from backend.database import SessionLocal
+    from backend.facets import browse_items, facet_counts, rebuild_facet_counts, _bucket_expression, _filters
+    from backend.models import Item
+    from backend.serialization import ITEM_SERIALIZER
+
+    def group_by(db, categories, min_price, max_price):
+        bucket = _bucket_expression()
+        by_bucket = db.execute(
+            select(bucket, func.count()).where(*_filters(categories)).group_by(bucket)
+        ).all()
+        by_category = db.execute(
+            select(Item.category, func.count()).where(*_filters(None, min_price, max_price)).group_by(Item.category)
+        ).all()
+        return by_bucket, by_category
+
+    results = {'seed_s': seed_seconds, 'queries': {}}
+    db = SessionLocal()
+    try:
+        # seed_items() は sqlite3 で直接 INSERT するため、集計テーブルはここで作る
+        results['rebuild_ms'] = time_call(lambda: rebuild_facet_counts(db), 1)[0]
+        for label, categories, min_price, max_price, sort in QUERIES:
+            # 集計テーブルの結果が GROUP BY と一致することを確認する
+            facets, _ = facet_counts(db, categories, min_price, max_price)
+            _, expected = group_by(db, categories, min_price, max_price)
+            assert {f['value']: f['count'] for f in facets['category']} == dict(expected), label
+
+            results['queries'][label] = {
+                'summary_ms': statistics.median(time_call(
+                    lambda: facet_counts(db, categories, min_price, max_price), repeat)),
+                'group_by_ms': statistics.median(time_call(
+                    lambda: group_by(db, categories, min_price, max_price), repeat)),
+                'browse_ms': statistics.median(time_call(
+                    lambda: browse_items(db, ITEM_SERIALIZER.columns, categories, min_price, max_price, sort, 50),
+                    repeat)),
+            }
+    finally:
+        db.close()
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.rows, args.repeat)
+        return
+
+    out = subprocess.run(
+        [sys.executable, __file__, '--child', '--rows', str(args.rows), '--repeat', str(args.repeat)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    r = json.loads(out.strip().splitlines()[-1])
+    print(f"rows={args.rows} categories={len(CATEGORIES)} seed={r['seed_s']:.1f}s rebuild={r['rebuild_ms']:.0f}ms")
+    print(f"{'query':<18} {'summary ms':>10} {'group_by ms':>11} {'speedup':>8} {'browse ms':>9}")
+    for label, k in r['queries'].items():
+        print(f"{label:<18} {k['summary_ms']:>10.2f} {k['group_by_ms']:>11.1f} "
+              f"{k['group_by_ms'] / k['summary_ms']:>7.0f}x {k['browse_ms']:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
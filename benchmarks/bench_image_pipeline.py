@@ -0,0 +1,99 @@
+"""画像パイプラインのベンチマーク
+
+- POST /api/admin/create-item のレイテンシ（縮小版をリクエスト内で生成 vs プロセスプールに任せる）
+- カード表示 (幅 640px 程度) で配信されるバイト数（元の JPEG vs 縮小版）
+
+使い方:
+    python benchmarks/bench_image_pipeline.py --uploads 10 --size 3000x2000
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from _common import temp_database_url, summarize
+
+
+def make_photo(width, height, seed):
+    """写真に近い（圧縮しにくい）テスト用 JPEG を作る"""
+    from PIL import Image, ImageFilter
+    noise = [Image.effect_noise((width // 4, height // 4), 64 + seed % 32) for _ in range(3)]
+    image = Image.merge('RGB', noise).resize((width, height)).filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=92)
+    return buffer.getvalue()
+
+
+def run_child(mode, uploads, size):
+    os.environ['IMAGE_PIPELINE'] = mode
+    os.environ['UPLOADED_PHOTOS_DEST'] = tempfile.mkdtemp(prefix='vuedemo-uploads-')
+    url, _ = temp_database_url()
+
+    from backend import create_app
+    from backend.database import init_db, SessionLocal
+    from backend.images import image_pipeline
+    from backend.models import Item
+    init_db()
+    app = create_app()
+    client = app.test_client()
+
+    width, height = (int(v) for v in size.split('x'))
+    photos = [make_photo(width, height, i) for i in range(uploads + 1)]
+
+    def upload(i):
+        data = {'name': f'Bench {i}', 'category': 'Running', 'price': '100',
+                'image': (io.BytesIO(photos[i]), f'bench{i}.jpg')}
+        start = time.perf_counter()
+        response = client.post('/api/admin/create-item', data=data, content_type='multipart/form-data')
+        elapsed = (time.perf_counter() - start) * 1000
+        assert response.status_code == 201, response.get_data(as_text=True)
+        return elapsed
+
+    upload(uploads)  # ウォームアップ（プロセスプールの起動を計測から外す）
+    latencies = [upload(i) for i in range(uploads)]
+
+    start = time.perf_counter()
+    image_pipeline.shutdown()  # 残りの処理が終わるまで待つ
+    drain_s = time.perf_counter() - start
+
+    db = SessionLocal()
+    original_bytes, card_bytes = 0, 0
+    for item in db.query(Item).all():
+        original_bytes += os.path.getsize(os.path.join(app.config['UPLOADED_PHOTOS_DEST'], item.image_filename))
+        # 幅 640 の表示で選ばれる縮小版（最も小さい形式）
+        candidates = [v for v in item.image_variants or [] if v['width'] >= 640] or item.image_variants or []
+        card_bytes += min(v['bytes'] for v in candidates) if candidates else 0
+    db.close()
+
+    result = summarize(latencies)
+    result.update({'mode': mode, 'drain_s': round(drain_s, 2),
+                   'original_kb': round(original_bytes / 1024), 'card_kb': round(card_bytes / 1024)})
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=10)
+    parser.add_argument('--size', default='3000x2000')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.uploads, args.size)
+        return
+
+    print(f"uploads={args.uploads} size={args.size}")
+    print(f"{'mode':<8} {'p50 ms':>9} {'p99 ms':>9} {'drain s':>8} {'original KB':>12} {'640w KB':>8}")
+    for mode in ('inline', 'process'):
+        out = subprocess.run([sys.executable, __file__, '--uploads', str(args.uploads), '--size', args.size,
+                              '--child', mode], check=True, capture_output=True, text=True).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        print(f"{r['mode']:<8} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['drain_s']:>8} {r['original_kb']:>12} {r['card_kb']:>8}")
+
+
+if __name__ == '__main__':
+    main()
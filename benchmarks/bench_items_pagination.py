@@ -0,0 +1,80 @@
+"""GET /api/items のベンチマーク（全件取得 vs カーソルページネーション vs fields 射影）
+
+使い方:
+    python benchmarks/bench_items_pagination.py                 # 1k / 100k / 1M 件
+    python benchmarks/bench_items_pagination.py --sizes 1000 10000
+
+ピーク RSS はプロセス単位でしか測れないため、(件数, シナリオ) ごとに子プロセスで計測する。
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from _common import temp_database_url, seed_items, summarize, peak_rss_mb, time_call
+
+SCENARIOS = {
+    # シナリオ名: (クエリ文字列, 計測前にたどるページ数)
+    'legacy_full_list': ('', 0),
+    'first_page': ('?limit=50', 0),
+    'deep_page': ('?limit=50', 100),
+    'projection': ('?limit=50&fields=id,name,price', 0),
+}
+
+
+def run_child(size, scenario, repeat):
+    url, _ = temp_database_url()
+    seed_items(url, size)
+
+    from backend import create_app
+    app = create_app()
+    client = app.test_client()
+    query, skip_pages = SCENARIOS[scenario]
+
+    path = f'/api/items{query}'
+    for _ in range(skip_pages):
+        cursor = client.get(path).get_json()['next_cursor']
+        if cursor is None:  # 件数が少ない場合は最後のページを計測する
+            break
+        path = f'/api/items{query}&cursor={cursor}'
+
+    def request():
+        response = client.get(path)
+        assert response.status_code == 200, response.status_code
+
+    request()  # ウォームアップ
+    result = summarize(time_call(request, repeat))
+    result.update({'size': size, 'scenario': scenario, 'peak_rss_mb': peak_rss_mb()})
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help='全件取得シナリオを実行する最大件数（それより大きいと数GBのメモリを使うため）')
+    parser.add_argument('--child', nargs=2, metavar=('SIZE', 'SCENARIO'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(int(args.child[0]), args.child[1], args.repeat)
+        return
+
+    print(f"{'size':>9} {'scenario':<18} {'p50 ms':>9} {'p99 ms':>9} {'peak RSS MB':>12}")
+    for size in args.sizes:
+        for scenario in SCENARIOS:
+            if scenario == 'legacy_full_list' and size > args.legacy_max:
+                continue
+            # 全件取得は重いので繰り返し回数を抑える
+            repeat = min(args.repeat, 5) if scenario == 'legacy_full_list' else args.repeat
+            out = subprocess.run(
+                [sys.executable, __file__, '--repeat', str(repeat), '--child', str(size), scenario],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['size']:>9} {r['scenario']:<18} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['peak_rss_mb']:>12}")
+
+
+if __name__ == '__main__':
+    main()
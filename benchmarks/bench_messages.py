@@ -0,0 +1,103 @@
+"""問い合わせフォームの書き込みスループット（同期 INSERT と write-behind キューの比較）
+
+sync  : リクエストごとに1件 INSERT してコミットする（従来の動作）
+async : キューに入れて 202 を返し、バックグラウンドでまとめて INSERT する (MESSAGE_WRITE_MODE=async)
+
+async の ops/s は受け付けの速さで、drain はキューに残ったメッセージを書き終えるまでの時間。
+最後に DB の件数と受け付けた件数が一致することを確認する。
+
+使い方:
+    python benchmarks/bench_messages.py --writers 8 --duration 10
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from _common import temp_database_url, summarize
+
+MODES = ('sync', 'async')
+
+
+def run_child(writers, duration):
+    url, _ = temp_database_url()
+    from backend.database import init_db
+    init_db()
+
+    from backend import create_app
+    from backend.message_queue import message_writer
+    app = create_app()
+
+    latencies, accepted, errors = [], [0], [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def writer(n):
+        client = app.test_client()
+        local, ok, failed, i = [], 0, 0, 0
+        while time.time() < stop_at:
+            i += 1
+            payload = {'username': f'user{n}', 'email': f'user{n}@example.com', 'message': f'hello {i}'}
+            start = time.perf_counter()
+            if client.post('/api/message', json=payload).status_code in (201, 202):
+                local.append((time.perf_counter() - start) * 1000)
+                ok += 1
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            accepted[0] += ok
+            errors[0] += failed
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    start = time.perf_counter()
+    message_writer.shutdown()
+    drain = time.perf_counter() - start
+
+    conn = sqlite3.connect(url.removeprefix('sqlite:///'))
+    rows = conn.execute('SELECT count(*) FROM messages').fetchone()[0]
+    conn.close()
+
+    r = summarize(latencies)
+    r.update(ops=round(accepted[0] / duration, 1), errors=errors[0], drain_s=round(drain, 2),
+             accepted=accepted[0], rows=rows)
+    print(json.dumps(r))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.writers, args.duration)
+        return
+
+    print(f"writers={args.writers} duration={args.duration}s")
+    print(f"{'mode':<6} {'ops/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7} {'drain s':>8} {'rows':>8}")
+    for mode in MODES:
+        env = dict(os.environ, MESSAGE_WRITE_MODE=mode, MESSAGE_SPILL_DIR=tempfile.mkdtemp(prefix='vuedemo-spill-'))
+        out = subprocess.run(
+            [sys.executable, __file__, '--child', '--writers', str(args.writers), '--duration', str(args.duration)],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        check = '' if r['rows'] == r['accepted'] else f"  (accepted {r['accepted']})"
+        print(f"{mode:<6} {r['ops']:>8} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['errors']:>7} "
+              f"{r['drain_s']:>8} {r['rows']:>8}{check}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""計測 (metrics.py) を有効にしたときのリクエストごとのオーバーヘッド
+
+同じプロセス内に、計測なしと計測あり（WSGI ミドルウェア + SQL のリスナー）の2つの WSGI アプリを用意し、
+どちらも1リクエストで --queries 回 SQL を実行する。両者を交互に --batch 回ずつ --rounds 回実行して、
+最も速かった回の1リクエストあたりの時間の差をオーバーヘッドとする。
+（プロセスを分けて比較すると、このオーバーヘッドよりマシンの揺らぎの方が大きくなるため）
+
+使い方:
+    python benchmarks/bench_metrics.py --queries 1 3 10
+"""
+import argparse
+import time
+
+from _common import ROOT  # noqa: F401  (backend を import できるようにする)
+
+
+def make_app(engine, queries):
+    from sqlalchemy import text
+
+    def app(environ, start_response):
+        with engine.connect() as conn:
+            for _ in range(queries):
+                conn.execute(text('SELECT 1')).scalar()
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'ok']
+
+    return app
+
+
+def run_batch(app, environ, batch):
+    start_response = lambda status, headers, exc_info=None: None  # noqa: E731
+    start = time.perf_counter()
+    for _ in range(batch):
+        app(environ, start_response)
+    return (time.perf_counter() - start) / batch * 1e6  # us / request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, nargs='+', default=[1, 3, 10])
+    parser.add_argument('--batch', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=9)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+    from backend.metrics import Metrics
+
+    metrics = Metrics()
+    metrics.enabled = True
+    metrics.slow_query_seconds = 1.0
+
+    environ = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/'}
+    print(f"batch={args.batch} rounds={args.rounds}")
+    print(f"{'queries':>7} {'off us':>8} {'on us':>8} {'overhead us':>12}")
+    for queries in args.queries:
+        plain_engine = create_engine('sqlite://')
+        instrumented_engine = create_engine('sqlite://')
+        metrics.instrument_engine(instrumented_engine)
+        plain = make_app(plain_engine, queries)
+        instrumented = metrics._wrap(make_app(instrumented_engine, queries))
+
+        off, on = [], []
+        run_batch(plain, environ, 200)  # ウォームアップ
+        run_batch(instrumented, environ, 200)
+        for _ in range(args.rounds):
+            off.append(run_batch(plain, environ, args.batch))
+            on.append(run_batch(instrumented, environ, args.batch))
+        print(f"{queries:>7} {min(off):>8.1f} {min(on):>8.1f} {min(on) - min(off):>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""問い合わせメッセージのアーカイブ (retention.py): DB のサイズ、INSERT のレイテンシ、アーカイブの書き出しと検索
+
+messages に --messages 件（1分おきの created_at）を入れ、古い方から (1 - --keep) の割合をアーカイブに移す。
+アーカイブの前後で、問い合わせ1件の INSERT + コミットのレイテンシ（save_message の同期モードと同じ）と
+DB ファイルのサイズを比べ、アーカイブの書き出し・incremental vacuum・アーカイブの検索の時間を表示する。
+
+使い方:
+    python benchmarks/bench_retention.py --messages 200000 --keep 0.1
+    python benchmarks/bench_retention.py --compression gzip
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from _common import temp_database_url, seed_messages, summarize, peak_rss_mb
+
+SEED_BASE = 1_700_000_000  # seed_messages() の created_at の起点（1件ごとに60秒ずつ進む）
+
+
+def insert_latencies(count):
+    from backend.database import SessionLocal
+    from backend.models import Message
+
+    samples = []
+    db = SessionLocal()
+    try:
+        for i in range(count):
+            started = time.perf_counter()
+            db.add(Message(username=f'bench{i}', email=f'bench{i}@example.com', message='hello ' * 20))
+            db.commit()
+            samples.append((time.perf_counter() - started) * 1000)
+    finally:
+        db.close()
+    return summarize(samples)
+
+
+def file_size(path):
+    return sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=200_000)
+    parser.add_argument('--keep', type=float, default=0.1, help='DB に残す新しいメッセージの割合')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--compression', default='auto', choices=['auto', 'zstd', 'gzip'])
+    parser.add_argument('--inserts', type=int, default=2000, help='レイテンシを測る INSERT の回数')
+    args = parser.parse_args()
+
+    url, workdir = temp_database_url()
+    seed_messages(url, args.messages)
+    path = url.removeprefix('sqlite:///')
+    archive_dir = str(workdir / 'archive')
+
+    from backend.database import SessionLocal, engine
+    from backend.retention import archive_messages, incremental_vacuum, iter_archived_messages, list_partitions
+
+    def report(label, r):
+        print(f"{label:<24} p50 {r['p50_ms']:>7.3f} ms  p99 {r['p99_ms']:>7.3f} ms  db {file_size(path) / 1e6:>8.1f} MB")
+
+    print(f"messages={args.messages} keep={args.keep} batch={args.batch_size}")
+    report('insert (before)', insert_latencies(args.inserts))
+
+    cutoff = datetime.fromtimestamp(SEED_BASE + args.messages * (1 - args.keep) * 60, timezone.utc)
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        result = archive_messages(db, archive_dir, cutoff, args.batch_size, args.compression)
+    finally:
+        db.close()
+    archive_s = time.perf_counter() - started
+    archive_bytes = sum(os.path.getsize(p) for _, p in list_partitions(archive_dir))
+    print(f"archive: {result.archived} message(s) in {archive_s:.2f} s ({result.archived / archive_s:,.0f} msg/s), "
+          f"{len(list_partitions(archive_dir))} partition(s), {archive_bytes / 1e6:.2f} MB "
+          f"({archive_bytes / max(result.archived, 1):.1f} bytes/msg)")
+    print(f"db after archive (before vacuum): {file_size(path) / 1e6:.1f} MB")
+
+    started = time.perf_counter()
+    freed = incremental_vacuum(engine)
+    print(f"incremental vacuum: {freed} page(s) in {time.perf_counter() - started:.2f} s")
+    report('insert (after)', insert_latencies(args.inserts))
+
+    started = time.perf_counter()
+    matched = sum(1 for _ in iter_archived_messages(archive_dir, username='user7'))
+    scan_s = time.perf_counter() - started
+    print(f"query archive (username=user7): {matched} match(es) in {scan_s:.2f} s "
+          f"({result.archived / scan_s:,.0f} msg/s scanned)")
+    started = time.perf_counter()
+    since = datetime.fromtimestamp(SEED_BASE, timezone.utc)
+    matched = sum(1 for _ in iter_archived_messages(archive_dir, since=since, until=since + timedelta(hours=1)))
+    print(f"query archive (1 hour, first month only): {matched} match(es) in {time.perf_counter() - started:.2f} s")
+    print(f"peak RSS: {peak_rss_mb()} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""/api/items/search のベンチマーク（従来の ILIKE 部分一致 vs FTS5 索引 + bm25）
+
+使い方:
+    python benchmarks/bench_search.py --size 100000
+"""
+import argparse
+
+from _common import temp_database_url, seed_items, summarize, time_call
+
+# 入力補完を想定し、1文字ずつ打ち込んでいく途中の語も含める
+QUERIES = ['co', 'comf', 'comfort', 'Running', 'retro leather', 'kari', 'karito', 'dentexal', 'porgro fin']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=int, default=100_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=20,
+                        help='入力補完で表示する件数（0 なら従来のエンドポイントと同じく全件）')
+    args = parser.parse_args()
+    limit = args.limit or None
+
+    url, _ = temp_database_url()
+    seed_items(url, args.size)
+
+    from backend.database import SessionLocal
+    from backend.search import search_items, ilike_search_items
+
+    db = SessionLocal()
+    print(f"items={args.size} limit={args.limit}")
+    print(f"{'query':<22} {'path':<6} {'hits':>6} {'p50 ms':>9} {'p99 ms':>9}")
+    try:
+        for query in QUERIES:
+            for label, fn in (('ilike', ilike_search_items), ('fts5', search_items)):
+                hits = len(fn(db, query, limit))
+                r = summarize(time_call(lambda: fn(db, query, limit), args.repeat))
+                print(f"{query!r:<22} {label:<6} {hits:>6} {r['p50_ms']:>9} {r['p99_ms']:>9}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""アイテム一覧の JSON シリアライズ方式の比較（1k / 10k / 100k 行）
+
+orm+to_dict+flask : 従来の実装（Item を ORM で取得し to_dict()、Flask 既定の jsonify）
+orm+to_dict+fast  : 同じ辞書を FastJSONProvider でエンコード
+rows+stdlib       : 列のみの select() + RowSerializer（標準ライブラリの json）
+rows+orjson       : 列のみの select() + RowSerializer（orjson）
+columnar+orjson   : 同上で {"fields", "rows"} 形式
+
+各方式とも「DB からの取得 + エンコード」の合計時間（中央値）を測り、query 列に取得だけの時間を併記する。
+
+使い方:
+    python benchmarks/bench_serialization.py --rows 1000 10000 100000
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+from _common import temp_database_url, seed_items, time_call
+
+
+def run_child(rows, repeat):
+    url, _ = temp_database_url()
+    seed_items(url, rows)
+
+    from flask.json.provider import DefaultJSONProvider
+    from sqlalchemy import select, desc
+    from backend import create_app
+    from backend.database import SessionLocal
+    from backend.models import Item
+    from backend.serialization import FastJSONProvider, ITEM_SERIALIZER, RowSerializer, orjson
+
+    app = create_app()
+    flask_json = DefaultJSONProvider(app)
+    fast_json = FastJSONProvider(app)
+    stdlib_rows = RowSerializer(ITEM_SERIALIZER.fields, use_orjson=False)
+    orjson_rows = RowSerializer(ITEM_SERIALIZER.fields, use_orjson=True)
+    order = desc(Item.updated_at)
+
+    def orm_dicts(db):
+        return [item.to_dict() for item in db.query(Item).order_by(order).all()]
+
+    def column_rows(db):
+        return db.execute(select(*ITEM_SERIALIZER.columns).order_by(order)).all()
+
+    scenarios = {
+        'orm+to_dict+flask': lambda db: flask_json.dumps(orm_dicts(db), separators=(',', ':')).encode(),
+        'orm+to_dict+fast': lambda db: fast_json.dumps_bytes(orm_dicts(db)),
+        'rows+stdlib': lambda db: stdlib_rows.encode(column_rows(db)),
+    }
+    if orjson is not None:
+        scenarios['rows+orjson'] = lambda db: orjson_rows.encode(column_rows(db))
+        scenarios['columnar+orjson'] = lambda db: orjson_rows.encode_columnar(column_rows(db))
+
+    results = {}
+    with app.app_context():
+        db = SessionLocal()
+        try:
+            query = statistics.median(time_call(lambda: db.query(Item).order_by(order).all(), repeat))
+            rows_query = statistics.median(time_call(lambda: column_rows(db), repeat))
+            for name, fn in scenarios.items():
+                db.expunge_all()
+                size = len(fn(db))
+                results[name] = {
+                    'ms': statistics.median(time_call(lambda: (fn(db), db.expunge_all()), repeat)),
+                    'query_ms': rows_query if name.startswith(('rows', 'columnar')) else query,
+                    'bytes': size,
+                }
+        finally:
+            db.close()
+    print(json.dumps(results))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.rows[0], args.repeat)
+        return
+
+    print(f"{'rows':>7} {'scenario':<18} {'total ms':>9} {'query ms':>9} {'speedup':>8} {'KiB':>8}")
+    for rows in args.rows:
+        out = subprocess.run(
+            [sys.executable, __file__, '--child', '--rows', str(rows), '--repeat', str(args.repeat)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        r = json.loads(out.strip().splitlines()[-1])
+        baseline = r['orm+to_dict+flask']['ms']
+        for name, k in r.items():
+            print(f"{rows:>7} {name:<18} {k['ms']:>9.1f} {k['query_ms']:>9.1f} "
+                  f"{baseline / k['ms']:>7.1f}x {k['bytes'] / 1024:>8.0f}")
+
+
+if __name__ == '__main__':
+    main()
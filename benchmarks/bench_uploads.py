@@ -0,0 +1,159 @@
+"""アイテム登録 (/api/admin/create-item) の画像アップロード: ストリーミング解析と request.files の比較
+
+streaming: 現在の create_item（uploads.receive_upload で解析しながら保存先に直接書き込む。DB への登録も含む）
+buffered : 以前の方式（request.files / request.form で本文をすべて解析してから blob_store.save() で書き直す）
+
+本文はメモリ上に用意せず、読まれた分だけ生成するストリームで渡す。tracemalloc で計測したピークのメモリと、
+応答までに本文を何バイト読んだか（不正なアップロードを途中で打ち切れたか）を表示する。
+--threads を指定すると同時アップロードの合計ピークも表示する。
+
+使い方:
+    python benchmarks/bench_uploads.py --sizes 1 4 15 --threads 8
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+from _common import temp_database_url
+
+BOUNDARY = 'vuedemo-bench-boundary'
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+
+
+class MultipartBody(io.RawIOBase):
+    """multipart の本文を読まれた分だけ生成するストリーム（読まれたバイト数を数える）"""
+
+    def __init__(self, fields, file_head, file_size, filename, fields_first=True):
+        parts = [self._field(name, value) for name, value in fields.items()]
+        file_part = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="{filename}"\r\n'
+                     'Content-Type: application/octet-stream\r\n\r\n').encode() + file_head
+        before = b''.join(parts) + file_part if fields_first else file_part
+        after = b'\r\n' + (b'' if fields_first else b''.join(parts)) + f'--{BOUNDARY}--\r\n'.encode()
+        self._segments = [(before, len(before)), (None, file_size - len(file_head)), (after, len(after))]
+        self.length = sum(size for _, size in self._segments)
+        self.consumed = 0
+
+    @staticmethod
+    def _field(name, value):
+        return f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        offset = self.consumed
+        for data, size in self._segments:
+            if offset < size:
+                n = min(len(buffer), size - offset)
+                buffer[:n] = data[offset:offset + n] if data is not None else b'\x00' * n
+                self.consumed += n
+                return n
+            offset -= size
+        return 0
+
+
+# (ラベル, フィールド, 先頭のバイト列, ファイル名, フィールドが画像より先か)
+SCENARIOS = [
+    ('valid', {'name': 'Bench', 'category': 'Running', 'price': '120'}, PNG_HEADER, 'a.png', True),
+    ('bad price', {'name': 'Bench', 'category': 'Running', 'price': '-1'}, PNG_HEADER, 'a.png', True),
+    ('not an image', {'name': 'Bench', 'category': 'Running', 'price': '120'}, b'MZ\x90\x00', 'a.png', True),
+    ('fields last', {'name': 'Bench', 'category': 'Running', 'price': '120'}, PNG_HEADER, 'a.png', False),
+]
+
+
+def buffered_create_item():
+    """以前の create_item のアップロード処理（DB への登録は省く）"""
+    from flask import request, jsonify
+    from pydantic import ValidationError
+    from backend.config import blob_store
+    from backend.schemas import ItemCreate
+
+    file = request.files.get('image')
+    if not file or not file.filename:
+        return jsonify({'error': 'There is no image file selected.'}), 400
+    try:
+        ItemCreate(**request.form.to_dict())
+    except ValidationError as e:
+        return jsonify({'error': e.errors()}), 400
+    blob_store.save(file).commit()
+    return jsonify({}), 201
+
+
+def upload(app, path, size_mb, scenario):
+    _, fields, head, filename, fields_first = scenario
+    body = MultipartBody(fields, head, int(size_mb * 1024 * 1024), filename, fields_first)
+    environ = EnvironBuilder(path=path, method='POST').get_environ()
+    environ.update({'wsgi.input': io.BufferedReader(body), 'CONTENT_LENGTH': str(body.length),
+                    'CONTENT_TYPE': f'multipart/form-data; boundary={BOUNDARY}'})
+    app_iter, status, _ = run_wsgi_app(app, environ, buffered=True)
+    return int(status.split()[0]), body.consumed / body.length
+
+
+def measure(fn):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - started) * 1000
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 4, 15], help='画像のサイズ (MB)')
+    parser.add_argument('--threads', type=int, default=8, help='同時アップロード数（0 で省略）')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    temp_database_url()
+    os.environ['UPLOADED_PHOTOS_DEST'] = tempfile.mkdtemp(prefix='vuedemo-bench-uploads-')
+    os.environ.setdefault('IMAGE_PIPELINE', 'off')
+    os.environ.setdefault('METRICS_ENABLED', 'False')
+
+    from backend import create_app
+    from backend.database import init_db
+
+    init_db()
+    app = create_app()
+    app.logger.disabled = True
+    app.add_url_rule('/bench/buffered-upload', 'buffered_upload', buffered_create_item, methods=['POST'])
+    paths = {'streaming': '/api/admin/create-item', 'buffered': '/bench/buffered-upload'}
+
+    print(f"spool={app.config['UPLOAD_SPOOL_MAX_MEMORY'] // 1024}KiB")
+    print(f"{'size MB':>7} {'scenario':<13} {'mode':<10} {'status':>6} {'read %':>7} {'ms':>8} {'peak KiB':>9}")
+    for size_mb in args.sizes:
+        for scenario in SCENARIOS:
+            for mode, path in paths.items():
+                runs = [measure(lambda: upload(app, path, size_mb, scenario)) for _ in range(args.repeat)]
+                (status, read), _, _ = runs[-1]
+                print(f"{size_mb:>7g} {scenario[0]:<13} {mode:<10} {status:>6} {read * 100:>6.0f}% "
+                      f"{statistics.median(r[1] for r in runs):>8.1f} {max(r[2] for r in runs):>9.0f}")
+
+    if args.threads:
+        size_mb = args.sizes[-1]
+        print(f"\n{args.threads} concurrent uploads of {size_mb:g} MB")
+        print(f"{'mode':<10} {'ms':>8} {'peak KiB':>9} {'per upload KiB':>15}")
+        for mode, path in paths.items():
+            def run_all():
+                threads = [threading.Thread(target=upload, args=(app, path, size_mb, SCENARIOS[0]))
+                           for _ in range(args.threads)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+
+            _, elapsed, peak = measure(run_all)
+            print(f"{mode:<10} {elapsed:>8.1f} {peak:>9.0f} {peak / args.threads:>15.0f}")
+
+
+if __name__ == '__main__':
+    main()
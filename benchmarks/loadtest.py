@@ -0,0 +1,117 @@
+"""開発サーバー (app.run) と本番モード (Gunicorn) のスループット比較
+
+一時データベースを用意してサーバーを子プロセスで起動し、複数スレッドから
+Keep-Alive 接続で /api/items と /api/item/<id> を叩き続けて requests/sec を表示する。
+
+使い方:
+    python benchmarks/loadtest.py --items 1000 --concurrency 16 --duration 10
+    python benchmarks/loadtest.py --modes production --workers 4 --threads 8
+"""
+import argparse
+import http.client
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from _common import ROOT, temp_database_url, seed_items, summarize
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, port, env):
+    env = dict(env, PORT=str(port), SERVER_MODE=mode, GUNICORN_ACCESSLOG='')
+    proc = subprocess.Popen([sys.executable, 'app.py'], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/items?limit=1')
+            conn.getresponse().read()
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def hammer(port, path, concurrency, duration):
+    """duration 秒間 concurrency 本の接続からリクエストを送り続ける"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.time() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while time.time() < stop_at:
+            start = time.perf_counter()
+            try:
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    raise http.client.HTTPException(response.status)
+                local.append((time.perf_counter() - start) * 1000)
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    result = summarize(latencies)
+    result['rps'] = round(len(latencies) / duration, 1)
+    result['errors'] = errors[0]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', default=['dev', 'production'])
+    parser.add_argument('--items', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--no-cache', action='store_true', help='レスポンスキャッシュを無効にして計測する')
+    args = parser.parse_args()
+
+    url, _ = temp_database_url()
+    seed_items(url, args.items)
+
+    env = dict(os.environ, DATABASE_URL=url,
+               WEB_CONCURRENCY=str(args.workers), GUNICORN_THREADS=str(args.threads))
+    if args.no_cache:
+        env['RESPONSE_CACHE_BACKEND'] = 'none'
+
+    paths = ['/api/items', f'/api/item/{args.items // 2}']
+    print(f"items={args.items} concurrency={args.concurrency} duration={args.duration}s")
+    print(f"{'mode':<11} {'path':<16} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for mode in args.modes:
+        port = free_port()
+        proc = start_server(mode, port, env)
+        try:
+            for path in paths:
+                r = hammer(port, path, args.concurrency, args.duration)
+                print(f"{mode:<11} {path:<16} {r['rps']:>8} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['errors']:>7}")
+        finally:
+            proc.terminate()
+            proc.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
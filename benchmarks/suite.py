@@ -0,0 +1,382 @@
+"""ルート全体のベンチマークスイート（オフラインの負荷シナリオ、レポート、ベースラインとの比較）
+
+データ   : seed_items / seed_messages で --items / --messages 件を投入してから init_db() をもう一度呼び、
+           ファセットの集計テーブルなどをアプリの初回起動と同じ経路で作る。シナリオごとにこのファイルをコピーして使う。
+シナリオ : それぞれ子プロセスで（RSS を分けて測るため）Flask のテストクライアントから --concurrency 本のスレッドで
+           --duration 秒間リクエストを送る。ネットワークやサーバーは使わない（サーバーを含めた比較は loadtest.py）。
+レポート : requests/sec、レイテンシ (p50/p95/p99)、1リクエストあたりの SQL の回数、子プロセスのピーク RSS。
+
+--save-baseline で結果を JSON に保存し、--compare でそのファイルと比較して --threshold を超えて悪化した
+指標を表示する（悪化があれば終了コード 1）。同じマシン・同じ件数で取ったベースラインと比較すること。
+
+使い方:
+    python benchmarks/suite.py --items 20000 --messages 50000 --save-baseline baseline.json
+    python benchmarks/suite.py --items 20000 --messages 50000 --compare baseline.json --threshold 0.15
+    python benchmarks/suite.py --scenarios detail_view search_typeahead --duration 3
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from _common import (
+    ROOT, CATEGORIES, WORDS, VOCABULARY, temp_database_url, seed_items, seed_messages,
+    percentile, peak_rss_mb,
+)
+
+PNG_HEADER = b'\x89PNG\r\n\x1a\n'
+SORTS = ('newest', 'price_asc', 'price_desc', 'name')
+
+
+# ---- シナリオ ----
+# 各シナリオはスレッドごとに1回呼ばれ、「1リクエストを送ってレスポンスを返す関数」を返す。
+# state はスレッドごとの状態（カーソルや ETag）で、スレッド間でデータを共有しない。
+
+def catalog_browse(ctx, rng):
+    """一覧のページ送りと、カテゴリ・価格で絞り込んだ一覧（ファセット付き）"""
+    state = {'cursor': None, 'browse': None}
+
+    def step(client):
+        if rng.random() < 0.5:
+            if state['cursor'] is None or rng.random() < 0.25:
+                state['cursor'] = ''
+            path = '/api/items?limit=20' + (f"&cursor={state['cursor']}" if state['cursor'] else '')
+            response = client.get(path)
+            state['cursor'] = response.get_json().get('next_cursor') if response.status_code == 200 else None
+            return response
+
+        if state['browse'] is None or rng.random() < 0.25:
+            categories = '&'.join(f'category={c}' for c in rng.sample(CATEGORIES, rng.randint(1, 2)))
+            state['browse'] = (f"{categories}&sort={rng.choice(SORTS)}&limit=24", None)
+        query, cursor = state['browse']
+        # 2ページ目以降は件数を省く（フロントエンドと同じ）
+        response = client.get(f"/api/items/browse?{query}" + (f"&cursor={cursor}&facets=false" if cursor else ''))
+        next_cursor = response.get_json().get('next_cursor') if response.status_code == 200 else None
+        state['browse'] = (query, next_cursor) if next_cursor else None
+        return response
+
+    return step
+
+
+def search_typeahead(ctx, rng):
+    """入力補完: 単語を1文字ずつ打つように、前方一致の検索を続けて送る"""
+    state = {'prefixes': []}
+
+    def step(client):
+        if not state['prefixes']:
+            word = rng.choice(WORDS) if rng.random() < 0.5 else rng.choice(VOCABULARY)
+            state['prefixes'] = [word[:n] for n in range(2, len(word) + 1)]
+        return client.get(f"/api/items/search?q={state['prefixes'].pop(0)}&limit=8")
+
+    return step
+
+
+def detail_view(ctx, rng):
+    """商品詳細: 人気の偏り（Zipf 的）があり、見たことのある商品は If-None-Match で再検証する"""
+    etags = {}
+
+    def step(client):
+        item_id = min(int(rng.paretovariate(0.8)), ctx['items'])
+        headers = {'If-None-Match': etags[item_id]} if item_id in etags else {}
+        response = client.get(f'/api/item/{item_id}', headers=headers)
+        if response.headers.get('ETag'):
+            etags[item_id] = response.headers['ETag']
+        return response
+
+    return step
+
+
+def contact_burst(ctx, rng):
+    """問い合わせフォームへの集中した投稿"""
+
+    def step(client):
+        n = rng.randrange(1_000_000)
+        return client.post('/api/message', json={
+            'username': f'burst{n}',
+            'email': f'burst{n}@example.com',
+            'message': ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(5, 60))),
+        })
+
+    return step
+
+
+def admin_upload(ctx, rng):
+    """画像付きのアイテム登録（画像は毎回内容の違う約 64 KB のファイル）"""
+
+    def step(client):
+        image = PNG_HEADER + rng.randbytes(64 * 1024)
+        return client.post('/api/admin/create-item', data={
+            'name': f"{rng.choice(WORDS).title()} Upload",
+            'category': rng.choice(CATEGORIES),
+            'price': str(rng.randint(20, 300)),
+            'image': (io.BytesIO(image), 'upload.png'),
+        })
+
+    return step
+
+
+def admin_edit(ctx, rng):
+    """詳細を読み込み、If-Match 付きで更新する（スレッドごとに別のアイテムを編集して 412 にならないようにする）"""
+    state = {'etag': None, 'item_id': None}
+
+    def step(client):
+        if state['etag'] is None:
+            # id を スレッド数で割った余りでスレッドに振り分ける
+            state['item_id'] = rng.randrange(ctx['thread'] + 1, ctx['items'] + 1, ctx['threads'])
+            response = client.get(f"/api/item/{state['item_id']}")
+            state['etag'] = response.headers.get('ETag')
+            return response
+        response = client.patch(f"/api/admin/item/{state['item_id']}/edit", data={
+            'name': f"{rng.choice(WORDS).title()} Edited",
+            'category': rng.choice(CATEGORIES),
+            'price': str(rng.randint(20, 300)),
+        }, headers={'If-Match': state['etag']})
+        state['etag'] = None
+        return response
+
+    return step
+
+
+def admin_bulk(ctx, rng):
+    """NDJSON の一括登録（100件）と、CSV のエクスポート"""
+    state = {'count': 0}
+
+    def step(client):
+        state['count'] += 1
+        if state['count'] % 5 == 0:
+            response = client.get('/api/admin/items/export?format=csv')
+            response.get_data()  # ストリームを最後まで読む
+            return response
+        body = b''.join(json.dumps({
+            'name': f"{rng.choice(WORDS).title()} Bulk",
+            'category': rng.choice(CATEGORIES),
+            'price': rng.randint(20, 300),
+        }).encode() + b'\n' for _ in range(100))
+        return client.post('/api/admin/items/import', data=body, content_type='application/x-ndjson')
+
+    return step
+
+
+SCENARIOS = {
+    'catalog_browse': catalog_browse,
+    'search_typeahead': search_typeahead,
+    'detail_view': detail_view,
+    'contact_burst': contact_burst,
+    'admin_upload': admin_upload,
+    'admin_edit': admin_edit,
+    'admin_bulk': admin_bulk,
+}
+
+
+# ---- 子プロセス: 1つのシナリオを実行する ----
+
+def run_child(scenario, db_path, items, duration, warmup, concurrency, seed):
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['UPLOADED_PHOTOS_DEST'] = tempfile.mkdtemp(prefix='vuedemo-bench-uploads-')
+    os.environ.setdefault('IMAGE_PIPELINE', 'off')
+
+    from sqlalchemy import event
+    from backend import create_app, database
+
+    app = create_app()
+    app.logger.disabled = True
+
+    queries = [0]
+
+    def count_query(*args):
+        queries[0] += 1
+
+    for engine in {database.engine, *database.replica_pool.replicas}:
+        event.listen(engine, 'before_cursor_execute', count_query)
+
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    measuring = threading.Event()
+
+    def worker(n, stop_at):
+        rng = random.Random(seed * 1000 + n)
+        step = SCENARIOS[scenario]({'items': items, 'thread': n, 'threads': concurrency}, rng)
+        client = app.test_client()
+        local_latencies, local_statuses = [], {}
+        while time.perf_counter() < stop_at:
+            started = time.perf_counter()
+            response = step(client)
+            elapsed = (time.perf_counter() - started) * 1000
+            if measuring.is_set():
+                local_latencies.append(elapsed)
+                local_statuses[response.status_code] = local_statuses.get(response.status_code, 0) + 1
+        with lock:
+            latencies.extend(local_latencies)
+            for status, count in local_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    def run(seconds):
+        stop_at = time.perf_counter() + seconds
+        threads = [threading.Thread(target=worker, args=(n, stop_at)) for n in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    run(warmup)  # 接続・キャッシュ・遅延 import を温める（計測しない）
+    queries[0] = 0
+    measuring.set()
+    started = time.perf_counter()
+    run(duration)
+    elapsed = time.perf_counter() - started
+
+    requests = len(latencies)
+    errors = sum(count for status, count in statuses.items() if status >= 400)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'rps': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies, default=0), 3),
+        'queries_per_request': round(queries[0] / requests, 2) if requests else 0.0,
+        'rss_mb': peak_rss_mb(),
+    }
+
+
+# ---- ベースラインとの比較 ----
+
+# 指標: (大きいほど良いか, 悪化とみなす最小の差)
+# 最小の差は、キャッシュにほぼ当たるシナリオの SQL/req（0.02 → 0.03 など）のような小さな値の揺れを無視するため
+COMPARED_METRICS = {
+    'rps': (True, 0),
+    'p50_ms': (False, 0.05),
+    'p95_ms': (False, 0.05),
+    'p99_ms': (False, 0.05),
+    'queries_per_request': (False, 0.1),
+    'rss_mb': (False, 1),
+}
+
+
+def compare(results, baseline, threshold):
+    """baseline より threshold（割合）を超えて悪化した指標のリスト [(シナリオ, 指標, ベースライン, 今回, 変化率)]"""
+    regressions = []
+    for scenario, current in results['scenarios'].items():
+        base = baseline['scenarios'].get(scenario)
+        if base is None:
+            continue
+        for metric, (higher_is_better, min_delta) in COMPARED_METRICS.items():
+            before, after = base.get(metric), current.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            worse = before - after if higher_is_better else after - before
+            if worse / before > threshold and worse > min_delta:
+                regressions.append((scenario, metric, before, after, change))
+        if current['errors'] > base.get('errors', 0):
+            regressions.append((scenario, 'errors', base.get('errors', 0), current['errors'], None))
+    return regressions
+
+
+def print_report(results, baseline=None):
+    print(f"{'scenario':<18} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'SQL/req':>8} "
+          f"{'RSS MB':>7} {'errors':>6}  statuses")
+    for scenario, r in results['scenarios'].items():
+        print(f"{scenario:<18} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} "
+              f"{r['queries_per_request']:>8.2f} {r['rss_mb']:>7.1f} {r['errors']:>6}  "
+              + ' '.join(f"{status}:{count}" for status, count in r['statuses'].items()))
+        base = baseline and baseline['scenarios'].get(scenario)
+        if base:
+            changes = ' '.join(
+                f"{metric} {(r[metric] - base[metric]) / base[metric] * 100:+.0f}%"
+                for metric in COMPARED_METRICS if base.get(metric) and r.get(metric) is not None
+            )
+            print(f"{'':<18} vs baseline: {changes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--items', type=int, default=20_000)
+    parser.add_argument('--messages', type=int, default=50_000)
+    parser.add_argument('--duration', type=float, default=5, help='シナリオごとの計測時間（秒）')
+    parser.add_argument('--warmup', type=float, default=1, help='計測前に捨てる時間（秒）')
+    parser.add_argument('--concurrency', type=int, default=4, help='シナリオごとのスレッド数')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save-baseline', metavar='PATH', help='結果をベースラインとして JSON に保存する')
+    parser.add_argument('--compare', metavar='PATH', help='ベースラインの JSON と比較する')
+    parser.add_argument('--threshold', type=float, default=0.10, help='悪化とみなす変化の割合（0.10 = 10%%）')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(args.child, args.db, args.items, args.duration, args.warmup, args.concurrency, args.seed)
+        print(json.dumps(result))
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    # データの生成は1回だけ行い、シナリオごとにファイルをコピーする（書き込みのあるシナリオが他に影響しないように）
+    url, workdir = temp_database_url('template.db')
+    started = time.perf_counter()
+    seed_items(url, args.items, seed=args.seed)
+    seed_messages(url, args.messages, seed=args.seed)
+    subprocess.run([sys.executable, '-c', 'from backend.database import init_db; init_db()'],
+                   cwd=ROOT, env=os.environ, check=True, stdout=subprocess.DEVNULL)
+    print(f"Seeded {args.items} items and {args.messages} messages in {time.perf_counter() - started:.1f} s")
+
+    results = {
+        'config': {
+            'items': args.items, 'messages': args.messages, 'duration': args.duration,
+            'concurrency': args.concurrency, 'seed': args.seed,
+        },
+        'environment': {
+            'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+        },
+        'scenarios': {},
+    }
+    for scenario in args.scenarios:
+        db_path = workdir / f'{scenario}.db'
+        shutil.copy(workdir / 'template.db', db_path)
+        proc = subprocess.run(
+            [sys.executable, __file__, '--child', scenario, '--db', str(db_path), '--items', str(args.items),
+             '--duration', str(args.duration), '--warmup', str(args.warmup),
+             '--concurrency', str(args.concurrency), '--seed', str(args.seed)],
+            capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            sys.exit(f"Scenario {scenario} failed:\n{proc.stderr[-2000:]}")
+        results['scenarios'][scenario] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print_report(results, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved the baseline to {args.save_baseline}")
+
+    if baseline is not None:
+        keys = ('items', 'messages', 'concurrency', 'seed')
+        if any(baseline.get('config', {}).get(key) != results['config'][key] for key in keys):
+            print(f"Warning: the baseline was taken with a different configuration: {baseline.get('config')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for scenario, metric, before, after, change in regressions:
+                print(f"  {scenario:<18} {metric:<20} {before} -> {after}"
+                      + (f" ({change * 100:+.0f}%)" if change is not None else ''))
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+# 本番用 Gunicorn 設定ファイル
+#   gunicorn -c gunicorn.conf.py app:app
+# すべての値は環境変数で変更できる（Railway などでは PORT が自動で設定される）
+#
+# グレースフルリロード: マスタープロセスに SIGHUP を送ると、設定とアプリを読み直し、
+# 処理中のリクエストを終えたワーカーから順に新しいワーカーへ入れ替わる。
+#   kill -HUP <master pid>
+import os
+import multiprocessing
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# ワーカープロセス数（WEB_CONCURRENCY は Heroku / Railway などで一般的な変数名）
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+# アプリ (config.py) がワーカー数に応じてレスポンスキャッシュのバックエンドを選べるように、実際の値を渡す
+os.environ['WEB_CONCURRENCY'] = str(workers)
+
+# ワーカーごとのスレッド数。2以上ならスレッドワーカー (gthread) を使う
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+# gthread ワーカー1つあたりの同時接続数の上限。接続数がこれに達すると、接続済みのクライアントからの
+# リクエストも読まれなくなるため、想定する同時接続数より大きくしておく
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# True なら create_app() をマスタープロセスで一度だけ実行してから fork する
+# （起動が速くなりメモリも共有されるが、リロード時はマスターごと再起動が必要になる）
+preload_app = _env_bool('GUNICORN_PRELOAD', True)
+
+# N リクエスト処理したらワーカーを入れ替える（メモリリーク対策）。jitter で全ワーカーの同時再起動を避ける
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Keep-Alive 接続を保持する秒数（ロードバランサの idle timeout より短くする）
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# 空文字を指定するとアクセスログを出力しない
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
+
+
+def on_starting(server):
+    # ワーカーを起動する前に、マスターで1度だけスキーマを最新にする（後から追加した列・インデックス・FTS 索引など）
+    # 同梱の backend/test.db のように古いスキーマのファイルでも、参照系のエンドポイントが 500 にならないように
+    from backend.database import init_db
+    init_db()
+
+
+def post_fork(server, worker):
+    # preload_app の場合、マスターで作られた DB 接続がワーカーに引き継がれてしまうため、
+    # fork 直後に接続プールを作り直す（親の接続は閉じずに破棄だけする）
+    from backend.database import engine, read_engine, replica_pool
+    for eng in {engine, read_engine, *replica_pool.replicas}:
+        eng.dispose(close=False)
@@ -0,0 +1,50 @@
+"""テスト共通の設定
+
+backend.database は import 時に DATABASE_URL からエンジンを作るため、backend を import する前に
+一時ディレクトリの SQLite ファイルとアップロード先を環境変数で指定しておく。
+"""
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+WORKDIR = Path(tempfile.mkdtemp(prefix='vuedemo-test-'))
+os.environ['DATABASE_URL'] = f"sqlite:///{WORKDIR / 'test.db'}"
+os.environ['UPLOADED_PHOTOS_DEST'] = str(WORKDIR / 'uploads')
+os.environ['MESSAGE_SPILL_DIR'] = str(WORKDIR / 'message_spill')
+os.environ['MESSAGE_ARCHIVE_DIR'] = str(WORKDIR / 'message_archive')
+os.environ['RESPONSE_CACHE_BACKEND'] = 'none'
+os.environ['IMAGE_PIPELINE'] = 'off'
+os.environ.pop('FAULT_INJECTION', None)
+os.environ.pop('WEB_CONCURRENCY', None)
+
+
+@pytest.fixture(scope='session')
+def item_id():
+    """init_db() で作ったデータベースに登録したアイテム1件の id"""
+    from backend.database import init_db, SessionLocal
+    from backend.models import Item
+
+    init_db()
+    db = SessionLocal()
+    try:
+        item = Item(name='Test Runner', description='for tests', category='Running', price=12000)
+        db.add(item)
+        db.commit()
+        return item.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def make_app(item_id, monkeypatch):
+    """環境変数を上書きして create_app() する関数"""
+    def make(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        from backend import create_app
+        app = create_app()
+        app.config['TESTING'] = True
+        return app
+    return make
@@ -0,0 +1,46 @@
+import pytest
+
+from backend.database import SessionLocal
+from backend.models import Item
+from backend.pagination import MAX_BATCH_IDS
+
+
+def _create_items(count):
+    db = SessionLocal()
+    try:
+        items = [Item(name=f'Batch {i}', category='Running', price=100 + i) for i in range(count)]
+        db.add_all(items)
+        db.commit()
+        return [item.id for item in items]
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize('backend', ['none', 'memory'])
+def test_items_come_back_in_the_requested_order_with_missing_ids(make_app, backend):
+    client = make_app(RESPONSE_CACHE_BACKEND=backend).test_client()
+    a, b, c = _create_items(3)
+    missing = c + 1000
+
+    # 1回目はキャッシュに一部だけ入れておき、2回目はキャッシュと DB の結果を混ぜて返す
+    client.get('/api/items', query_string={'ids': f'{b}'})
+    body = client.get('/api/items', query_string={'ids': f'{c},{missing},{a},{b},{c}'}).get_json()
+
+    assert [item['id'] for item in body['items']] == [c, a, b]
+    assert body['missing'] == [missing]
+
+
+def test_fields_and_repeated_ids_parameters(make_app):
+    client = make_app().test_client()
+    a, b = _create_items(2)
+
+    body = client.get(f'/api/items?ids={b}&ids={a}&fields=id,price').get_json()
+
+    assert body['items'] == [{'id': b, 'price': 101}, {'id': a, 'price': 100}]
+
+
+@pytest.mark.parametrize('ids', ['1,x', '', ','.join(str(i) for i in range(1, MAX_BATCH_IDS + 2))])
+def test_invalid_ids_are_rejected(make_app, ids):
+    client = make_app().test_client()
+
+    assert client.get('/api/items', query_string={'ids': ids}).status_code == 400
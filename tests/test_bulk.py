@@ -0,0 +1,50 @@
+import io
+import json
+import uuid
+
+
+def _import(client, body, mimetype):
+    return client.post('/api/admin/items/import', data=body, content_type=mimetype)
+
+
+def test_ndjson_import_reports_bad_lines_and_keeps_the_rest(make_app):
+    client = make_app().test_client()
+    name = f'Imported {uuid.uuid4().hex[:8]}'
+    lines = [
+        json.dumps({'name': name, 'category': 'Running', 'price': 9800}),
+        '{"name": "broken",',
+        '["not", "an", "object"]',
+        json.dumps({'name': 'Free', 'category': 'Running', 'price': 0}),
+        '',
+        json.dumps({'name': 'No image', 'category': 'Running', 'price': 9800, 'image': 'missing.jpg'}),
+    ]
+
+    response = _import(client, '\n'.join(lines) + '\n', 'application/x-ndjson')
+
+    assert response.status_code == 200
+    result = response.get_json()
+    assert (result['processed'], result['inserted'], result['failed']) == (5, 1, 4)
+    assert [error['line'] for error in result['errors']] == [2, 3, 4, 6]
+    assert result['errors'][0]['error'].startswith('Invalid JSON')
+    assert 'missing.jpg' in result['errors'][3]['error']
+    assert [item['name'] for item in client.get('/api/items/search', query_string={'q': name}).get_json()] == [name]
+
+
+def test_csv_import_reports_rows_by_line_number(make_app):
+    client = make_app().test_client()
+    name = f'Imported {uuid.uuid4().hex[:8]}'
+    body = f'name,category,price,description\n{name},Running,9800,\nCheap,Running,abc,\n,Running,100,no name\n'
+
+    result = _import(client, body, 'text/csv').get_json()
+
+    assert (result['processed'], result['inserted'], result['failed']) == (3, 1, 2)
+    assert [error['line'] for error in result['errors']] == [3, 4]
+
+
+def test_unreadable_import_files_are_rejected(make_app):
+    client = make_app().test_client()
+
+    assert _import(client, b'name,category,price\n\xff\xfe,Running,100\n', 'text/csv').status_code == 400
+    response = client.post('/api/admin/items/import', data={'file': (io.BytesIO(b'x'), 'items.xlsx')})
+    assert response.status_code == 400
+    assert 'format' in response.get_json()['error']
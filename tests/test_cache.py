@@ -0,0 +1,19 @@
+import pytest
+
+from backend.cache import SQLiteCacheBackend
+
+
+def test_multiple_workers_default_to_the_shared_cache(make_app, monkeypatch, tmp_path):
+    monkeypatch.delenv('RESPONSE_CACHE_BACKEND')
+    app = make_app(WEB_CONCURRENCY='4', RESPONSE_CACHE_PATH=str(tmp_path / 'cache.db'))
+
+    assert app.config['RESPONSE_CACHE_BACKEND'] == 'sqlite'
+    assert isinstance(app.extensions['response_cache'], SQLiteCacheBackend)
+
+
+def test_memory_cache_is_refused_with_multiple_workers(make_app):
+    # 無効化が他のワーカーに届かず、古いカタログを返し続けることになる
+    with pytest.raises(ValueError, match='workers'):
+        make_app(WEB_CONCURRENCY='4', RESPONSE_CACHE_BACKEND='memory')
+
+    assert make_app(WEB_CONCURRENCY='1', RESPONSE_CACHE_BACKEND='memory').config['RESPONSE_CACHE_BACKEND'] == 'memory'
@@ -0,0 +1,62 @@
+import gzip
+
+from flask import jsonify
+
+from backend.database import SessionLocal
+from backend.models import Item
+
+
+def _create_item():
+    db = SessionLocal()
+    try:
+        item = Item(name='Long Runner', category='Running', price=15000, description='cushioned ' * 300)
+        db.add(item)
+        db.commit()
+        return item.id
+    finally:
+        db.close()
+
+
+def test_compressed_responses_get_an_encoding_specific_etag(make_app):
+    client = make_app(RESPONSE_CACHE_BACKEND='memory').test_client()
+    item_id = _create_item()
+
+    plain = client.get(f'/api/item/{item_id}', headers={'Accept-Encoding': 'identity'})
+    compressed = client.get(f'/api/item/{item_id}', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    # バイト列が違うので、どちらも強い ETag のまま別の値にする
+    assert compressed.headers['ETag'] == plain.headers['ETag'][:-1] + '-gzip"'
+    assert gzip.decompress(compressed.data) == plain.data
+
+    # If-None-Match は接尾辞の付いた ETag でも 304 になり、クライアントが持っている ETag を返す
+    etag = compressed.headers['ETag']
+    response = client.get(f'/api/item/{item_id}', headers={'If-None-Match': etag, 'Accept-Encoding': 'gzip'})
+    assert (response.status_code, response.headers['ETag']) == (304, etag)
+    # If-Match は強い比較なので弱い ETag は 412、接尾辞の付いた強い ETag は受け付ける
+    response = client.patch(f'/api/admin/item/{item_id}/edit', headers={'If-Match': 'W/' + etag},
+                            data={'name': 'Long Runner 2', 'category': 'Running', 'price': '15000'})
+    assert response.status_code == 412
+    response = client.patch(f'/api/admin/item/{item_id}/edit', headers={'If-Match': etag},
+                            data={'name': 'Long Runner 2', 'category': 'Running', 'price': '15000'})
+    assert response.status_code == 200
+
+
+def test_compressed_bodies_are_keyed_by_content(make_app):
+    app = make_app()
+    bodies = iter(['first ' * 500, 'second ' * 500])
+
+    def same_etag():
+        response = jsonify({'text': next(bodies)})
+        response.set_etag('1.1')  # 削除後に同じ id で作り直されたアイテムなど
+        return response
+
+    app.add_url_rule('/test/same-etag', 'same_etag', same_etag)
+    client = app.test_client()
+
+    first = client.get('/test/same-etag', headers={'Accept-Encoding': 'gzip'})
+    second = client.get('/test/same-etag', headers={'Accept-Encoding': 'gzip'})
+
+    assert b'first' in gzip.decompress(first.data)
+    assert b'second' in gzip.decompress(second.data)
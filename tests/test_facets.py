@@ -0,0 +1,82 @@
+import io
+import os
+import uuid
+
+
+def _png():
+    return b'\x89PNG\r\n\x1a\n' + os.urandom(256)
+
+
+def _create(client, category, price):
+    response = client.post('/api/admin/create-item', data={
+        'name': 'Facet Runner', 'category': category, 'price': str(price),
+        'image': (io.BytesIO(_png()), 'shoe.png'),
+    })
+    assert response.status_code == 201, response.get_json()
+    return response.get_json()['id']
+
+
+def _facets(client, category):
+    body = client.get('/api/items/browse', query_string={'category': category, 'limit': 1}).get_json()
+    counts = {entry['value']: entry['count'] for entry in body['facets']['category']}
+    prices = {entry['min']: entry['count'] for entry in body['facets']['price'] if entry['count']}
+    return counts.get(category, 0), prices, body['total']
+
+
+def test_facet_counts_follow_create_update_and_delete(make_app):
+    client = make_app().test_client()
+    category = f'Facet-{uuid.uuid4().hex[:8]}'
+
+    first = _create(client, category, 120)
+    second = _create(client, category, 120)
+    assert _facets(client, category) == (2, {100: 2}, 2)
+
+    # 価格帯の移動
+    response = client.patch(f'/api/admin/item/{second}/edit',
+                            data={'name': 'Facet Runner', 'category': category, 'price': '320'})
+    assert response.status_code == 200
+    assert _facets(client, category) == (2, {100: 1, 300: 1}, 2)
+
+    # カテゴリの移動
+    other = f'{category}-b'
+    response = client.patch(f'/api/admin/item/{first}/edit',
+                            data={'name': 'Facet Runner', 'category': other, 'price': '120'})
+    assert response.status_code == 200
+    assert _facets(client, category) == (1, {300: 1}, 1)
+    assert _facets(client, other) == (1, {100: 1}, 1)
+
+    assert client.delete(f'/api/admin/item/{second}').status_code == 200
+    assert client.delete(f'/api/admin/item/{first}').status_code == 200
+    assert _facets(client, category) == (0, {}, 0)
+    assert _facets(client, other) == (0, {}, 0)
+
+
+def test_browse_pages_newest_first_with_a_cursor(make_app):
+    from backend.database import SessionLocal
+    from backend.models import Item
+    from backend.pagination import encode_cursor
+
+    client = make_app().test_client()
+    category = f'Facet-{uuid.uuid4().hex[:8]}'
+    db = SessionLocal()
+    try:
+        # 同じ秒に作られた行（updated_at が同じ）は id の降順に並ぶ
+        items = [Item(name=f'Page {i}', category=category, price=100) for i in range(5)]
+        db.add_all(items)
+        db.commit()
+        ids = sorted((item.id for item in items), reverse=True)
+    finally:
+        db.close()
+
+    seen, cursor = [], None
+    while True:
+        args = {'category': category, 'sort': 'newest', 'limit': 2, 'facets': 'false'}
+        body = client.get('/api/items/browse', query_string={**args, **({'cursor': cursor} if cursor else {})}).get_json()
+        seen.extend(item['id'] for item in body['items'])
+        cursor = body['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == ids
+    response = client.get('/api/items/browse', query_string={'category': category, 'cursor': encode_cursor('soon', 1)})
+    assert response.status_code == 400
@@ -0,0 +1,51 @@
+import json
+import random
+import time
+
+from backend import faults
+from backend.faults import FaultInjector, load_rules
+
+
+def _inject_fault_hooks(app):
+    return [f for f in app.before_request_funcs.get(None, []) if f.__name__ == 'inject_fault']
+
+
+def test_production_path_does_not_sleep(make_app, item_id, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(time, 'sleep', lambda seconds: sleeps.append(seconds))
+    app = make_app()
+
+    response = app.test_client().get(f'/api/item/{item_id}')
+
+    assert response.status_code == 200
+    assert response.get_json()['id'] == item_id
+    assert sleeps == []
+    assert 'fault_injection' not in app.extensions
+    assert _inject_fault_hooks(app) == []
+
+
+def test_configured_rule_injects_delay_and_error(make_app, item_id, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(faults.time, 'sleep', lambda seconds: sleeps.append(seconds))
+    rules = [{'path': '/api/item/*', 'delay_ms': 300, 'error_rate': 1.0, 'error_status': 503}]
+    app = make_app(FAULT_INJECTION=json.dumps(rules))
+    client = app.test_client()
+
+    response = client.get(f'/api/item/{item_id}')
+    assert response.status_code == 503
+    assert sleeps == [0.3]
+    assert len(_inject_fault_hooks(app)) == 1
+
+    # ルールに一致しないパスには注入しない
+    assert client.get('/api/items?limit=1').status_code == 200
+    assert sleeps == [0.3]
+
+
+def test_error_rate_is_applied_to_the_configured_fraction():
+    injector = FaultInjector(load_rules([{'path': '/api/*', 'error_rate': 0.25}]), random.Random(1))
+
+    picks = [injector.pick('/api/items', 'GET') for _ in range(4000)]
+
+    errors = sum(1 for _, status in picks if status == 503)
+    assert 0.22 < errors / len(picks) < 0.28
+    assert all(delay == 0 for delay, _ in picks)
@@ -0,0 +1,76 @@
+import os
+
+from backend.database import SessionLocal
+from backend.images import URL_PLACEHOLDER, image_pipeline
+from backend.models import Item
+
+
+def _create_item(**values):
+    db = SessionLocal()
+    try:
+        item = Item(**{'name': 'Trail Runner', 'category': 'Running', 'price': 9800, **values})
+        db.add(item)
+        db.commit()
+        return item.id
+    finally:
+        db.close()
+
+
+def _variant(app, name):
+    path = os.path.join(app.config['UPLOADED_PHOTOS_DEST'], name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'variant')
+    return {'format': 'webp', 'width': 320, 'height': 320, 'filename': name, 'bytes': 7}
+
+
+def test_storing_variants_changes_the_etag_but_not_the_version(make_app):
+    app = make_app(RESPONSE_CACHE_BACKEND='memory')
+    client = app.test_client()
+    item_id = _create_item(image_filename='a' * 64 + '.jpg')
+    etag = client.get(f'/api/item/{item_id}').headers['ETag']
+
+    image_pipeline._store(app, item_id, 'a' * 64 + '.jpg', [_variant(app, 'a' * 64 + '-320w.webp')],
+                          f'/uploads/{URL_PLACEHOLDER}')
+
+    # 本文に縮小版が加わったので、読み込んだときの ETag では 304 にならない
+    response = client.get(f'/api/item/{item_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert [v['url'] for v in response.get_json()['image_variants']] == ['/uploads/' + 'a' * 64 + '-320w.webp']
+    assert client.get(f'/api/item/{item_id}', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    # 縮小版の保存は更新ではないので、保存の前に読み込んだ ETag でも更新できる
+    response = client.patch(f'/api/admin/item/{item_id}/edit', headers={'If-Match': etag},
+                            data={'name': 'Trail Runner 2', 'category': 'Running', 'price': '9800'})
+    assert response.status_code == 200
+    # 古いバージョンの ETag は、縮小版のハッシュが付いていても 412
+    response = client.patch(f'/api/admin/item/{item_id}/edit', headers={'If-Match': etag},
+                            data={'name': 'Trail Runner 3', 'category': 'Running', 'price': '9800'})
+    assert response.status_code == 412
+
+
+def test_variants_for_a_replaced_image_are_discarded(make_app):
+    app = make_app()
+    item_id = _create_item(image_filename='b' * 64 + '.jpg')
+    variant = _variant(app, 'c' * 64 + '-320w.webp')
+
+    image_pipeline._store(app, item_id, 'c' * 64 + '.jpg', [variant], f'/uploads/{URL_PLACEHOLDER}')
+
+    db = SessionLocal()
+    try:
+        assert db.get(Item, item_id).image_variants is None
+    finally:
+        db.close()
+    assert not os.path.exists(os.path.join(app.config['UPLOADED_PHOTOS_DEST'], variant['filename']))
+
+
+def test_deleted_item_ids_are_not_reused(make_app):
+    client = make_app().test_client()
+    item_id = _create_item()
+    etag = client.get(f'/api/item/{item_id}').headers['ETag']
+    assert client.delete(f'/api/admin/item/{item_id}').status_code == 200
+
+    new_id = _create_item()
+
+    assert new_id != item_id
+    assert client.delete(f'/api/admin/item/{item_id}', headers={'If-Match': etag}).status_code == 404
@@ -0,0 +1,93 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+import pytest
+from sqlalchemy import func, select
+
+from backend.database import SessionLocal
+from backend.message_queue import MessageWriter, message_writer
+from backend.models import Message
+
+
+@pytest.fixture
+def writer(make_app):
+    make_app(MESSAGE_WRITE_MODE='async', MESSAGE_BATCH_SIZE='5', MESSAGE_FLUSH_INTERVAL_MS='10')
+    yield message_writer
+    message_writer.shutdown()
+
+
+def _journal_files(writer):
+    return sorted(name for name in os.listdir(writer.app.config['MESSAGE_SPILL_DIR']) if name.startswith('messages-'))
+
+
+def _count(client_ids):
+    db = SessionLocal()
+    try:
+        return db.scalar(select(func.count()).select_from(Message).where(Message.client_id.in_(client_ids)))
+    finally:
+        db.close()
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_committed_journal_segments_are_deleted_under_steady_load(writer):
+    client_ids = [str(uuid.uuid4()) for _ in range(60)]
+    most_files = 0
+    for client_id in client_ids:
+        writer.enqueue('user', 'user@example.com', 'hello', client_id)
+        most_files = max(most_files, len(_journal_files(writer)))
+        time.sleep(0.002)
+
+    _wait_for(lambda: _count(client_ids) == len(client_ids))
+    _wait_for(lambda: len(_journal_files(writer)) == 1)
+    # 残るのは追記中の（空の）セグメントだけで、キューに入れたままの件数を超えて増えない
+    assert most_files < 10
+    with open(os.path.join(writer.app.config['MESSAGE_SPILL_DIR'], _journal_files(writer)[0])) as f:
+        assert f.read() == ''
+
+
+def test_recover_runs_on_writer_thread(writer, monkeypatch):
+    # 終了したプロセスが残したジャーナル
+    leftover = {'client_id': str(uuid.uuid4()), 'username': 'old', 'email': 'old@example.com',
+                'message': 'left behind', 'created_at': '2026-01-01T00:00:00+00:00'}
+    path = os.path.join(writer.app.config['MESSAGE_SPILL_DIR'], 'messages-999999999-000001.ndjson')
+    with open(path, 'w') as f:
+        f.write(json.dumps(leftover) + '\n')
+
+    threads = []
+    recover = MessageWriter.recover
+    monkeypatch.setattr(MessageWriter, 'recover',
+                        lambda self: threads.append(threading.current_thread().name) or recover(self))
+    writer.enqueue('user', 'user@example.com', 'hello', str(uuid.uuid4()))
+
+    _wait_for(lambda: _count([leftover['client_id']]) == 1)
+    assert threads == ['message-writer']
+    assert not os.path.exists(path)
+
+
+def test_recover_drops_a_torn_last_line_and_keeps_going(writer):
+    def record(message):
+        return {'client_id': str(uuid.uuid4()), 'username': 'old', 'email': 'old@example.com',
+                'message': message, 'created_at': '2026-01-01T00:00:00+00:00'}
+
+    spill_dir = writer.app.config['MESSAGE_SPILL_DIR']
+    first, torn, second = record('before the crash'), record('torn'), record('next segment')
+    # 追記の途中で終了したセグメントと、その後のセグメント
+    with open(os.path.join(spill_dir, 'messages-999999998-000001.ndjson'), 'w') as f:
+        f.write(json.dumps(first) + '\n' + json.dumps(torn)[:40])
+    with open(os.path.join(spill_dir, 'messages-999999998-000002.ndjson'), 'w') as f:
+        f.write(json.dumps(second) + '\n')
+
+    writer.enqueue('user', 'user@example.com', 'hello', str(uuid.uuid4()))
+
+    _wait_for(lambda: _count([first['client_id'], second['client_id']]) == 2)
+    assert _count([torn['client_id']]) == 0
+    _wait_for(lambda: not any(name.startswith('messages-999999998-') for name in os.listdir(spill_dir)))
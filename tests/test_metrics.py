@@ -0,0 +1,44 @@
+import re
+import time
+
+from flask import Response
+
+
+def test_metrics_are_off_by_default(make_app):
+    app = make_app()
+
+    assert not app.extensions['metrics'].enabled
+    assert 'metrics' not in app.view_functions
+
+
+def test_metrics_token_is_required(make_app):
+    client = make_app(METRICS_ENABLED='True', METRICS_TOKEN='s3cret').test_client()
+
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'})
+    assert response.status_code == 200
+    assert b'http_requests_total' in response.data
+
+
+def test_streamed_response_is_timed_until_closed(make_app):
+    app = make_app(METRICS_ENABLED='True', METRICS_TOKEN='s3cret')
+
+    def slow_stream():
+        def generate():
+            for _ in range(3):
+                time.sleep(0.05)
+                yield b'chunk\n'
+        return Response(generate(), status=206)
+
+    app.add_url_rule('/test/slow-stream', 'slow_stream', slow_stream)
+    client = app.test_client()
+
+    # サーバーと同じく、本文を読み終えてから close() する
+    with client.get('/test/slow-stream') as response:
+        assert response.data == b'chunk\n' * 3
+    text = client.get('/metrics', headers={'Authorization': 'Bearer s3cret'}).get_data(as_text=True)
+    assert 'http_requests_total{endpoint="slow_stream",method="GET",status="206"} 1' in text
+    seconds = float(re.search(r'http_request_duration_seconds_sum\{endpoint="slow_stream",method="GET"\} (\S+)',
+                              text).group(1))
+    assert seconds >= 0.15
@@ -0,0 +1,56 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import DateTime, create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from backend.models import Base
+from backend.pagination import PaginationError, bind_cursor_timestamp, decode_cursor, encode_cursor, fetch_item_page
+
+
+@pytest.fixture
+def db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'items.db'}")
+    Base.metadata.create_all(engine)
+    # 同じ updated_at の行が並ぶように、SQLite の CURRENT_TIMESTAMP と同じ形式（マイクロ秒なし）で入れる
+    timestamps = ['2026-01-03 00:00:00'] * 3 + ['2026-01-02 12:00:00'] * 2 + ['2026-01-01 00:00:00']
+    with engine.begin() as conn:
+        conn.execute(
+            text("INSERT INTO items (name, category, price, updated_at) VALUES (:name, 'Running', 100, :ts)"),
+            [{'name': f'Item {i}', 'ts': ts} for i, ts in enumerate(timestamps)],
+        )
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def test_pages_cover_every_row_once_in_updated_at_then_id_order(db):
+    ids, cursor = [], None
+    while True:
+        rows, cursor = fetch_item_page(db, 2, cursor, ['id', 'updated_at'])
+        ids.extend(row.id for row in rows)
+        if cursor is None:
+            break
+
+    # 同じ時刻の行は id の降順で、ページの境目でも重複・欠落しない
+    assert ids == [3, 2, 1, 5, 4, 6]
+
+
+def test_cursor_round_trip(db):
+    _, cursor = fetch_item_page(db, 4, None, ['id'])
+
+    assert decode_cursor(cursor) == ('2026-01-02 12:00:00', 5)
+    assert decode_cursor(encode_cursor('2026-01-02 12:00:00', 5)) == ('2026-01-02 12:00:00', 5)
+    with pytest.raises(PaginationError):
+        fetch_item_page(db, 2, encode_cursor('yesterday', 5), ['id'])
+
+
+def test_cursor_timestamp_is_bound_as_datetime_outside_sqlite():
+    db = SimpleNamespace(get_bind=lambda: SimpleNamespace(dialect=postgresql.dialect()))
+
+    bound = bind_cursor_timestamp(db, '2026-01-02 12:00:00.123456+00:00')
+
+    assert isinstance(bound.type, DateTime)
+    assert bound.value == datetime(2026, 1, 2, 12, 0, 0, 123456, tzinfo=timezone.utc)
@@ -0,0 +1,36 @@
+import asyncio
+
+from backend import database
+
+
+def _cached_keys(app):
+    return list(app.extensions['response_cache']._entries)
+
+
+def test_responses_read_from_lagging_replica_are_not_cached(make_app, item_id, monkeypatch):
+    app = make_app(RESPONSE_CACHE_BACKEND='memory')
+    client = app.test_client()
+
+    # read_engine をレプリカ（反映が遅れうる別のデータベース）として扱う
+    monkeypatch.setattr(database.replica_pool, 'replicated', True)
+    assert client.get('/api/items?limit=5').status_code == 200
+    assert client.get(f'/api/items?ids={item_id}').status_code == 200
+    assert _cached_keys(app) == []
+
+    monkeypatch.setattr(database.replica_pool, 'replicated', False)
+    assert client.get('/api/items?limit=5').status_code == 200
+    assert len(_cached_keys(app)) == 1
+
+
+def test_async_read_sessions_use_replica_pool(item_id):
+    database.init_async_engines()
+    try:
+        session = database.async_read_session()
+        assert session.info['read_from'] in database.replica_pool.replicas
+        assert session.bind is database.async_replicas[session.info['read_from']]
+
+        session = database.async_read_session(primary=True)
+        assert session.info['read_from'] is database.engine
+        assert session.bind is database.async_engine
+    finally:
+        asyncio.run(database.dispose_async_engines())
@@ -0,0 +1,72 @@
+import uuid
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from backend.database import SessionLocal
+from backend.models import Base, Item
+from backend.search import FTS_TABLE, ensure_search_index, search_items
+
+
+def _create_items(*items):
+    db = SessionLocal()
+    try:
+        db.add_all([Item(**{'category': 'Running', 'price': 9800, **values}) for values in items])
+        db.commit()
+    finally:
+        db.close()
+
+
+def _search(client, q):
+    response = client.get('/api/items/search', query_string={'q': q})
+    assert response.status_code == 200
+    return [item['name'] for item in response.get_json()]
+
+
+def test_search_matches_inside_words(make_app):
+    client = make_app().test_client()
+    tag = uuid.uuid4().hex[:8]
+    _create_items({'name': f'AirNova ZX 200 {tag}'})
+
+    # 従来の ILIKE '%...%' と同じく、単語の途中・大文字小文字の違いにも一致する
+    assert _search(client, f'Nova {tag}') == [f'AirNova ZX 200 {tag}']
+    assert _search(client, f'irnov {tag}') == [f'AirNova ZX 200 {tag}']
+
+
+def test_name_matches_rank_above_description_matches(make_app):
+    client = make_app().test_client()
+    tag = uuid.uuid4().hex[:8]
+    _create_items(
+        {'name': f'Court Classic {tag}', 'description': 'inspired by the Glide series'},
+        {'name': f'Glide Pro {tag}', 'description': 'lightweight'},
+    )
+
+    assert _search(client, f'glide {tag}') == [f'Glide Pro {tag}', f'Court Classic {tag}']
+
+
+def test_short_terms_fall_back_to_substring_search(make_app):
+    # trigram 索引では3文字未満の単語を検索できない
+    client = make_app().test_client()
+    tag = uuid.uuid4().hex[:8]
+    _create_items({'name': f'Trail {tag} ZX'})
+
+    assert _search(client, f'{tag} ZX') == [f'Trail {tag} ZX']
+
+
+def test_old_unicode61_index_is_rebuilt(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(name, category, description, "
+            "content='items', content_rowid='id', tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+    with Session(engine) as db:
+        db.add(Item(name='AirNova ZX 200', category='Running', price=9800))
+        db.commit()
+
+    assert ensure_search_index(engine)
+
+    with Session(engine) as db:
+        assert [item.name for item in search_items(db, 'Nova')] == ['AirNova ZX 200']
+    engine.dispose()
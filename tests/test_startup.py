@@ -0,0 +1,47 @@
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from backend.startup import profile_startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 最初のリクエストまでの時間（中央値）の上限。遅い CI でも誤検出しないよう余裕を持たせている
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 3000))
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('lazy', [False, True], ids=['eager', 'lazy'])
+def test_startup_within_budget(item_id, lazy):
+    result = profile_startup(ROOT, '/api/items?limit=20', lazy=lazy, repeat=3)
+
+    assert result['status'] == 200
+    assert result['total_ms'] <= STARTUP_BUDGET_MS, (
+        f"startup took {result['total_ms']:.0f} ms (import {result['import_ms']:.0f} ms, "
+        f"create_app {result['create_app_ms']:.0f} ms, first request {result['first_request_ms']:.0f} ms)"
+    )
+
+
+# gunicorn.conf.py の on_starting でスキーマを更新してから、最初のリクエストを送る
+_SHIPPED_DB_CODE = """
+import runpy
+runpy.run_path('gunicorn.conf.py')['on_starting'](None)
+from backend import create_app
+client = create_app().test_client()
+for path in ('/api/items', '/api/items?limit=5', '/api/items/search?q=Nova', '/api/items/browse?category=Running'):
+    print(path, client.get(path).status_code)
+"""
+
+
+def test_shipped_database_is_migrated_before_serving(tmp_path):
+    shutil.copy(os.path.join(ROOT, 'backend', 'test.db'), tmp_path / 'shipped.db')
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'shipped.db'}")
+
+    proc = subprocess.run([sys.executable, '-c', _SHIPPED_DB_CODE], cwd=ROOT, env=env, capture_output=True, text=True)
+
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    statuses = [line.rsplit(' ', 1)[1] for line in proc.stdout.splitlines() if line.startswith('/api/')]
+    assert statuses == ['200'] * 4, proc.stdout
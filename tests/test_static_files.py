@@ -0,0 +1,16 @@
+from backend.static_files import build_manifest
+
+
+def test_only_vite_hashed_assets_are_immutable(tmp_path):
+    names = ['assets/index-BoB_mEkW.js', 'assets/logo-cbvX9X6f.svg', 'assets/site-navigation.js',
+             'assets/index-BoB_mEkW1.js', 'site-navigation.js', 'app-BoB_mEkW.js', 'img/photo-abcdefgh.png']
+    for name in names:
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b'x')
+
+    manifest = build_manifest(str(tmp_path))
+
+    assert sorted(name for name, entry in manifest.items() if entry.immutable) == [
+        'assets/index-BoB_mEkW.js', 'assets/logo-cbvX9X6f.svg',
+    ]
@@ -0,0 +1,179 @@
+import hashlib
+import io
+import os
+import threading
+import uuid
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from werkzeug.datastructures import FileStorage
+
+from backend.config import blob_store
+from backend.database import SessionLocal
+from backend.models import Base, Blob, Item
+from backend.storage import BlobMissingError
+
+
+@pytest.fixture
+def app(make_app):
+    """blob_store.destination（アップロード先）はアプリの設定から決まる"""
+    app = make_app()
+    with app.app_context():
+        yield app
+
+
+def _save(content):
+    return blob_store.save(FileStorage(stream=io.BytesIO(content), filename='photo.jpg'))
+
+
+def _ref_count(filename):
+    db = SessionLocal()
+    try:
+        return db.get(Blob, filename).ref_count
+    finally:
+        db.close()
+
+
+def _acquire(filename, writer=None):
+    db = SessionLocal()
+    try:
+        blob_store.acquire(db, filename, writer=writer)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_concurrent_first_uploads_share_one_blob(app):
+    content = os.urandom(4096)
+    errors = []
+
+    def upload():
+        with app.app_context():
+            writer = _save(content)
+            try:
+                _acquire(writer.filename, writer)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                writer.abort()
+
+    threads = [threading.Thread(target=upload) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    probe = _save(content)
+    probe.abort()
+    filename = probe.filename
+    assert errors == []
+    assert _ref_count(filename) == 8
+    assert os.path.exists(os.path.join(blob_store.destination, filename))
+    assert [name for name in os.listdir(blob_store.destination) if name.startswith('.')] == []
+
+
+def test_collect_waits_for_acquire_of_deduplicated_file(app):
+    writer = _save(os.urandom(4096))
+    _acquire(writer.filename, writer)
+    db = SessionLocal()
+    blob_store.release(db, writer.filename)
+    db.commit()
+    db.close()
+
+    # 参照が 0 になった既存のファイルを、新しいアップロードが重複排除で使う
+    with open(os.path.join(blob_store.destination, writer.filename), 'rb') as f:
+        again = _save(f.read())
+    db = SessionLocal()
+    blob_store.acquire(db, again.filename, writer=again)
+    collected = []
+
+    def collect():
+        with app.app_context():
+            collected.append(blob_store.collect(again.filename))
+
+    collector = threading.Thread(target=collect)
+    collector.start()
+    collector.join(0.2)
+    db.commit()
+    db.close()
+    collector.join()
+
+    assert collected == [False]
+    assert _ref_count(again.filename) == 1
+    assert os.path.exists(os.path.join(blob_store.destination, again.filename))
+
+
+def test_acquire_without_file_raises(app):
+    db = SessionLocal()
+    try:
+        with pytest.raises(BlobMissingError):
+            blob_store.acquire(db, '0' * 64 + '.jpg')
+    finally:
+        db.rollback()
+        db.close()
+
+
+def test_update_ignores_image_fields(make_app, item_id):
+    client = make_app().test_client()
+    before = client.get(f'/api/item/{item_id}').get_json()
+
+    response = client.patch(f'/api/admin/item/{item_id}/edit', data={
+        'name': before['name'], 'category': before['category'], 'price': str(before['price']),
+        'image_filename': '0' * 64 + '.jpg', 'image_url': '/uploads/other.jpg',
+    })
+
+    assert response.status_code == 200
+    assert response.get_json()['image_url'] == before['image_url']
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """移行前のファイル名を参照するアイテムだけを入れた、別のデータベース"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    Base.metadata.create_all(engine)
+    db = Session(engine)
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def _legacy_items(app, db, content):
+    old_name = f'shoe-{uuid.uuid4().hex[:8]}.JPG'
+    with open(os.path.join(blob_store.destination, old_name), 'wb') as f:
+        f.write(content)
+    items = [Item(name=f'Shoe {i}', category='Running', price=9800, image_filename=old_name,
+                  image_url=f'/uploads/{old_name}') for i in range(2)]
+    db.add_all(items)
+    db.commit()
+    return old_name, [item.id for item in items]
+
+
+def test_backfill_moves_every_item_that_shares_a_file(app, legacy_db):
+    content = os.urandom(4096)
+    old_name, ids = _legacy_items(app, legacy_db, content)
+
+    assert sorted(blob_store.backfill(legacy_db, log=lambda message: None)) == ids
+
+    new_name = hashlib.sha256(content).hexdigest() + '.jpg'
+    for item_id in ids:
+        item = legacy_db.get(Item, item_id)
+        assert (item.image_filename, item.image_url) == (new_name, f'/uploads/{new_name}')
+    assert legacy_db.get(Blob, new_name).ref_count == 2
+    assert os.path.exists(os.path.join(blob_store.destination, new_name))
+    assert not os.path.exists(os.path.join(blob_store.destination, old_name))
+
+
+def test_backfill_keeps_old_files_until_the_commit(app, legacy_db, monkeypatch):
+    old_name, ids = _legacy_items(app, legacy_db, os.urandom(4096))
+
+    def fail():
+        raise OSError('disk full')
+    monkeypatch.setattr(legacy_db, 'commit', fail)
+    with pytest.raises(OSError):
+        blob_store.backfill(legacy_db, log=lambda message: None)
+    legacy_db.rollback()
+
+    # コミットしていないので、アイテムは古いファイル名のままで、そのファイルも残っている
+    assert [legacy_db.get(Item, item_id).image_filename for item_id in ids] == [old_name, old_name]
+    assert os.path.exists(os.path.join(blob_store.destination, old_name))
@@ -0,0 +1,57 @@
+import io
+import os
+
+import pytest
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * 64
+
+
+@pytest.fixture
+def client(make_app):
+    app = make_app()
+    os.makedirs(app.config['UPLOADED_PHOTOS_DEST'], exist_ok=True)
+    return app.test_client(), app.config['UPLOADED_PHOTOS_DEST']
+
+
+def _create(client, content, filename, price='9800'):
+    return client.post('/api/admin/create-item', data={
+        'name': 'Upload Runner', 'category': 'Running', 'price': price,
+        'image': (io.BytesIO(content + os.urandom(16)), filename),
+    })
+
+
+@pytest.mark.parametrize('content, filename', [
+    (b'#!/bin/sh\necho not an image\n', 'shoe.png'),  # 画像ではない
+    (JPEG, 'shoe.png'),                             # 拡張子と内容が違う
+])
+def test_uploads_are_rejected_by_their_first_bytes(client, content, filename):
+    client, destination = client
+    before = set(os.listdir(destination))
+
+    response = _create(client, content, filename)
+
+    assert response.status_code == 415
+    # 一時ファイルも含めて何も残らない
+    assert set(os.listdir(destination)) == before
+
+
+def test_invalid_fields_are_rejected_before_the_image_is_stored(client):
+    client, destination = client
+    before = set(os.listdir(destination))
+
+    response = _create(client, PNG, 'shoe.png', price='-1')
+
+    assert response.status_code == 400
+    assert set(os.listdir(destination)) == before
+
+
+def test_matching_image_is_stored(client):
+    client, destination = client
+
+    response = _create(client, PNG, 'shoe.png')
+
+    assert response.status_code == 201
+    filename = response.get_json()['image_url'].rsplit('/', 1)[1]
+    assert filename.endswith('.png')
+    assert os.path.exists(os.path.join(destination, filename))